@@ -321,21 +321,54 @@ class AdapterParser(object):
 		else:
 			yield self._parse(spec, cmdline_type, name=None)
 
-	def parse_multi(self, back, anywhere, front):
+	def parse_multi(self, back, anywhere, front, deduplicate=True):
 		"""
 		Parse all three types of commandline options that can be used to
 		specify adapters. back, anywhere and front are lists of strings,
 		corresponding to the respective commandline types (-a, -b, -g).
 
+		If deduplicate is True, adapters that would find exactly the same
+		matches are collapsed into one (see deduplicate_adapters()).
+
 		Return a list of appropriate Adapter classes.
 		"""
 		adapters = []
 		for specs, cmdline_type in (back, 'back'), (anywhere, 'anywhere'), (front, 'front'):
 			for spec in specs:
 				adapters.extend(self.parse(spec, cmdline_type))
+		if deduplicate:
+			adapters = deduplicate_adapters(adapters)
 		return adapters
 
 
+def deduplicate_adapters(adapters):
+	"""
+	Collapse adapters that have the same sequence and matching parameters
+	into the first of them, whose ``aliases`` attribute then lists the
+	names of the others.
+
+	Since AdapterCutter only replaces the best match by a strictly better
+	one, such a duplicate can never be reported as the best match, so
+	removing it does not change the trimming result.
+	"""
+	result = []
+	seen = dict()
+	for adapter in adapters:
+		if not isinstance(adapter, Adapter):
+			result.append(adapter)
+			continue
+		key = (type(adapter), adapter.sequence, adapter.where, adapter.remove,
+			adapter.max_error_rate, adapter.min_overlap, adapter.read_wildcards,
+			adapter.adapter_wildcards, adapter.indels)
+		if key in seen:
+			seen[key].aliases.append(adapter.name)
+			seen[key].aliases.extend(adapter.aliases)
+		else:
+			seen[key] = adapter
+			result.append(adapter)
+	return result
+
+
 def returns_defaultdict_int():
 	# We need this function to make EndStatistics picklable.
 	# Even a @staticmethod of EndStatistics is not sufficient
@@ -410,6 +443,7 @@ class AdapterStatistics(object):
 
 	def __init__(self, adapter, adapter2=None, where=None):
 		self.name = adapter.name
+		self.aliases = list(adapter.aliases)
 		self.where = where if where is not None else adapter.where
 		self.front = EndStatistics(adapter)
 		if adapter2 is None:
@@ -429,10 +463,13 @@ class Match(object):
 	"""
 	Representation of a single adapter matched to a single read.
 
-	TODO creating instances of this class is relatively slow and responsible for quite some runtime.
+	Creating instances of this class is relatively slow. AdapterCutter
+	therefore compares the plain alignment tuples returned by
+	Adapter.locate() and creates a Match only for the best one. The trimmed
+	read is computed only when trimmed() is first called.
 	"""
 	__slots__ = ['astart', 'astop', 'rstart', 'rstop', 'matches', 'errors', 'remove_before',
-		'adapter', 'read', 'length', '_trimmed_read', 'adjacent_base']
+		'adapter', 'read', 'length', '_trimmed_read']
 
 	def __init__(self, astart, astop, rstart, rstop, matches, errors, remove_before, adapter, read):
 		"""
@@ -446,10 +483,7 @@ class Match(object):
 		self.errors = errors
 		self.adapter = adapter
 		self.read = read
-		if remove_before:
-			self._trim_front()
-		else:
-			self._trim_back()
+		self._trimmed_read = None
 		self.remove_before = remove_before
 		# Number of aligned characters in the adapter. If there are
 		# indels, this may be different from the number of characters
@@ -514,19 +548,29 @@ class Match(object):
 		return info
 
 	def trimmed(self):
+		if self._trimmed_read is None:
+			if self.remove_before:
+				self._trim_front()
+			else:
+				self._trim_back()
 		return self._trimmed_read
 
+	@property
+	def adjacent_base(self):
+		"""The base preceding a removed 3' adapter or '' if it is not ACGT"""
+		if self.remove_before:
+			return ''
+		adjacent_base = self.read.sequence[self.rstart-1:self.rstart]
+		if adjacent_base not in 'ACGT':
+			adjacent_base = ''
+		return adjacent_base
+
 	def _trim_front(self):
 		"""Compute the trimmed read, assuming it’s a 'front' adapter"""
 		self._trimmed_read = self.read[self.rstop:]
-		self.adjacent_base = ''
 
 	def _trim_back(self):
 		"""Compute the trimmed read, assuming it’s a 'back' adapter"""
-		adjacent_base = self.read.sequence[self.rstart-1:self.rstart]
-		if adjacent_base not in 'ACGT':
-			adjacent_base = ''
-		self.adjacent_base = adjacent_base
 		self._trimmed_read = self.read[:self.rstart]
 
 	def update_statistics(self, statistics):
@@ -534,7 +578,7 @@ class Match(object):
 		if self.remove_before:
 			statistics.front.errors[self.rstop][self.errors] += 1
 		else:
-			statistics.back.errors[len(self.read) - len(self._trimmed_read)][self.errors] += 1
+			statistics.back.errors[len(self.read) - len(self.trimmed())][self.errors] += 1
 			statistics.back.adjacent_bases[self.adjacent_base] += 1
 
 
@@ -568,7 +612,152 @@ class ColorspaceMatch(Match):
 		if self.remove_before:
 			statistics.front.errors[self.rstop][self.errors] += 1
 		else:
-			statistics.back.errors[len(self.read) - len(self._trimmed_read)][self.errors] += 1
+			statistics.back.errors[len(self.read) - len(self.trimmed())][self.errors] += 1
+
+
+class SeedFilter(object):
+	"""
+	Exact prefilter that tells whether an adapter can have an acceptable
+	match in a read at all, so that the dynamic programming alignment can be
+	skipped for most reads or restricted to small windows of the read.
+
+	A match that covers the entire adapter has at most k errors, where k is
+	the maximum error rate times the adapter length. By the pigeonhole
+	principle, at least one of k+1 disjoint pieces ("seeds") of the adapter
+	then occurs without errors in the read. A match that covers only part of
+	the adapter must overlap an end of the read; for these, the same
+	argument is applied to the adapter prefixes and suffixes of each
+	possible overlap length within a short region at the read ends.
+	"""
+	min_seed_length = 8
+
+	def __init__(self, sequence, max_error_rate, min_overlap, wildcards):
+		"""
+		wildcards -- whether non-ACGT characters in sequence match any base
+		"""
+		self.length = len(sequence)
+		self.max_errors = int(max_error_rate * self.length)
+		self.seeds = self._make_seeds(sequence, self.max_errors, wildcards)
+		self.end_checks = self._make_end_checks(sequence, max_error_rate, min_overlap, wildcards)
+
+	@classmethod
+	def create(cls, sequence, max_error_rate, min_overlap, wildcards):
+		"""Return a SeedFilter or None if the adapter is too short for seeds"""
+		seed_filter = cls(sequence, max_error_rate, min_overlap, wildcards)
+		return seed_filter if seed_filter.seeds else None
+
+	@classmethod
+	def _make_seeds(cls, sequence, max_errors, wildcards):
+		"""
+		Split the longest wildcard-free part of sequence into max_errors + 1
+		pieces. Return a list of (piece, offset) tuples or an empty list if
+		the pieces would be shorter than min_seed_length.
+		"""
+		if wildcards:
+			runs = [m.span() for m in re.finditer('[ACGT]+', sequence)]
+		else:
+			runs = [(0, len(sequence))]
+		if not runs:
+			return []
+		start, stop = max(runs, key=lambda run: run[1] - run[0])
+		seed_length = (stop - start) // (max_errors + 1)
+		if seed_length < cls.min_seed_length:
+			return []
+		offsets = range(start, start + (max_errors + 1) * seed_length, seed_length)
+		return [(sequence[i:i+seed_length], i) for i in offsets]
+
+	@staticmethod
+	def _make_end_checks(sequence, max_error_rate, min_overlap, wildcards):
+		"""
+		Return a list of (regex, at_end, region_length) tuples. A read can only
+		have a partial adapter match if one of the regexes is found within
+		the first (at_end is False) or last (at_end is True) region_length
+		bases of the read.
+		"""
+		def to_regex(s):
+			if wildcards:
+				return ''.join(c if c in 'ACGT' else '.' for c in s)
+			return re.escape(s)
+
+		m = len(sequence)
+		checks = []
+		overlap = max(min_overlap, 1)
+		while overlap < m:
+			# Find the range of overlap lengths that allow the same number of errors
+			errors = int(max_error_rate * overlap)
+			max_overlap = overlap
+			while max_overlap + 1 < m and int(max_error_rate * (max_overlap + 1)) == errors:
+				max_overlap += 1
+			if errors == 0:
+				# Without errors, the read must begin with an adapter suffix
+				# or end with an adapter prefix
+				lengths = range(overlap, max_overlap + 1)
+				checks.append((re.compile(r'(?:{})\Z'.format(
+					'|'.join(to_regex(sequence[:i]) for i in lengths))), True, max_overlap))
+				checks.append((re.compile(r'\A(?:{})'.format(
+					'|'.join(to_regex(sequence[m-i:]) for i in lengths))), False, max_overlap))
+			else:
+				piece_length = overlap // (errors + 1)
+				for part, at_end in ((sequence[:overlap], True), (sequence[m-overlap:], False)):
+					pieces = [part[i:i+piece_length] for i in range(0, (errors + 1) * piece_length, piece_length)]
+					checks.append((re.compile('|'.join(to_regex(piece) for piece in pieces)),
+						at_end, max_overlap + errors))
+			overlap = max_overlap + 1
+		return checks
+
+	def windows(self, read_seq, seed_hits=None):
+		"""
+		Return None if the full read needs to be aligned. Otherwise, return
+		a list of (start, stop) intervals of read_seq that contain all
+		possible matches of the complete adapter. The list is empty if there
+		cannot be any match.
+
+		seed_hits -- optional dict that maps seeds to their positions in
+			read_seq. It is filled as seeds are searched so that adapters
+			sharing seeds scan the read for each of them only once.
+		"""
+		n = len(read_seq)
+		k = self.max_errors
+		if n <= self.length + k:
+			# The adapter may overhang both ends of the read
+			return None
+		for regex, at_end, region_length in self.end_checks:
+			if at_end:
+				if regex.search(read_seq, n - region_length):
+					return None
+			elif regex.search(read_seq, 0, region_length):
+				return None
+		intervals = []
+		for seed, offset in self.seeds:
+			positions = None if seed_hits is None else seed_hits.get(seed)
+			if positions is None:
+				positions = find_all(read_seq, seed)
+				if seed_hits is not None:
+					seed_hits[seed] = positions
+			for pos in positions:
+				start = pos - offset
+				intervals.append((max(0, start - k), min(n, start + self.length + k)))
+		if not intervals:
+			return []
+		intervals.sort()
+		windows = [intervals[0]]
+		for start, stop in intervals[1:]:
+			if start <= windows[-1][1]:
+				if stop > windows[-1][1]:
+					windows[-1] = (windows[-1][0], stop)
+			else:
+				windows.append((start, stop))
+		return windows
+
+
+def find_all(s, sub):
+	"""Return a list of all (possibly overlapping) positions of sub in s"""
+	positions = []
+	pos = s.find(sub)
+	while pos != -1:
+		positions.append(pos)
+		pos = s.find(sub, pos + 1)
+	return positions
 
 
 def _generate_adapter_name(_start=[1]):
@@ -616,6 +805,8 @@ class Adapter(object):
 			read_wildcards=False, adapter_wildcards=True, name=None, indels=True):
 		self._debug = False
 		self.name = _generate_adapter_name() if name is None else name
+		# Names of identical adapters that were merged into this one
+		self.aliases = []
 		self.sequence = parse_braces(sequence.upper().replace('U', 'T'))  # TODO move away
 		if not self.sequence:
 			raise ValueError('Sequence is empty')
@@ -645,6 +836,18 @@ class Adapter(object):
 			# When indels are disallowed, an entirely different algorithm
 			# should be used.
 			self.aligner.indel_cost = 100000
+		self._seed_filter = None
+		if where in (BACK, FRONT, ANYWHERE) and not read_wildcards:
+			self._seed_filter = SeedFilter.create(self.sequence, self.max_error_rate,
+				self.min_overlap, self.adapter_wildcards)
+		if self._seed_filter is not None:
+			# Aligns the complete adapter within a window of the read
+			self._window_aligner = align.Aligner(self.sequence, self.max_error_rate,
+				flags=align.START_WITHIN_SEQ2 | align.STOP_WITHIN_SEQ2,
+				wildcard_ref=self.adapter_wildcards, wildcard_query=self.read_wildcards)
+			self._window_aligner.min_overlap = self.min_overlap
+			if not self.indels:
+				self._window_aligner.indel_cost = 100000
 
 	def __repr__(self):
 		return '<Adapter(name={name!r}, sequence={sequence!r}, where={where}, '\
@@ -660,6 +863,23 @@ class Adapter(object):
 		"""
 		self._debug = True
 		self.aligner.enable_debug()
+		# Always run the full alignment so that the matrix can be printed
+		self._seed_filter = None
+
+	def _locate_in_windows(self, read_seq, windows):
+		"""
+		Align the adapter to the given windows of read_seq and return the
+		best alignment in the same form as Aligner.locate(), or None.
+		"""
+		best = None
+		for start, stop in windows:
+			alignment = self._window_aligner.locate(read_seq[start:stop])
+			if alignment is None:
+				continue
+			astart, astop, rstart, rstop, matches, errors = alignment
+			if best is None or matches > best[4] or (matches == best[4] and errors < best[5]):
+				best = (astart, astop, rstart + start, rstop + start, matches, errors)
+		return best
 
 	def match_to(self, read, match_class=Match):
 		"""
@@ -669,7 +889,21 @@ class Adapter(object):
 		return None if no match was found given the matching criteria (minimum
 		overlap length, maximum error rate).
 		"""
-		read_seq = read.sequence.upper()  # temporary copy
+		match_args = self.locate(read.sequence.upper())  # temporary copy
+		if match_args is None:
+			return None
+		return self.create_match(match_args, read, match_class)
+
+	def locate(self, read_seq, seed_hits=None):
+		"""
+		Find this adapter in the uppercase read sequence read_seq without
+		creating a Match.
+
+		Return a tuple (astart, astop, rstart, rstop, matches, errors) or None.
+
+		seed_hits -- dict of seed positions shared between adapters (see
+			SeedFilter.windows)
+		"""
 		pos = -1
 
 		# try to find an exact match first unless wildcards are allowed
@@ -700,7 +934,13 @@ class Adapter(object):
 				else:
 					match_args = None
 			else:
-				alignment = self.aligner.locate(read_seq)
+				windows = None
+				if self._seed_filter is not None:
+					windows = self._seed_filter.windows(read_seq, seed_hits)
+				if windows is None:
+					alignment = self.aligner.locate(read_seq)
+				else:
+					alignment = self._locate_in_windows(read_seq, windows)
 				if self._debug:
 					print(self.aligner.dpmatrix)  # pragma: no cover
 				if alignment is None:
@@ -709,8 +949,10 @@ class Adapter(object):
 					astart, astop, rstart, rstop, matches, errors = alignment
 					match_args = (astart, astop, rstart, rstop, matches, errors)
 
-		if match_args is None:
-			return None
+		return match_args
+
+	def create_match(self, match_args, read, match_class=Match):
+		"""Return a Match for a tuple returned by locate()"""
 		if self.remove == 'auto':
 			# guess: if alignment starts at pos 0, it’s a 5' adapter
 			remove_before = match_args[2] == 0  # index 2 is rstart
@@ -876,6 +1118,7 @@ class LinkedAdapter(object):
 		# The following attributes are needed for the report
 		self.where = LINKED
 		self.name = _generate_adapter_name() if name is None else name
+		self.aliases = []
 		self.front_adapter = Adapter(front_sequence, where=where1, name=None, **front_parameters)
 		self.back_adapter = Adapter(back_sequence, where=where2, name=None, **back_parameters)
 
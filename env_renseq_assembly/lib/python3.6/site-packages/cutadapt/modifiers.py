@@ -10,6 +10,7 @@ import re
 from collections import OrderedDict
 from cutadapt.qualtrim import quality_trim_index, nextseq_trim_index
 from cutadapt.compat import maketrans
+from cutadapt.adapters import Adapter
 
 
 class AdapterCutter(object):
@@ -31,6 +32,18 @@ class AdapterCutter(object):
 		self.action = action
 		self.with_adapters = 0
 		self.adapter_statistics = OrderedDict((a, a.create_statistics()) for a in adapters)
+		# Number of adapters that were merged into identical ones. Each search
+		# saves that many alignments.
+		self.n_aliases = sum(len(a.aliases) for a in adapters)
+		self.searches = 0
+		# The number of matches is at most the adapter length. Trying the
+		# longest adapters first allows to stop as soon as no remaining
+		# adapter can beat the best match. Other adapter types give no such
+		# bound and are searched in the given order.
+		if all(type(a) is Adapter for a in adapters):
+			self._search_order = sorted(enumerate(adapters), key=lambda ia: (-len(ia[1]), ia[0]))
+		else:
+			self._search_order = None
 
 	def _best_match(self, read):
 		"""
@@ -38,19 +51,43 @@ class AdapterCutter(object):
 
 		Return either a Match instance or None if there are no matches.
 		"""
-		# TODO
-		# try to sort adapters by length, longest first, break when current best
-		# match is longer than length of next adapter to try
-		best_match = None
-		for adapter in self.adapters:
-			match = adapter.match_to(read)
-			if match is None:
+		if self._search_order is None:
+			best_match = None
+			for adapter in self.adapters:
+				match = adapter.match_to(read)
+				if match is None:
+					continue
+
+				# the no. of matches determines which adapter fits best
+				if best_match is None or match.matches > best_match.matches:
+					best_match = match
+			return best_match
+
+		# All adapters share the uppercase read and the positions of their
+		# seeds in it, so the read is scanned only once for each distinct seed.
+		# Only the alignment tuples are compared; a Match is created just for
+		# the best one.
+		read_seq = read.sequence.upper()
+		seed_hits = dict()
+		best_args = None
+		best_adapter = None
+		best_index = None
+		for index, adapter in self._search_order:
+			if best_args is not None and best_args[4] > len(adapter):
+				break
+			match_args = adapter.locate(read_seq, seed_hits)
+			if match_args is None:
 				continue
-
-			# the no. of matches determines which adapter fits best
-			if best_match is None or match.matches > best_match.matches:
-				best_match = match
-		return best_match
+			# Same result as trying the adapters in the given order: the
+			# first adapter with the most matches (index 4) wins
+			if (best_args is None or match_args[4] > best_args[4] or
+					(match_args[4] == best_args[4] and index < best_index)):
+				best_args = match_args
+				best_adapter = adapter
+				best_index = index
+		if best_args is None:
+			return None
+		return best_adapter.create_match(best_args, read)
 
 	def __call__(self, read, matches):
 		"""
@@ -70,6 +107,7 @@ class AdapterCutter(object):
 		"""
 		trimmed_read = read
 		for t in range(self.times):
+			self.searches += 1
 			match = self._best_match(trimmed_read)
 			if match is None:
 				# if nothing found, attempt no further rounds
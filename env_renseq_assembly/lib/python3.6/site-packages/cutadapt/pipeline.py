@@ -4,6 +4,7 @@ import io
 import os
 import sys
 import copy
+import mmap
 import logging
 import functools
 from multiprocessing import Process, Pipe, Queue
@@ -33,6 +34,9 @@ class OutputFiles(object):
 	Files may also be None.
 	"""
 	# TODO interleaving for the other file pairs (too_short, too_long, untrimmed)?
+	file_attributes = ('out', 'out2', 'untrimmed', 'untrimmed2', 'too_short', 'too_short2',
+		'too_long', 'too_long2', 'info', 'rest', 'wildcard')
+
 	def __init__(
 			self,
 			out=None,
@@ -64,17 +68,8 @@ class OutputFiles(object):
 		self.interleaved = interleaved
 
 	def __iter__(self):
-		yield self.out
-		yield self.out2
-		yield self.untrimmed
-		yield self.untrimmed2
-		yield self.too_short
-		yield self.too_short2
-		yield self.too_long
-		yield self.too_long2
-		yield self.info
-		yield self.rest
-		yield self.wildcard
+		for attribute in self.file_attributes:
+			yield getattr(self, attribute)
 
 
 class Pipeline(object):
@@ -373,19 +368,108 @@ class PairedEndPipeline(Pipeline):
 		self._maximum_length = value
 
 
-def reader_process(file, file2, connections, queue, buffer_size, stdin_fd):
+class ChunkRing(object):
+	"""
+	A fixed number of slots in an anonymous shared memory map that is created
+	in the main process before the reader and the workers are forked.
+
+	Each slot has room for one input chunk and one processed output chunk per
+	file (two files for paired-end data), each at most slot_size bytes. Only
+	slot numbers and lengths are sent through the pipes, not the data itself.
+
+	The reader takes a slot before it copies a chunk into it. The main process
+	gives the slot back after the output of that chunk has been written.
+	"""
+	def __init__(self, n_slots, slot_size, n_files=1):
+		self.slot_size = slot_size
+		self._n_files = n_files
+		self._mmap = mmap.mmap(-1, n_slots * 2 * n_files * slot_size)
+		self._free = Queue()
+		for slot in range(n_slots):
+			self._free.put(slot)
+
+	def acquire(self):
+		"""Return the number of a free slot. Block until there is one."""
+		return self._free.get()
+
+	def release(self, slot):
+		self._free.put(slot)
+
+	def _view(self, slot, area, file_index, length):
+		offset = ((slot * 2 + area) * self._n_files + file_index) * self.slot_size
+		return memoryview(self._mmap)[offset:offset + length]
+
+	def _store(self, slot, area, file_index, data):
+		length = len(data)
+		if length > self.slot_size:
+			return -1
+		self._view(slot, area, file_index, length)[:] = data
+		return length
+
+	def store_input(self, slot, file_index, data):
+		"""Copy an input chunk into the slot and return its length"""
+		length = self._store(slot, 0, file_index, data)
+		assert length != -1
+		return length
+
+	def store_output(self, slot, file_index, data):
+		"""
+		Copy processed data into the slot and return its length or -1 if it
+		does not fit (modifiers can make reads longer) or if there is no room
+		for file_index in the slot.
+		"""
+		if file_index >= self._n_files:
+			return -1
+		return self._store(slot, 1, file_index, data)
+
+	def input(self, slot, file_index, length):
+		return self._view(slot, 0, file_index, length)
+
+	def output(self, slot, file_index, length):
+		return self._view(slot, 1, file_index, length)
+
+
+class MemoryviewReader(io.RawIOBase):
+	"""
+	Read-only raw binary stream over a memoryview. Unlike io.BytesIO, this does
+	not copy the data when it is created.
+	"""
+	def __init__(self, view, name):
+		super(MemoryviewReader, self).__init__()
+		self._view = view
+		self._pos = 0
+		# file format detection uses the file name
+		self.name = name
+
+	def readable(self):
+		return True
+
+	def readinto(self, b):
+		n = min(len(b), len(self._view) - self._pos)
+		b[0:n] = self._view[self._pos:self._pos + n]
+		self._pos += n
+		return n
+
+	def close(self):
+		self._view = None
+		super(MemoryviewReader, self).close()
+
+
+def reader_process(file, file2, connections, queue, ring, stdin_fd):
 	"""
 	Read chunks of FASTA or FASTQ data from *file* and send to a worker.
 
 	queue -- a Queue of worker indices. A worker writes its own index into this
 		queue to notify the reader that it is ready to receive more data.
 	connections -- a list of Connection objects, one for each worker.
+	ring -- the ChunkRing into which chunks are copied
 
 	The function repeatedly
 
 	- reads a chunk from the file
+	- copies it into a free slot of the ring
 	- reads a worker index from the Queue
-	- sends the chunk to connections[index]
+	- sends the chunk index, slot number and chunk length(s) to connections[index]
 
 	and finally sends "poison pills" (the value -1) to all connections.
 	"""
@@ -396,20 +480,23 @@ def reader_process(file, file2, connections, queue, buffer_size, stdin_fd):
 		with xopen(file, 'rb') as f:
 			if file2:
 				with xopen(file2, 'rb') as f2:
-					for chunk_index, (chunk1, chunk2) in enumerate(read_paired_chunks(f, f2, buffer_size)):
+					for chunk_index, (chunk1, chunk2) in enumerate(read_paired_chunks(f, f2, ring.slot_size)):
+						slot = ring.acquire()
+						lengths = (ring.store_input(slot, 0, chunk1), ring.store_input(slot, 1, chunk2))
 						# Determine the worker that should get this chunk
 						worker_index = queue.get()
 						pipe = connections[worker_index]
 						pipe.send(chunk_index)
-						pipe.send_bytes(chunk1)
-						pipe.send_bytes(chunk2)
+						pipe.send((slot, lengths))
 			else:
-				for chunk_index, chunk in enumerate(read_chunks_from_file(f, buffer_size)):
+				for chunk_index, chunk in enumerate(read_chunks_from_file(f, ring.slot_size)):
+					slot = ring.acquire()
+					lengths = (ring.store_input(slot, 0, chunk), )
 					# Determine the worker that should get this chunk
 					worker_index = queue.get()
 					pipe = connections[worker_index]
 					pipe.send(chunk_index)
-					pipe.send_bytes(chunk)
+					pipe.send((slot, lengths))
 
 		# Send poison pills to all workers
 		for _ in range(len(connections)):
@@ -424,14 +511,19 @@ def reader_process(file, file2, connections, queue, buffer_size, stdin_fd):
 
 class WorkerProcess(Process):
 	"""
-	The worker repeatedly reads chunks of data from the read_pipe, runs the pipeline on it
-	and sends the processed chunks to the write_pipe.
+	The worker repeatedly reads the location of a chunk of data in the shared ChunkRing
+	from the read_pipe, runs the pipeline on it, stores the processed chunks in the
+	same slot of the ring and sends their lengths to the write_pipe.
+
+	There is one processed chunk for each output file that is not None, in the order
+	given by OutputFiles.file_attributes. Those that do not fit into the ring
+	(in particular, all but the first one or two) are sent through the write_pipe.
 
 	To notify the reader process that it wants data, it puts its own identifier into the
 	need_work_queue before attempting to read data from the read_pipe.
 	"""
 	def __init__(self, id_, pipeline, input_path1, input_path2,
-			interleaved_input, orig_outfiles, read_pipe, write_pipe, need_work_queue):
+			interleaved_input, orig_outfiles, read_pipe, write_pipe, need_work_queue, ring):
 		super(WorkerProcess, self).__init__()
 		self._id = id_
 		self._pipeline = pipeline
@@ -442,6 +534,11 @@ class WorkerProcess(Process):
 		self._read_pipe = read_pipe
 		self._write_pipe = write_pipe
 		self._need_work_queue = need_work_queue
+		self._ring = ring
+
+	def _open_input(self, slot, file_index, length, path):
+		raw = MemoryviewReader(self._ring.input(slot, file_index, length), path)
+		return io.TextIOWrapper(io.BufferedReader(raw), encoding='ascii')
 
 	def run(self):
 		try:
@@ -459,44 +556,53 @@ class WorkerProcess(Process):
 					logger.error('%s', tb_str)
 					raise e
 
-				# Setting the .buffer.name attributess below is necessary because
-				# file format detection uses the file name
-				data = self._read_pipe.recv_bytes()
-				input = io.TextIOWrapper(io.BytesIO(data), encoding='ascii')
-				input.buffer.name = self._input_path1
-
+				# The input is parsed directly from the shared memory
+				slot, lengths = self._read_pipe.recv()
+				input = self._open_input(slot, 0, lengths[0], self._input_path1)
 				if self._input_path2:
-					data = self._read_pipe.recv_bytes()
-					input2 = io.TextIOWrapper(io.BytesIO(data), encoding='ascii')
-					input2.buffer.name = self._input_path2
+					input2 = self._open_input(slot, 1, lengths[1], self._input_path2)
 				else:
 					input2 = None
-				output = io.TextIOWrapper(io.BytesIO(), encoding='ascii')
-				output.buffer.name = self._orig_outfiles.out.name
 
-				if self._orig_outfiles.out2 is not None:
-					output2 = io.TextIOWrapper(io.BytesIO(), encoding='ascii')
-					output2.buffer.name = self._orig_outfiles.out2.name
-				else:
-					output2 = None
+				outfiles = OutputFiles(interleaved=self._orig_outfiles.interleaved)
+				outputs = []
+				for attribute in OutputFiles.file_attributes:
+					orig_file = getattr(self._orig_outfiles, attribute)
+					if orig_file is None:
+						continue
+					output = io.TextIOWrapper(io.BytesIO(), encoding='ascii')
+					# Setting the .buffer.name attribute is necessary because
+					# file format detection uses the file name
+					output.buffer.name = orig_file.name
+					setattr(outfiles, attribute, output)
+					outputs.append(output)
 
-				outfiles = OutputFiles(out=output, out2=output2, interleaved=self._orig_outfiles.interleaved)
 				self._pipeline.set_input(input, input2, interleaved=self._interleaved_input)
 				self._pipeline.set_output(outfiles)
 				(n, bp1, bp2) = self._pipeline.process_reads()
 				cur_stats = Statistics()
 				cur_stats.collect(n, bp1, bp2, [], [], self._pipeline._filters)
 				stats += cur_stats
-
-				output.flush()
-				processed_chunk = output.buffer.getvalue()
+				input.close()
+				if input2 is not None:
+					input2.close()
+
+				# Processed chunks that do not fit into the slot are sent
+				# through the pipe instead
+				processed_chunks = []
+				lengths = []
+				for file_index, out in enumerate(outputs):
+					out.flush()
+					with out.buffer.getbuffer() as processed_chunk:
+						length = self._ring.store_output(slot, file_index, processed_chunk)
+					if length == -1:
+						processed_chunks.append(out.buffer.getvalue())
+					lengths.append(length)
 
 				self._write_pipe.send(chunk_index)
-				self._write_pipe.send_bytes(processed_chunk)
-				if self._orig_outfiles.out2 is not None:
-					output2.flush()
-					processed_chunk2 = output2.buffer.getvalue()
-					self._write_pipe.send_bytes(processed_chunk2)
+				self._write_pipe.send((slot, lengths))
+				for processed_chunk in processed_chunks:
+					self._write_pipe.send_bytes(processed_chunk)
 
 			m = self._pipeline._modifiers
 			m2 = getattr(self._pipeline, '_modifiers2', [])
@@ -520,17 +626,31 @@ class OrderedChunkWriter(object):
 		self._chunks = dict()
 		self._current_index = 0
 		self._outfile = outfile
+		# Write bytes to the underlying binary file if there is one
+		# (not the case for PipedGzipWriter) to avoid decoding them.
+		self._buffer = getattr(outfile, 'buffer', None)
+		if self._buffer is not None:
+			outfile.flush()
 
 	def write(self, data, chunk_index):
 		"""
+		data is a bytes-like object, which is kept until all previous chunks
+		have been written.
 		"""
 		self._chunks[chunk_index] = data
 		while self._current_index in self._chunks:
-			# TODO 1) do not decode 2) use .buffer.write
-			self._outfile.write(self._chunks[self._current_index].decode('utf-8'))
-			del self._chunks[self._current_index]
+			data = self._chunks.pop(self._current_index)
+			if self._buffer is not None:
+				self._buffer.write(data)
+			else:
+				self._outfile.write(str(data, 'ascii'))
 			self._current_index += 1
 
+	@property
+	def n_written(self):
+		"""Number of chunks written so far"""
+		return self._current_index
+
 	def wrote_everything(self):
 		return not self._chunks
 
@@ -545,12 +665,15 @@ class ParallelPipelineRunner(object):
 	  order, and statistics are aggregated.
 
 	If a worker needs work, it puts its own index into a Queue() (_need_work_queue).
-	The reader process listens on this queue and sends the raw data to the
-	worker that has requested work. For sending the data from reader to worker,
-	a Connection() is used. There is one such connection for each worker (self._pipes).
+	The reader process listens on this queue and copies the raw data into a free
+	slot of a shared memory ChunkRing (_ring). The slot number is then sent to the
+	worker that has requested work. For this, a Connection() is used. There is one
+	such connection for each worker (self._pipes).
 
-	For sending the processed data from the worker to the main process, there
-	is a second set of connections, again one for each worker.
+	The worker stores the processed data in the same slot and sends its lengths to
+	the main process through a second set of connections, again one for each worker.
+	The main process writes the data directly from the slot and then gives the slot
+	back to the ring.
 
 	When the reader is finished, it sends 'poison pills' to all workers.
 	When a worker receives this, it sends a poison pill to the main process,
@@ -569,6 +692,7 @@ class ParallelPipelineRunner(object):
 		self._n_workers = n_workers
 		self._need_work_queue = Queue()
 		self._buffer_size = buffer_size
+		self._ring = None
 
 	def set_input(self, file1, file2=None, qualfile=None, colorspace=False, fileformat=None,
 			interleaved=False):
@@ -578,6 +702,10 @@ class ParallelPipelineRunner(object):
 		self._input_path1 = file1 if type(file1) is str else file1.name
 		self._input_path2 = file2 if type(file2) is str or file2 is None else file2.name
 		self._interleaved_input = interleaved
+		# Two slots per worker so that workers do not wait for the reader or for
+		# the main process while it is writing the preceding chunks.
+		self._ring = ChunkRing(2 * self._n_workers, self._buffer_size,
+			n_files=1 if file2 is None else 2)
 		connections = [Pipe(duplex=False) for _ in range(self._n_workers)]
 		self._pipes, connw = zip(*connections)
 		try:
@@ -587,25 +715,13 @@ class ParallelPipelineRunner(object):
 			# that does not have a file descriptor.
 			fileno = -1
 		self._reader_process = Process(target=reader_process, args=(file1, file2, connw,
-			self._need_work_queue, self._buffer_size, fileno))
+			self._need_work_queue, self._ring, fileno))
 		self._reader_process.daemon = True
 		self._reader_process.start()
 
 	@staticmethod
 	def can_output_to(outfiles):
-		return (
-			outfiles.out is not None
-			and outfiles.rest is None
-			and outfiles.info is None
-			and outfiles.wildcard is None
-			and outfiles.too_short is None
-			and outfiles.too_short2 is None
-			and outfiles.too_long is None
-			and outfiles.too_long2 is None
-			and outfiles.untrimmed is None
-			and outfiles.untrimmed2 is None
-			and not outfiles.demultiplex
-		)
+		return outfiles.out is not None and not outfiles.demultiplex
 
 	def set_output(self, outfiles):
 		if not self.can_output_to(outfiles):
@@ -622,7 +738,7 @@ class ParallelPipelineRunner(object):
 				index, self._pipeline,
 				self._input_path1, self._input_path2,
 				self._interleaved_input, self._outfiles,
-				self._pipes[index], conn_w, self._need_work_queue)
+				self._pipes[index], conn_w, self._need_work_queue, self._ring)
 			worker.daemon = True
 			worker.start()
 			workers.append(worker)
@@ -630,11 +746,11 @@ class ParallelPipelineRunner(object):
 
 	def run(self):
 		workers, connections = self._start_workers()
-		writers = []
-		for outfile in [self._outfiles.out, self._outfiles.out2]:
-			if outfile is None:
-				continue
-			writers.append(OrderedChunkWriter(outfile))
+		# One writer for each output file, in the order used by the workers
+		writers = [OrderedChunkWriter(outfile) for outfile in self._outfiles if outfile is not None]
+		# slots of the chunks that have not been written yet
+		slots = dict()
+		n_released = 0
 		stats = None
 		while connections:
 			ready_connections = multiprocessing.connection.wait(connections)
@@ -665,9 +781,18 @@ class ParallelPipelineRunner(object):
 					# here, but traceback objects are not picklable.
 					raise e
 
-				for writer in writers:
-					data = connection.recv_bytes()
+				slot, lengths = connection.recv()
+				slots[chunk_index] = slot
+				for file_index, (writer, length) in enumerate(zip(writers, lengths)):
+					if length == -1:
+						data = connection.recv_bytes()
+					else:
+						data = self._ring.output(slot, file_index, length)
 					writer.write(data, chunk_index)
+				# All writers have written the same chunks
+				while n_released < writers[0].n_written:
+					self._ring.release(slots.pop(n_released))
+					n_released += 1
 		for writer in writers:
 			assert writer.wrote_everything()
 		for w in workers:
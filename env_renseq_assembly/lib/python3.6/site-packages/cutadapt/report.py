@@ -37,6 +37,9 @@ class Statistics(object):
 		self.with_adapters = [0, 0]
 		self.quality_trimmed_bp = [0, 0]
 		self.adapter_stats = [[], []]
+		# Adapters merged into identical ones and the alignments this avoided
+		self.adapter_aliases = [0, 0]
+		self.alignments_avoided = [0, 0]
 
 	def __iadd__(self, other):
 		self.n += other.n
@@ -65,6 +68,8 @@ class Statistics(object):
 			self.written_bp[i] += other.written_bp[i]
 			self.with_adapters[i] += other.with_adapters[i]
 			self.quality_trimmed_bp[i] += other.quality_trimmed_bp[i]
+			self.adapter_aliases[i] = max(self.adapter_aliases[i], other.adapter_aliases[i])
+			self.alignments_avoided[i] += other.alignments_avoided[i]
 			if self.adapter_stats[i] and other.adapter_stats[i]:
 				if len(self.adapter_stats[i]) != len(other.adapter_stats[i]):
 					raise ValueError('Incompatible Statistics objects (adapter_stats length)')
@@ -114,6 +119,8 @@ class Statistics(object):
 				elif isinstance(modifier, AdapterCutter):
 					self.with_adapters[i] += modifier.with_adapters
 					self.adapter_stats[i] = list(modifier.adapter_statistics.values())
+					self.adapter_aliases[i] = modifier.n_aliases
+					self.alignments_avoided[i] += modifier.searches * modifier.n_aliases
 
 	@property
 	def total(self):
@@ -340,8 +347,12 @@ def print_report(stats, time, gc_content):
 	if stats.paired:
 		report += "  Read 1: {o.written_bp[0]:13,d} bp\n"
 		report += "  Read 2: {o.written_bp[1]:13,d} bp\n"
+	if any(stats.adapter_aliases):
+		report += "\nIdentical adapters merged:  {merged:13,d}\n"
+		report += "Alignments avoided:         {avoided:13,d}\n"
 	pairs_or_reads = "Pairs" if stats.paired else "Reads"
-	report = report.format(o=stats, pairs_or_reads=pairs_or_reads)
+	report = report.format(o=stats, pairs_or_reads=pairs_or_reads,
+		merged=sum(stats.adapter_aliases), avoided=sum(stats.alignments_avoided))
 	print(report)
 
 	warning = False
@@ -362,6 +373,8 @@ def print_report(stats, time, gc_content):
 
 			print("=" * 3, extra + "Adapter", adapter_statistics.name, "=" * 3)
 			print()
+			if adapter_statistics.aliases:
+				print("Also reported as: {0}".format(', '.join(adapter_statistics.aliases)))
 
 			if where == LINKED:
 				print("Sequence: {0}...{1}; Type: linked; Length: {2}+{3}; "
@@ -59,8 +59,11 @@ def snakemake(snakefile,
               cluster=None,
               cluster_config=None,
               cluster_sync=None,
+              cluster_status=None,
+              cluster_status_interval=30,
               drmaa=None,
               drmaa_log_dir=None,
+              lsf=None,
               jobname="snakejob.{rulename}.{jobid}.sh",
               immediate_submit=False,
               standalone=False,
@@ -104,6 +107,11 @@ def snakemake(snakefile,
               force_use_threads=False,
               use_conda=False,
               conda_prefix=None,
+              persistence_backend="files",
+              persistence_db=None,
+              rerun_checksums=False,
+              benchmark_extended=False,
+              benchmark_timeseries=False,
               mode=Mode.default,
               wrapper_prefix=None,
               default_remote_provider=None,
@@ -141,8 +149,11 @@ def snakemake(snakefile,
         cluster (str):              submission command of a cluster or batch system to use, e.g. qsub (default None)
         cluster_config (str,list):  configuration file for cluster options, or list thereof (default None)
         cluster_sync (str):         blocking cluster submission command (like SGE 'qsub -sync y')  (default None)
+        cluster_status (str):       command that prints the status of submitted cluster jobs given their external ids, e.g. 'bjobs -noheader -o "jobid stat"' (default None)
+        cluster_status_interval (float): maximal number of seconds between two checks of the status of cluster jobs (default 30)
         drmaa (str):                if not None use DRMAA for cluster support, str specifies native args passed to the cluster when submitting a job
         drmaa_log_dir (str):        the path to stdout and stderr output of DRMAA jobs (default None)
+        lsf (str):                  if not None submit jobs to LSF with bsub, str specifies additional bsub options (default None)
         jobname (str):              naming scheme for cluster job scripts (default "snakejob.{rulename}.{jobid}.sh")
         immediate_submit (bool):    immediately submit all cluster jobs, regardless of dependencies (default False)
         standalone (bool):          kill all processes very rudely in case of failure (do not use this if you use this API) (default False) (deprecated)
@@ -184,6 +195,11 @@ def snakemake(snakefile,
         force_use_threads:          whether to force use of threads over processes. helpful if shared memory is full or unavailable (default False)
         use_conda (bool):           create conda environments for each job (defined with conda directive of rules)
         conda_prefix (str):         the directories in which conda environments will be created (default None)
+        persistence_backend (str):  how to store the metadata of output files below .snakemake, "files" or "sqlite" (default "files")
+        persistence_db (str):       path of the database of the sqlite persistence backend, should be on a local file system (default .snakemake/metadata.sqlite)
+        rerun_checksums (bool):     rerun jobs because of newer input files only if the content of these files changed (default False)
+        benchmark_extended (bool):  also measure the USS and PSS of jobs marked for benchmarking, which is expensive (default False)
+        benchmark_timeseries (bool): also write every measurement of jobs marked for benchmarking to a time series next to the benchmark file (default False)
         mode (snakemake.common.Mode): Execution mode
         wrapper_prefix (str):       Prefix for wrapper script URLs (default None)
         default_remote_provider (str): Default remote provider to use instead of local files (S3, GS)
@@ -238,7 +254,7 @@ def snakemake(snakefile,
     if updated_files is None:
         updated_files = list()
 
-    if cluster or cluster_sync or drmaa:
+    if cluster or cluster_sync or drmaa or lsf is not None:
         cores = sys.maxsize
     else:
         nodes = sys.maxsize
@@ -259,7 +275,7 @@ def snakemake(snakefile,
         cluster_config = dict()
 
     # force thread use for any kind of cluster
-    use_threads = force_use_threads or (os.name != "posix") or cluster or cluster_sync or drmaa
+    use_threads = force_use_threads or (os.name != "posix") or cluster or cluster_sync or drmaa or lsf is not None
     if not keep_logger:
         stdout = (
             (dryrun and not (printdag or printd3dag or printrulegraph)) or
@@ -290,9 +306,9 @@ def snakemake(snakefile,
     snakefile = os.path.abspath(snakefile)
 
     cluster_mode = (cluster is not None) + (cluster_sync is not
-                                            None) + (drmaa is not None)
+                                            None) + (drmaa is not None) + (lsf is not None)
     if cluster_mode > 1:
-        logger.error("Error: cluster and drmaa args are mutually exclusive")
+        logger.error("Error: cluster, drmaa and lsf args are mutually exclusive")
         return False
     if debug and (cores > 1 or cluster_mode):
         logger.error(
@@ -306,6 +322,9 @@ def snakemake(snakefile,
     if config:
         overwrite_config.update(config)
 
+    if persistence_db:
+        persistence_db = os.path.abspath(persistence_db)
+
     if workdir:
         olddir = os.getcwd()
         if not os.path.exists(workdir):
@@ -340,6 +359,11 @@ def snakemake(snakefile,
                         debug=debug,
                         use_conda=use_conda,
                         conda_prefix=conda_prefix,
+                        persistence_backend=persistence_backend,
+                        persistence_db=persistence_db,
+                        rerun_checksums=rerun_checksums,
+                        benchmark_extended=benchmark_extended,
+                        benchmark_timeseries=benchmark_timeseries,
                         mode=mode,
                         wrapper_prefix=wrapper_prefix,
                         printshellcmds=printshellcmds,
@@ -378,8 +402,11 @@ def snakemake(snakefile,
                                        keepgoing=keepgoing,
                                        cluster=cluster,
                                        cluster_sync=cluster_sync,
+                                       cluster_status=cluster_status,
+                                       cluster_status_interval=cluster_status_interval,
                                        drmaa=drmaa,
                                        drmaa_log_dir=drmaa_log_dir,
+                                       lsf=lsf,
                                        jobname=jobname,
                                        immediate_submit=immediate_submit,
                                        standalone=standalone,
@@ -408,6 +435,10 @@ def snakemake(snakefile,
                                        force_use_threads=use_threads,
                                        use_conda=use_conda,
                                        conda_prefix=conda_prefix,
+                                       persistence_backend=persistence_backend,
+                                       rerun_checksums=rerun_checksums,
+                                       benchmark_extended=benchmark_extended,
+                                       benchmark_timeseries=benchmark_timeseries,
                                        default_remote_provider=default_remote_provider,
                                        default_remote_prefix=default_remote_prefix)
 
@@ -432,9 +463,12 @@ def snakemake(snakefile,
                     printdag=printdag,
                     cluster=cluster,
                     cluster_sync=cluster_sync,
+                    cluster_status=cluster_status,
+                    cluster_status_interval=cluster_status_interval,
                     jobname=jobname,
                     drmaa=drmaa,
                     drmaa_log_dir=drmaa_log_dir,
+                    lsf=lsf,
                     max_jobs_per_second=max_jobs_per_second,
                     printd3dag=printd3dag,
                     immediate_submit=immediate_submit,
@@ -771,6 +805,29 @@ def get_argument_parser():
         ("cluster submission command will block, returning the remote exit"
          "status upon remote termination (for example, this should be used"
          "if the cluster command is 'qsub -sync y' (SGE)")),
+    parser.add_argument(
+        "--cluster-status",
+        metavar="CMD",
+        help=
+        "Status command for jobs submitted with --cluster. Instead of "
+        "looking for a marker file of every job, the command is called once "
+        "per check with the external ids of all running jobs as arguments "
+        "(the first line printed by the submission command is the id of a "
+        "job). It has to print a line '<id> <status>' per job, with the "
+        "status being running, success or failed. The LSF states DONE, EXIT "
+        "and ZOMBI are understood as well, such that "
+        "--cluster-status 'bjobs -noheader -o \"jobid stat\"' can be "
+        "used. Jobs that are not listed are looked up by their marker files.")
+    parser.add_argument(
+        "--cluster-status-interval",
+        default=30,
+        type=float,
+        metavar="SECONDS",
+        help=
+        "Maximal number of seconds between two checks of the status of "
+        "jobs submitted with --cluster or --lsf (default 30). Jobs are checked every "
+        "second after a job was submitted or has finished and less often "
+        "while nothing changes.")
     cluster_group.add_argument(
         "--drmaa",
         nargs="?",
@@ -785,6 +842,22 @@ def get_argument_parser():
         "threads and dependencies, e.g.: "
         "--drmaa ' -pe threaded {threads}'. Note that ARGS must be given in quotes and "
         "with a leading whitespace.")
+    cluster_group.add_argument(
+        "--lsf",
+        nargs="?",
+        const="",
+        metavar="ARGS",
+        help="Submit jobs to LSF with bsub and check them with bjobs. "
+        "The threads of a job are requested with -n (on one host), its "
+        "resources mem_mb (MB) and runtime (minutes) with -M/rusage[mem] "
+        "and -W. ARGS are added to every bsub command and can use the job "
+        "properties like --cluster, e.g.: --lsf ' -q {cluster.queue}'. "
+        "Note that ARGS must be given in quotes and with a leading "
+        "whitespace. Jobs of a rule that are ready at the same time are "
+        "submitted as an array job. With --immediate-submit, jobs wait for "
+        "their input with -w \"done(...)\". Together with --dryrun, the "
+        "bsub commands are printed. The output of the jobs is written to "
+        ".snakemake/lsf_logs.")
 
     parser.add_argument(
         "--drmaa-log-dir",
@@ -858,6 +931,39 @@ def get_argument_parser():
         help="Cleanup the metadata "
         "of given files. That means that snakemake removes any tracked "
         "version info, and any marks that files are incomplete.")
+    parser.add_argument(
+        "--persistence-backend",
+        choices=["files", "sqlite", "none"],
+        default="files",
+        help="How to store the metadata of output files (rule, version, code, "
+        "input, log, params, shell command and incomplete marks). 'files' "
+        "writes one small file per output file and kind of metadata below "
+        ".snakemake. 'sqlite' keeps all of it in a single database (see "
+        "--persistence-db), which needs far fewer file system operations. "
+        "Only this snakemake process writes to the database, jobs submitted "
+        "to a cluster do not. Existing metadata is imported into the database "
+        "when it is created. 'none' keeps no metadata, snakemake uses it for "
+        "the jobs it spawns. (default: %(default)s)")
+    parser.add_argument(
+        "--persistence-db",
+        metavar="FILE",
+        help="Path of the database of the sqlite persistence backend. SQLite "
+        "locking is not reliable on network file systems, hence the database "
+        "should be on a local file system of the host running snakemake. "
+        "Use one database per working directory. "
+        "(default: .snakemake/metadata.sqlite)")
+    parser.add_argument(
+        "--rerun-checksums",
+        action="store_true",
+        help="Decide by content whether input files that are newer than the "
+        "output of a job trigger a rerun. When a job finishes, checksums of "
+        "its input files are stored with the metadata of its output files. "
+        "An input file that is newer than the output only triggers a rerun "
+        "if its checksum differs, e.g. not if it was just copied again or "
+        "touched. Checksums are cached along with size and modification "
+        "time of a file and only computed again if these change. Large "
+        "files are hashed in parallel chunks. Jobs finished without this "
+        "option are decided by modification time.")
     parser.add_argument(
         "--rerun-incomplete", "--ri",
         action="store_true",
@@ -913,6 +1019,22 @@ def get_argument_parser():
         default=1,
         metavar="N",
         help="Repeat a job N times if marked for benchmarking (default 1).")
+    parser.add_argument(
+        "--benchmark-extended",
+        action="store_true",
+        help="Also measure the unique and proportional set size (max_uss, "
+        "max_pss) of jobs marked for benchmarking. This reads the memory "
+        "maps of all processes of a job on every measurement, which is "
+        "considerably more expensive than the other measurements.")
+    parser.add_argument(
+        "--benchmark-timeseries",
+        action="store_true",
+        help="Also write every measurement of a job marked for benchmarking "
+        "to a time series next to its benchmark file (e.g. "
+        "benchmarks/canu/A.timeseries.tsv for benchmarks/canu/A.tsv), with "
+        "the RSS, CPU seconds and I/O of the job so far and the name and RSS "
+        "of its largest process. Rows are appended while the job is "
+        "running. Only available on Linux.")
     parser.add_argument(
         "--notemp", "--nt",
         action="store_true",
@@ -1055,7 +1177,8 @@ def main(argv=None):
         parser.print_help()
         sys.exit(1)
 
-    if (args.cluster or args.cluster_sync or args.drmaa):
+    if (args.cluster or args.cluster_sync or args.drmaa or
+            args.lsf is not None):
         if args.cores is None:
             if args.dryrun:
                 args.cores = 1
@@ -1083,6 +1206,18 @@ def main(argv=None):
             file=sys.stderr)
         sys.exit(1)
 
+    if args.cluster_status and not args.cluster:
+        print(
+            "Error: --cluster must be set if --cluster-status is set.",
+            file=sys.stderr)
+        sys.exit(1)
+
+    if args.cluster_status_interval < 1:
+        print(
+            "Error: --cluster-status-interval must be at least 1 second.",
+            file=sys.stderr)
+        sys.exit(1)
+
     if args.conda_prefix and not args.use_conda:
         print(
             "Error: --use-conda must be set if --conda-prefix is set.",
@@ -1154,8 +1289,11 @@ def main(argv=None):
                             cluster=args.cluster,
                             cluster_config=args.cluster_config,
                             cluster_sync=args.cluster_sync,
+                            cluster_status=args.cluster_status,
+                            cluster_status_interval=args.cluster_status_interval,
                             drmaa=args.drmaa,
                             drmaa_log_dir=args.drmaa_log_dir,
+                            lsf=args.lsf,
                             jobname=args.jobname,
                             immediate_submit=args.immediate_submit,
                             standalone=True,
@@ -1193,6 +1331,11 @@ def main(argv=None):
                             force_use_threads=args.force_use_threads,
                             use_conda=args.use_conda,
                             conda_prefix=args.conda_prefix,
+                            persistence_backend=args.persistence_backend,
+                            persistence_db=args.persistence_db,
+                            rerun_checksums=args.rerun_checksums,
+                            benchmark_extended=args.benchmark_extended,
+                            benchmark_timeseries=args.benchmark_timeseries,
                             mode=args.mode,
                             wrapper_prefix=args.wrapper_prefix,
                             default_remote_provider=args.default_remote_provider,
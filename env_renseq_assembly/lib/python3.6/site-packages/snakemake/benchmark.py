@@ -3,6 +3,7 @@ __copyright__ = "Copyright 2017, Manuel Holtgrewe"
 __email__ = "manuel.holtgrewe@bihealth.de"
 __license__ = "MIT"
 
+from collections import namedtuple
 import contextlib
 import datetime
 from itertools import chain
@@ -13,11 +14,16 @@ import threading
 
 from snakemake.exceptions import WorkflowError
 
+#: Whether the resource usage can be read from /proc (Linux)
+HAS_PROC = os.path.exists("/proc/self/stat")
+
 try:
     import psutil
 except ImportError:
-    raise WorkflowError(
-        "Python 3 package psutil needs to be installed to use the benchmarking.")
+    if not HAS_PROC:
+        raise WorkflowError(
+            "Python 3 package psutil needs to be installed to use the benchmarking.")
+    psutil = None
 
 
 #: Interval (in seconds) between measuring resource usage
@@ -27,6 +33,11 @@ BENCHMARK_INTERVAL = 30
 BENCHMARK_INTERVAL_SHORT = 0.5
 
 
+def _max(value, new):
+    """Maximum of a measured value that may not have been set yet"""
+    return new if value is None else max(value, new)
+
+
 class BenchmarkRecord:
     """Record type for benchmark times"""
 
@@ -37,7 +48,8 @@ class BenchmarkRecord:
              'mean_load'))
 
     def __init__(self, running_time=None, max_rss=None, max_vms=None, max_uss=None, max_pss=None,
-                 io_in=None, io_out=None, cpu_seconds=None):
+                 io_in=None, io_out=None, cpu_seconds=None, extended=False,
+                 timeseries=None):
         #: Running time in seconds
         self.running_time = running_time
         #: Maximal RSS in MB
@@ -58,6 +70,24 @@ class BenchmarkRecord:
         self.first_time = None
         #: Previous point when measured CPU load, for estimating total running time
         self.prev_time = None
+        #: Whether to measure USS and PSS, which is expensive
+        self.extended = extended
+        #: ``BenchmarkTimeSeries`` to append each measurement to, or ``None``
+        self.timeseries = timeseries
+
+    def update_from_rusage(self, rusage):
+        """Update with the resource usage of a terminated process (as returned
+        by ``os.wait4()``), which includes all descendants it waited for"""
+        self.cpu_seconds = max(self.cpu_seconds,
+                               rusage.ru_utime + rusage.ru_stime)
+        if HAS_PROC:
+            # on Linux, the block counts are read_bytes and write_bytes of
+            # /proc/<pid>/io in 512 byte units (ru_maxrss is not used, as it
+            # includes the memory of snakemake before the fork and exec)
+            self.io_in = _max(self.io_in,
+                              rusage.ru_inblock * 512 / (1024 * 1024))
+            self.io_out = _max(self.io_out,
+                               rusage.ru_oublock * 512 / (1024 * 1024))
 
     def to_tsv(self):
         """Return ``str`` with the TSV representation of this record"""
@@ -121,6 +151,7 @@ class ScheduledPeriodicTimer:
         self._interval = interval
         self._timer = None
         self._stopped = True
+        self._lock = threading.Lock()
 
     def start(self):
         """Start the intervalic timer"""
@@ -135,22 +166,186 @@ class ScheduledPeriodicTimer:
 
     def _action(self):
         """Internally, called by timer"""
-        self.work()
-        self._times_called += 1
-        if self._times_called > self._interval:
-            self._timer = DaemonTimer(self._interval, self._action)
-        else:
-            self._timer = DaemonTimer(BENCHMARK_INTERVAL_SHORT, self._action)
-        self._timer.start()
+        with self._lock:
+            if self._stopped:
+                return
+            self.work()
+            self._times_called += 1
+            if self._times_called > self._interval:
+                self._timer = DaemonTimer(self._interval, self._action)
+            else:
+                self._timer = DaemonTimer(BENCHMARK_INTERVAL_SHORT, self._action)
+            self._timer.start()
 
     def work(self):
         """Override to perform the action"""
         raise NotImplementedError('Override me!')
 
     def cancel(self):
-        """Call to cancel any events"""
-        self._timer.cancel()
-        self._stopped = True
+        """Call to cancel any events, waits for a running action"""
+        with self._lock:
+            self._timer.cancel()
+            self._stopped = True
+
+
+class BenchmarkTimeSeries:
+    """Rows of measurements of a benchmarked job, one per sample
+
+    Each row holds the time stamp, the repeat of the job, the RSS, CPU
+    seconds and I/O of the whole process tree so far (in MB and seconds,
+    cumulative for CPU and I/O), and the command name and RSS of the process
+    with the largest RSS at that moment. Rows are appended while the job is
+    running, so that the file is also usable after the job has been killed.
+    """
+
+    @classmethod
+    def get_header(klass):
+        return '\t'.join(
+            ('timestamp', 'repeat', 'rss', 'cpu_seconds', 'io_in', 'io_out',
+             'top_process', 'top_rss'))
+
+    @staticmethod
+    def path_for(benchmark):
+        """Path of the time series of the benchmark file at ``benchmark``"""
+        root, ext = os.path.splitext(benchmark)
+        return root + ".timeseries" + (ext or ".tsv")
+
+    def __init__(self, path, repeat=1):
+        self.path = path
+        self.repeat = repeat
+
+    def write_header(self):
+        """Create the file with just the header, replacing an old one"""
+        with open(self.path, 'wt') as f:
+            print(self.get_header(), file=f)
+
+    def append(self, sample):
+        """Append the ``ProcSample`` sample"""
+        mb = 1024 * 1024
+        top_process = sample.top_process.decode(errors="replace")
+        row = '\t'.join((
+            '{:.1f}'.format(time.time()), str(self.repeat),
+            '{:.2f}'.format(sample.rss / mb),
+            '{:.2f}'.format(sample.cpu_seconds),
+            '{:.2f}'.format(sample.io_in / mb),
+            '{:.2f}'.format(sample.io_out / mb),
+            top_process.replace('\t', ' '),
+            '{:.2f}'.format(sample.top_rss / mb)))
+        with open(self.path, 'at') as f:
+            print(row, file=f)
+
+
+def _read_proc(pid, name):
+    with open("/proc/{}/{}".format(pid, name), "rb") as f:
+        return f.read()
+
+
+#: Usage of a process tree, memory and I/O in bytes (see ``ProcSampler``)
+ProcSample = namedtuple("ProcSample", ["rss", "vms", "uss", "pss", "io_in",
+                                       "io_out", "cpu_seconds", "top_process",
+                                       "top_rss"])
+
+
+class ProcSampler:
+    """Sample the resource usage of a process and its descendants from /proc
+
+    Only the small ``stat``, ``statm`` and ``io`` files of each process are
+    read. CPU time and I/O are cumulative counters that include the usage of
+    the children a process has already waited for, so that short-lived
+    children that start and end between two samples are accounted for. USS
+    and PSS are only sampled if ``extended`` is set, as this requires reading
+    the memory maps (``smaps_rollup`` or ``smaps``) of every process.
+    """
+
+    CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if HAS_PROC else 100
+    PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if HAS_PROC else 4096
+
+    def __init__(self, pid, extended=False):
+        self.pid = pid
+        self.extended = extended
+
+    @staticmethod
+    def _stat(pid):
+        """Command name and the fields of /proc/<pid>/stat after it"""
+        data = _read_proc(pid, "stat")
+        # the command name may contain spaces and parentheses
+        end = data.rindex(b")")
+        return data[data.index(b"(") + 1:end], data[end + 2:].split()
+
+    def _descendants(self):
+        """Return the PIDs of all descendants of the observed process"""
+        children = dict()
+        for entry in os.listdir("/proc"):
+            if entry.isdigit():
+                try:
+                    ppid = int(self._stat(entry)[1][1])
+                except (OSError, ValueError, IndexError):
+                    # process has terminated in the meantime
+                    continue
+                children.setdefault(ppid, []).append(int(entry))
+        result = []
+        stack = [self.pid]
+        while stack:
+            pids = children.get(stack.pop(), [])
+            result.extend(pids)
+            stack.extend(pids)
+        return result
+
+    def _smaps(self, pid):
+        """Return (USS, PSS) of a process in bytes"""
+        try:
+            data = _read_proc(pid, "smaps_rollup")
+        except FileNotFoundError:
+            data = _read_proc(pid, "smaps")
+        uss, pss = 0, 0
+        for line in data.splitlines():
+            if line.startswith((b"Private_Clean:", b"Private_Dirty:")):
+                uss += int(line.split()[1])
+            elif line.startswith(b"Pss:"):
+                pss += int(line.split()[1])
+        return uss * 1024, pss * 1024
+
+    def sample(self):
+        """Return the current usage of the process tree as a ``ProcSample``
+        (uss and pss are None unless extended, top_process and top_rss are
+        the command name and RSS of the process with the largest RSS), or
+        None if the observed process has terminated."""
+        rss, vms, uss, pss, io_in, io_out, cpu_ticks = 0, 0, 0, 0, 0, 0, 0
+        top_process, top_rss = b"", -1
+        observed = False
+        for pid in [self.pid] + self._descendants():
+            try:
+                name, fields = self._stat(pid)
+                size, resident = _read_proc(pid, "statm").split()[:2]
+            except (OSError, ValueError):
+                continue
+            observed = observed or pid == self.pid
+            # utime, stime, cutime and cstime
+            cpu_ticks += sum(int(x) for x in fields[11:15])
+            vms += int(size) * self.PAGE_SIZE
+            resident = int(resident) * self.PAGE_SIZE
+            rss += resident
+            if resident > top_rss:
+                top_process, top_rss = name, resident
+            try:
+                for line in _read_proc(pid, "io").splitlines():
+                    if line.startswith(b"read_bytes:"):
+                        io_in += int(line.split()[1])
+                    elif line.startswith(b"write_bytes:"):
+                        io_out += int(line.split()[1])
+                if self.extended:
+                    uss_, pss_ = self._smaps(pid)
+                    uss += uss_
+                    pss += pss_
+            except OSError:
+                # no permission or terminated in the meantime
+                pass
+        if not observed:
+            return None
+        if not self.extended:
+            uss, pss = None, None
+        return ProcSample(rss, vms, uss, pss, io_in, io_out,
+                          cpu_ticks / self.CLOCK_TICKS, top_process, top_rss)
 
 
 class BenchmarkTimer(ScheduledPeriodicTimer):
@@ -162,9 +357,16 @@ class BenchmarkTimer(ScheduledPeriodicTimer):
         self.pid = pid
         #: ``BenchmarkRecord`` to write results to
         self.bench_record = bench_record
+        #: Sampler reading from /proc, if available
+        self.sampler = None
+        if HAS_PROC:
+            self.sampler = ProcSampler(pid, extended=bench_record.extended)
 
     def work(self):
         """Write statistics"""
+        if self.sampler is not None:
+            self._update_record_proc()
+            return
         try:
             self._update_record()
         except psutil.NoSuchProcess:
@@ -172,6 +374,25 @@ class BenchmarkTimer(ScheduledPeriodicTimer):
         except AttributeError:
             pass  # skip, process died in flight
 
+    def _update_record_proc(self):
+        """Perform the measurement with the /proc sampler"""
+        sample = self.sampler.sample()
+        if sample is None:
+            return
+        mb = 1024 * 1024
+        record = self.bench_record
+        record.max_rss = _max(record.max_rss, sample.rss / mb)
+        record.max_vms = _max(record.max_vms, sample.vms / mb)
+        if sample.uss is not None:
+            record.max_uss = _max(record.max_uss, sample.uss / mb)
+            record.max_pss = _max(record.max_pss, sample.pss / mb)
+        # cumulative counters, keep the largest total seen
+        record.io_in = _max(record.io_in, sample.io_in / mb)
+        record.io_out = _max(record.io_out, sample.io_out / mb)
+        record.cpu_seconds = max(record.cpu_seconds, sample.cpu_seconds)
+        if record.timeseries is not None:
+            record.timeseries.append(sample)
+
     def _update_record(self):
         """Perform the actual measurement"""
         # Memory measurements
@@ -185,11 +406,14 @@ class BenchmarkTimer(ScheduledPeriodicTimer):
             main = psutil.Process(self.pid)
             this_time = time.time()
             for proc in chain((main,), main.children(recursive=True)):
-                meminfo = proc.memory_full_info()
+                if self.bench_record.extended:
+                    meminfo = proc.memory_full_info()
+                    uss += meminfo.uss
+                    pss += meminfo.pss
+                else:
+                    meminfo = proc.memory_info()
                 rss += meminfo.rss
                 vms += meminfo.vms
-                uss += meminfo.uss
-                pss += meminfo.pss
                 ioinfo = proc.io_counters()
                 io_in += ioinfo.read_bytes
                 io_out += ioinfo.write_bytes
@@ -210,8 +434,9 @@ class BenchmarkTimer(ScheduledPeriodicTimer):
         # Update benchmark record's RSS and VMS
         self.bench_record.max_rss = max(self.bench_record.max_rss or 0, rss)
         self.bench_record.max_vms = max(self.bench_record.max_vms or 0, vms)
-        self.bench_record.max_uss = max(self.bench_record.max_uss or 0, uss)
-        self.bench_record.max_pss = max(self.bench_record.max_pss or 0, pss)
+        if self.bench_record.extended:
+            self.bench_record.max_uss = max(self.bench_record.max_uss or 0, uss)
+            self.bench_record.max_pss = max(self.bench_record.max_pss or 0, pss)
         self.bench_record.io_in = io_in
         self.bench_record.io_out = io_out
         self.bench_record.cpu_seconds += cpu_seconds
@@ -246,6 +471,23 @@ def benchmarked(pid=None, benchmark_record=None, interval=BENCHMARK_INTERVAL):
         result.running_time = time.time() - start_time
 
 
+def wait_for_process(proc):
+    """Wait for the ``subprocess.Popen`` ``proc`` to terminate
+
+    Returns the exit code (as ``proc.wait()``) and the resource usage of the
+    process including all descendants it waited for, or ``None`` if
+    ``os.wait4()`` is not available.
+    """
+    if not hasattr(os, "wait4") or proc.returncode is not None:
+        return proc.wait(), None
+    _, status, rusage = os.wait4(proc.pid, 0)
+    if os.WIFSIGNALED(status):
+        proc.returncode = -os.WTERMSIG(status)
+    else:
+        proc.returncode = os.WEXITSTATUS(status)
+    return proc.returncode, rusage
+
+
 def print_benchmark_records(records, file_):
     """Write benchmark records to file-like object"""
     print(BenchmarkRecord.get_header(), file=file_)
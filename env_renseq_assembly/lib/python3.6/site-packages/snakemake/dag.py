@@ -8,7 +8,7 @@ import shutil
 import textwrap
 import time
 import tarfile
-from collections import defaultdict, Counter
+from collections import defaultdict, Counter, deque
 from itertools import chain, combinations, filterfalse, product, groupby
 from functools import partial, lru_cache
 from inspect import isfunction, ismethod
@@ -17,7 +17,8 @@ from pathlib import Path
 import subprocess
 
 from snakemake.io import IOFile, _IOFile, PeriodicityDetector, wait_for_files, is_flagged, contains_wildcard
-from snakemake.jobs import Job, Reason
+from snakemake.io import stat_cache
+from snakemake.jobs import Job, GroupJob, Reason
 from snakemake.exceptions import RuleException, MissingInputException
 from snakemake.exceptions import MissingRuleException, AmbiguousRuleException
 from snakemake.exceptions import CyclicGraphException, MissingOutputException
@@ -57,7 +58,8 @@ class DAG:
                  force_incomplete=False,
                  ignore_incomplete=False,
                  notemp=False,
-                 keep_remote_local=False):
+                 keep_remote_local=False,
+                 group_jobs=False):
 
         self.dryrun = dryrun
         self.dependencies = defaultdict(partial(defaultdict, set))
@@ -70,6 +72,8 @@ class DAG:
         self._finished = set()
         self._dynamic = set()
         self._len = 0
+        # number of calls to finish(), dynamic updates may delete finished jobs
+        self._finished_count = 0
         self.workflow = workflow
         self.rules = set(rules)
         self.ignore_ambiguity = ignore_ambiguity
@@ -80,6 +84,10 @@ class DAG:
         self.targetjobs = set()
         self.prioritytargetjobs = set()
         self._ready_jobs = set()
+        self._ready_listeners = list()
+        self._pipe_groups = dict()
+        self._job_groups = dict()
+        self.group_jobs = group_jobs
         self.notemp = notemp
         self.keep_remote_local = keep_remote_local
         self._jobid = dict()
@@ -119,6 +127,8 @@ class DAG:
 
     def init(self):
         """ Initialise the DAG. """
+        # collect the metadata of each file only once while building the DAG
+        stat_cache.enable()
         for job in map(self.rule2job, self.targetrules):
             job = self.update([job])
             self.targetjobs.add(job)
@@ -237,6 +247,45 @@ class DAG:
         """Return whether a given job is ready to execute."""
         return job in self._ready_jobs
 
+    def add_ready_listener(self, listener):
+        """Register a function that is called with a job and a boolean
+        whenever the job becomes ready (True) or is no longer ready (False),
+        e.g. because it has been finished or removed from the DAG."""
+        self._ready_listeners.append(listener)
+
+    def _set_ready(self, job):
+        if job not in self._ready_jobs:
+            self._ready_jobs.add(job)
+            for listener in self._ready_listeners:
+                listener(job, True)
+
+    def _unset_ready(self, job):
+        if job in self._ready_jobs:
+            self._ready_jobs.remove(job)
+            for listener in self._ready_listeners:
+                listener(job, False)
+
+    def pipe_group(self, job):
+        """Return the jobs that are connected to the given job by pipe()
+        output files (including the job, producers before consumers), or
+        None if there are none."""
+        return self._pipe_groups.get(job)
+
+    @property
+    def pipe_groups(self):
+        """All groups of jobs connected by pipe() output files."""
+        return set(self._pipe_groups.values())
+
+    def job_group(self, job):
+        """Return the GroupJob that the given job is submitted with, or None
+        if it is submitted on its own."""
+        return self._job_groups.get(job)
+
+    @property
+    def job_groups(self):
+        """All groups of jobs that are submitted together."""
+        return set(self._job_groups.values())
+
     def needrun(self, job):
         """Return whether a given job needs to be executed."""
         return job in self._needrun
@@ -308,14 +357,19 @@ class DAG:
         return False
 
     def check_and_touch_output(self, job, wait=3, ignore_missing_output=False):
-        """ Raise exception if output files of job are missing. """
+        """ Raise exception if output files of job are missing.
+        Return the number of seconds spent waiting for them. """
         expanded_output = [job.shadowed_path(path) for path in job.expanded_output]
         if job.benchmark:
             expanded_output.append(job.benchmark)
+        # the job has written these files
+        self.invalidate_stat_cache(job)
+        stat_cache.invalidate(*expanded_output)
 
+        waited = 0
         if ignore_missing_output is False:
             try:
-                wait_for_files(expanded_output, latency_wait=wait)
+                waited = wait_for_files(expanded_output, latency_wait=wait)
             except IOError as e:
                 raise MissingOutputException(str(e) + "\nThis might be due to "
                 "filesystem latency. If that is the case, consider to increase the "
@@ -332,6 +386,7 @@ class DAG:
             #This will neither create missing files nor touch directories
             if os.path.isfile(f):
                 f.touch()
+        return waited
 
     def unshadow_output(self, job):
         """ Move files from shadow directory to real output paths. """
@@ -354,6 +409,19 @@ class DAG:
                 shadow_output, real_output))
             shutil.move(shadow_output, real_output)
         shutil.rmtree(job.shadow_dir)
+        self.invalidate_stat_cache(job)
+
+    def invalidate_stat_cache(self, job):
+        """ Forget cached metadata of files that the given job may have written
+        or downloaded. """
+        stat_cache.invalidate(*chain(job.expanded_output, job.log))
+        # remote input is downloaded by the job (e.g. on a cluster node)
+        stat_cache.invalidate(*job.remote_input)
+        if job.benchmark:
+            stat_cache.invalidate(job.benchmark)
+        # the names of dynamic output files are not known in advance
+        stat_cache.invalidate(*(os.path.dirname(f) or "."
+                                for f in job.dynamic_output))
 
     def check_periodic_wildcards(self, job):
         """ Raise an exception if a wildcard of the given job appears to be periodic,
@@ -463,7 +531,9 @@ class DAG:
             job.rmdir_empty_remote_dirs()
 
     def jobid(self, job):
-        """Return job id of given job."""
+        """Return job id of given job (of its first job for a group)."""
+        if job.is_group():
+            job = job[0]
         return self._jobid[job]
 
     def update(self, jobs, file=None, visited=None, skip_until_dynamic=False):
@@ -566,14 +636,43 @@ class DAG:
         if skip_until_dynamic:
             self._dynamic.add(job)
 
-    def update_needrun(self):
-        """ Update the information whether a job needs to be executed. """
+    def update_needrun(self, *jobs):
+        """ Update the information whether a job needs to be executed.
+
+        If jobs are given, only these jobs and the jobs downstream of them are
+        evaluated again, e.g. after they have been added to the DAG.
+        """
+
+        # (distance, output mintime) of the nearest job downstream of a job
+        # (including itself) that has existing output, None if there is none
+        downstream_mintime = dict()
 
         def output_mintime(job):
-            for job_ in self.bfs(self.depending, job):
-                t = job_.output_mintime
-                if t:
-                    return t
+            # iterative post-order traversal, each job is only visited once
+            stack = [(job, iter(depending[job]))]
+            while stack:
+                job_, children = stack[-1]
+                for child in children:
+                    if child not in downstream_mintime:
+                        stack.append((child, iter(depending[child])))
+                        break
+                else:
+                    stack.pop()
+                    if job_ in downstream_mintime:
+                        continue
+                    t = job_.output_mintime
+                    if t:
+                        nearest = (0, t)
+                    else:
+                        nearest = None
+                        for child in depending[job_]:
+                            m = downstream_mintime[child]
+                            if m is not None and (nearest is None or
+                                                  m[0] + 1 < nearest[0]):
+                                nearest = (m[0] + 1, m[1])
+                    downstream_mintime[job_] = nearest
+            nearest = downstream_mintime[job]
+            return nearest[1] if nearest is not None else None
 
         def needrun(job):
             reason = self.reason(job)
@@ -612,6 +711,10 @@ class DAG:
                         for f in job.input
                         if f.exists and f.is_newer(output_mintime_)
                     ]
+                    if updated_input and self.workflow.persistence.checksums:
+                        # newer, but maybe just copied or touched
+                        updated_input = self.workflow.persistence.checksums_changed(
+                            job, updated_input)
                     reason.updated_input.update(updated_input)
             if noinitreason and reason:
                 reason.derived = False
@@ -622,13 +725,17 @@ class DAG:
         dependencies = self.dependencies
         depending = self.depending
 
-        _needrun.clear()
-        candidates = set(self.jobs)
+        if jobs:
+            candidates = set(self.bfs(depending, *jobs))
+            _needrun.difference_update(candidates)
+        else:
+            _needrun.clear()
+            candidates = set(self.jobs)
 
-        queue = list(filter(reason, map(needrun, candidates)))
+        queue = deque(filter(reason, map(needrun, candidates)))
         visited = set(queue)
         while queue:
-            job = queue.pop(0)
+            job = queue.popleft()
             _needrun.add(job)
 
             for job_, files in dependencies[job].items():
@@ -697,11 +804,123 @@ class DAG:
                             stop=self.noneedrun_finished):
             self._priority[job] = Job.HIGHEST_PRIORITY
 
+    def update_pipe_groups(self):
+        """ Group the jobs that need to run and are connected by pipe() output
+        files, as they have to run at the same time. """
+        groups = dict()
+        for job in filter(self.needrun, self.jobs):
+            for f in job.pipe_output:
+                consumers = [job_ for job_, files in self.depending[job].items()
+                             if f in files]
+                if len(consumers) != 1:
+                    raise WorkflowError(
+                        "Output file {} is marked as pipe(), hence it has to "
+                        "be read by exactly one job, but {} jobs read "
+                        "it.".format(f, len(consumers)), rule=job.rule)
+                group = (groups.get(job, {job}) |
+                         groups.get(consumers[0], {consumers[0]}))
+                for job_ in group:
+                    groups[job_] = group
+
+        def depth(job, group):
+            return 1 + max((depth(job_, group)
+                            for job_ in self.dependencies[job] if job_ in group),
+                           default=0)
+
+        self._pipe_groups = dict()
+        for job, group in groups.items():
+            if job in self._pipe_groups:
+                continue
+            for job_ in group:
+                if (not (job_.is_shell or job_.is_script or job_.is_wrapper) or
+                        job_.is_shadow):
+                    raise WorkflowError(
+                        "Jobs that read or write pipe() output files have to "
+                        "use shell, script or wrapper and no shadow "
+                        "directory.", rule=job_.rule)
+            group = tuple(sorted(group, key=partial(depth, group=group)))
+            for job_ in group:
+                self._pipe_groups[job_] = group
+
+    def update_job_groups(self):
+        """ Group the jobs that need to run on the cluster, whose rules have
+        the same group and that depend on each other, in order to submit
+        them together (see GroupJob). Jobs connected by pipe() output files
+        belong to the same group. """
+        self._job_groups = dict()
+        if not self.group_jobs:
+            return
+
+        def groupable(job):
+            return (job.rule.group is not None and self.needrun(job) and
+                    not self.finished(job) and
+                    not self.workflow.is_local(job.rule) and
+                    not (job.dynamic_input or job.dynamic_output or
+                         self.dynamic(job)))
+
+        groups = dict()
+
+        def merge(*jobs):
+            group = set(chain(*(groups.get(job_, {job_}) for job_ in jobs)))
+            for job_ in group:
+                groups[job_] = group
+
+        for job in filter(groupable, self.jobs):
+            merge(job, *(job_ for job_ in self.dependencies[job]
+                         if groupable(job_) and
+                         job_.rule.group == job.rule.group))
+        for pipe_group in self.pipe_groups:
+            if not any(job in groups for job in pipe_group):
+                continue
+            if not all(groupable(job) and job.rule.group == pipe_group[0].rule.group
+                       for job in pipe_group):
+                raise WorkflowError(
+                    "Jobs connected by pipe() output files have to be in "
+                    "the same group: {}".format(", ".join(
+                        sorted(set(job.rule.name for job in pipe_group)))))
+            merge(*pipe_group)
+
+        def depth(job, group):
+            return 1 + max((depth(job_, group)
+                            for job_ in self.dependencies[job] if job_ in group),
+                           default=0)
+
+        for job, group in groups.items():
+            if job in self._job_groups or len(group) < 2:
+                continue
+            # an external job in between would have to run in the middle
+            # of the group
+            external = [job_ for job__ in group
+                        for job_ in self.dependencies[job__]
+                        if job_ not in group]
+            for job_ in self.bfs(self.dependencies, *external,
+                                 stop=self.noneedrun_finished):
+                if job_ in group:
+                    raise WorkflowError(
+                        "Jobs of group {} depend on each other through a "
+                        "job of another group or rule.".format(job.rule.group),
+                        rule=job_.rule)
+            jobs = sorted(group, key=partial(depth, group=group))
+            # the step of a job comes after those of its dependencies,
+            # unless it reads a pipe that they write
+            step = dict()
+            for job_ in jobs:
+                step[job_] = max(
+                    (step[dep] + (0 if dep.pipe_output & files else 1)
+                     for dep, files in self.dependencies[job_].items()
+                     if dep in group),
+                    default=0)
+            steps = [tuple(job_ for job_ in jobs if step[job_] == i)
+                     for i in range(max(step.values()) + 1)]
+            group = GroupJob(job.rule.group, steps, self)
+            for job_ in group:
+                self._job_groups[job_] = group
+
     def update_ready(self):
         """ Update information whether a job is ready to execute. """
         for job in filter(self.needrun, self.jobs):
             if not self.finished(job) and self._ready(job):
-                self._ready_jobs.add(job)
+                self._set_ready(job)
 
     def update_downstream_size(self):
         """For each job, update number of downstream jobs."""
@@ -723,12 +942,18 @@ class DAG:
             if not self.needrun(job):
                 job.close_remote()
 
-    def postprocess(self):
+    def postprocess(self, changed_jobs=None):
         """Postprocess the DAG. This has to be invoked after any change to the
-        DAG topology."""
+        DAG topology. If changed_jobs is given, needrun is only updated for
+        these jobs and the jobs downstream of them."""
         self.update_jobids()
-        self.update_needrun()
+        if changed_jobs:
+            self.update_needrun(*changed_jobs)
+        else:
+            self.update_needrun()
         self.update_priority()
+        self.update_pipe_groups()
+        self.update_job_groups()
         self.update_ready()
         self.update_downstream_size()
         self.update_temp_input_count()
@@ -736,24 +961,30 @@ class DAG:
 
     def _ready(self, job):
         """Return whether the given job is ready to execute."""
-        return self._finished.issuperset(filter(self.needrun,
-                                                self.dependencies[job]))
+        dependencies = filter(self.needrun, self.dependencies[job])
+        group = self._job_groups.get(job) or self._pipe_groups.get(job)
+        if group is not None:
+            # jobs writing pipes that the job reads run at the same time,
+            # the jobs of a group are submitted together
+            dependencies = filterfalse(group.__contains__, dependencies)
+        return self._finished.issuperset(dependencies)
 
     def finish(self, job, update_dynamic=True):
         """Finish a given job (e.g. remove from ready jobs, mark depending jobs
         as ready)."""
+        self.invalidate_stat_cache(job)
         self._finished.add(job)
-        try:
-            self._ready_jobs.remove(job)
-        except KeyError:
-            pass
+        self._finished_count += 1
+        self._unset_ready(job)
         # mark depending jobs as ready
         for job_ in self.depending[job]:
-            if self.needrun(job_) and self._ready(job_):
-                self._ready_jobs.add(job_)
+            if (self.needrun(job_) and not self.finished(job_) and
+                    self._ready(job_)):
+                self._set_ready(job_)
 
         if update_dynamic and job.dynamic_output:
             logger.info("Dynamically updating jobs")
+            jobs = set(self.jobs)
             newjob = self.update_dynamic(job)
             if newjob:
                 # simulate that this job ran and was finished before
@@ -761,11 +992,17 @@ class DAG:
                 self._needrun.add(newjob)
                 self._finished.add(newjob)
 
-                self.postprocess()
+                # only the new jobs and those downstream of the
+                # updated job have to be evaluated again
+                changed = set(self.jobs) - jobs
+                changed.add(newjob)
+                self.postprocess(changed_jobs=changed)
                 self.handle_protected(newjob)
                 self.handle_touch(newjob)
-                # add finished jobs to len as they are not counted after new postprocess
-                self._len += len(self._finished)
+                # the finished jobs and those that still have to run (an
+                # incremental postprocess keeps finished jobs in needrun)
+                self._len = self._finished_count + len(self._needrun -
+                                                       self._finished)
 
     def new_job(self, rule, targetfile=None, format_wildcards=None):
         """Create new job for given rule and (optional) targetfile.
@@ -849,8 +1086,7 @@ class DAG:
             self._finished.remove(job)
         if job in self._dynamic:
             self._dynamic.remove(job)
-        if job in self._ready_jobs:
-            self._ready_jobs.remove(job)
+        self._unset_ready(job)
 
     def replace_job(self, job, newjob):
         """Replace given job with new job."""
@@ -900,10 +1136,10 @@ class DAG:
 
     def bfs(self, direction, *jobs, stop=lambda job: False):
         """Perform a breadth-first traversal of the DAG."""
-        queue = list(jobs)
+        queue = deque(jobs)
         visited = set(queue)
         while queue:
-            job = queue.pop(0)
+            job = queue.popleft()
             if stop(job):
                 # stop criterion reached for this node
                 continue
@@ -916,10 +1152,10 @@ class DAG:
     def level_bfs(self, direction, *jobs, stop=lambda job: False):
         """Perform a breadth-first traversal of the DAG, but also yield the
         level together with each job."""
-        queue = [(job, 0) for job in jobs]
+        queue = deque((job, 0) for job in jobs)
         visited = set(jobs)
         while queue:
-            job, level = queue.pop(0)
+            job, level = queue.popleft()
             if stop(job):
                 # stop criterion reached for this node
                 continue
@@ -327,12 +327,16 @@ class NCBIFileException(RuleException):
 
 class ClusterJobException(RuleException):
     def __init__(self, job_info, jobid):
+        job = job_info.job
+        # the first rule of a group
+        rule = job[0].rule if job.is_group() else job.rule
         super().__init__(
-            "Error executing rule {} on cluster (jobid: {}, external: {}, jobscript: {}). "
-            "For detailed error see the cluster log.".format(job_info.job.rule.name,
-                                                             jobid, job_info.jobid, job_info.jobscript),
-            lineno=job_info.job.rule.lineno,
-            snakefile=job_info.job.rule.snakefile)
+            "Error executing {} {} on cluster (jobid: {}, external: {}, jobscript: {}). "
+            "For detailed error see the cluster log.".format("group" if job.is_group() else "rule",
+                                                             job.name, jobid, job_info.jobid,
+                                                             job_info.jobscript),
+            lineno=rule.lineno,
+            snakefile=rule.snakefile)
 
 
 class CreateRuleException(RuleException):
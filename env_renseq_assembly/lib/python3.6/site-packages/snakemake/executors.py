@@ -17,9 +17,12 @@ import threading
 import concurrent.futures
 import subprocess
 import signal
+import shlex
+import re
+import math
 from functools import partial
-from itertools import chain
-from collections import namedtuple
+from itertools import chain, count
+from collections import namedtuple, OrderedDict
 from tempfile import mkdtemp
 
 from snakemake.jobs import Job
@@ -27,7 +30,7 @@ from snakemake.shell import shell
 from snakemake.logging import logger
 from snakemake.stats import Stats
 from snakemake.utils import format, Unformattable, makedirs
-from snakemake.io import get_wildcard_names, Wildcards
+from snakemake.io import get_wildcard_names, Wildcards, _Inotify
 from snakemake.exceptions import print_exception, get_exception_origin
 from snakemake.exceptions import format_error, RuleException, log_verbose_traceback
 from snakemake.exceptions import ClusterJobException, ProtectedOutputException, WorkflowError, ImproperShadowException, SpawnedJobError
@@ -68,6 +71,17 @@ class AbstractExecutor:
         self._run(job)
         callback(job)
 
+    def run_jobs(self, jobs,
+                 callback=None,
+                 submit_callback=None,
+                 error_callback=None):
+        """Run jobs that have been selected together."""
+        for job in jobs:
+            self.run(job,
+                     callback=callback,
+                     submit_callback=submit_callback,
+                     error_callback=error_callback)
+
     def shutdown(self):
         pass
 
@@ -118,9 +132,21 @@ class AbstractExecutor:
         logger.error("Error in job {} while creating output file{} {}.".format(
             job, "s" if len(job.output) > 1 else "", ", ".join(job.output)))
 
+    def prepare_job_success(self, job):
+        """Do the part of handle_job_success that may take long and does not
+        need the lock of the scheduler. Called first, from the thread that
+        reports the job as finished."""
+        pass
+
     def handle_job_success(self, job):
         pass
 
+    def handle_temp(self, job):
+        """Remove the temp files of a finished job that are no longer
+        needed. Called again for the jobs of a group once all of them are
+        finished, since they may use the temp files of each other."""
+        pass
+
     def handle_job_error(self, job):
         pass
 
@@ -159,16 +185,20 @@ class RealExecutor(AbstractExecutor):
                 "Please ensure write permissions for the "
                 "directory {}".format(e, self.workflow.persistence.path))
 
+    def prepare_job_success(self, job):
+        self.workflow.persistence.prepare_finished(job)
+
     def handle_job_success(self, job, upload_remote=True, ignore_missing_output=False):
         self.dag.handle_touch(job)
-        self.dag.check_and_touch_output(
+        waited = self.dag.check_and_touch_output(
             job,
             wait=self.latency_wait,
             ignore_missing_output=ignore_missing_output)
+        self.stats.report_output_wait(job, waited)
         self.dag.unshadow_output(job)
         self.dag.handle_remote(job, upload=upload_remote)
         self.dag.handle_protected(job)
-        self.dag.handle_temp(job)
+        self.handle_temp(job)
         job.close_remote()
 
         self.stats.report_job_end(job)
@@ -180,6 +210,9 @@ class RealExecutor(AbstractExecutor):
                         "directory {}".format(e,
                                               self.workflow.persistence.path))
 
+    def handle_temp(self, job):
+        self.dag.handle_temp(job)
+
     def handle_job_error(self, job):
         job.close_remote()
 
@@ -199,7 +232,14 @@ class RealExecutor(AbstractExecutor):
         if self.workflow.printshellcmds:
             printshellcmds = "-p"
 
-        target = job.output if job.output else job.rule.name
+        target = job.output if job.output else job.name
+
+        cores = self.cores
+        rules = job.name
+        if job.is_group():
+            # the jobs of a group share the threads requested for it
+            cores = job.threads
+            rules = sorted(set(job_.rule.name for job_ in job))
 
         return format(pattern,
                       job=job,
@@ -207,7 +247,8 @@ class RealExecutor(AbstractExecutor):
                       overwrite_config=overwrite_config,
                       printshellcmds=printshellcmds,
                       workflow=self.workflow,
-                      cores=self.cores,
+                      cores=cores,
+                      rules=rules,
                       benchmark_repeats=self.benchmark_repeats,
                       target=target,
                       **kwargs)
@@ -269,6 +310,16 @@ class CPUExecutor(RealExecutor):
             self.exec_job += " --use-conda "
             if self.workflow.conda_prefix:
                 self.exec_job += " --conda-prefix " + self.workflow.conda_prefix + " "
+        if self.workflow.persistence_backend != "files":
+            # only this process writes to the database, it records the
+            # metadata of the spawned jobs when they finish
+            self.exec_job += " --persistence-backend none "
+        elif self.workflow.rerun_checksums:
+            self.exec_job += " --rerun-checksums "
+        if self.workflow.benchmark_extended:
+            self.exec_job += " --benchmark-extended "
+        if self.workflow.benchmark_timeseries:
+            self.exec_job += " --benchmark-timeseries "
 
         self.use_threads = use_threads
         self.cores = cores
@@ -295,7 +346,9 @@ class CPUExecutor(RealExecutor):
                 job.resources, job.log.plainstrings(), benchmark,
                 self.benchmark_repeats, conda_env,
                 self.workflow.linemaps, self.workflow.debug,
-                shadow_dir=job.shadow_dir)
+                shadow_dir=job.shadow_dir,
+                benchmark_extended=self.workflow.benchmark_extended,
+                benchmark_timeseries=self.workflow.benchmark_timeseries)
         else:
             # run directive jobs are spawned into subprocesses
             future = self.pool.submit(self.spawn_job, job)
@@ -398,13 +451,23 @@ class ClusterExecutor(RealExecutor):
             self.exec_job += " --use-conda "
             if self.workflow.conda_prefix:
                 self.exec_job += " --conda-prefix " + self.workflow.conda_prefix + " "
+        if self.workflow.persistence_backend != "files":
+            # only this process writes to the database, it records the
+            # metadata of the spawned jobs when they finish
+            self.exec_job += " --persistence-backend none "
+        elif self.workflow.rerun_checksums:
+            self.exec_job += " --rerun-checksums "
+        if self.workflow.benchmark_extended:
+            self.exec_job += " --benchmark-extended "
+        if self.workflow.benchmark_timeseries:
+            self.exec_job += " --benchmark-timeseries "
 
         # force threading.Lock() for cluster jobs
         self.exec_job += " --force-use-threads "
 
         if not any(dag.dynamic_output_jobs):
             # disable restiction to target rule in case of dynamic rules!
-            self.exec_job += " --allowed-rules {job.rule.name} "
+            self.exec_job += " --allowed-rules {rules} "
         self.jobname = jobname
         self._tmpdir = None
         self.cores = cores if cores else ""
@@ -428,11 +491,46 @@ class ClusterExecutor(RealExecutor):
         with self.lock:
             self.wait = False
         self.wait_thread.join()
-        shutil.rmtree(self.tmpdir)
+        if not self.workflow.immediate_submit:
+            # with --immediate-submit, the jobs run after snakemake has
+            # exited and still need their job scripts
+            shutil.rmtree(self.tmpdir)
 
     def cancel(self):
         self.shutdown()
 
+    def run_jobs(self, jobs,
+                 callback=None,
+                 submit_callback=None,
+                 error_callback=None):
+        """Run jobs that have been selected together, the jobs of a group
+        with a single submission (see GroupJob)."""
+        for job in self.submissions(jobs):
+            self.run(job,
+                     callback=self._for_each(callback),
+                     submit_callback=self._for_each(submit_callback),
+                     error_callback=self._for_each(error_callback))
+
+    def submissions(self, jobs):
+        """Replace the jobs of each group by their GroupJob."""
+        groups = set()
+        for job in jobs:
+            group = self.dag.job_group(job)
+            if group is None:
+                yield job
+            elif group not in groups:
+                groups.add(group)
+                yield group
+
+    @staticmethod
+    def _for_each(callback):
+        """Return a callback for a submission that calls the given callback
+        of the scheduler with the job or with each job of the group."""
+        def _callback(job):
+            for job_ in job if job.is_group() else (job, ):
+                callback(job_)
+        return _callback
+
     def _limit_rate(self):
         """Called in ``_run()`` for rate-limiting"""
         with self.rate_lock:
@@ -445,10 +543,15 @@ class ClusterExecutor(RealExecutor):
     def _run(self, job, callback=None, error_callback=None):
         if self.max_jobs_per_second:
             self._limit_rate()
-        job.remove_existing_output()
-        job.download_remote_input()
-        super()._run(job, callback=callback, error_callback=error_callback)
-        logger.shellcmd(job.shellcmd)
+        if job.is_group() and not self.quiet:
+            logger.info("Submitting jobs {} together (group {}).".format(
+                ", ".join(str(self.dag.jobid(job_)) for job_ in job),
+                job.name))
+        for job_ in job if job.is_group() else (job, ):
+            job_.remove_existing_output()
+            job_.download_remote_input()
+            super()._run(job_, callback=callback, error_callback=error_callback)
+            logger.shellcmd(job_.shellcmd)
 
     @property
     def tmpdir(self):
@@ -458,7 +561,7 @@ class ClusterExecutor(RealExecutor):
 
     def get_jobscript(self, job):
         f = job.format_wildcards(self.jobname,
-                             rulename=job.rule.name,
+                             rulename=job.name,
                              jobid=self.dag.jobid(job),
                              cluster=self.cluster_wildcards(job))
         if os.path.sep in f:
@@ -474,10 +577,11 @@ class ClusterExecutor(RealExecutor):
         wait_for_files.extend(f.local_file()
                               for f in job.remote_input if not f.stay_on_remote)
 
-        if job.shadow_dir:
-            wait_for_files.append(job.shadow_dir)
-        if self.workflow.use_conda and job.conda_env:
-            wait_for_files.append(job.conda_env)
+        for job_ in job if job.is_group() else (job, ):
+            if job_.shadow_dir:
+                wait_for_files.append(job_.shadow_dir)
+            if self.workflow.use_conda and job_.conda_env:
+                wait_for_files.append(job_.conda_env)
 
         format_p = partial(self.format_job_pattern,
                            job=job,
@@ -501,7 +605,7 @@ class ClusterExecutor(RealExecutor):
         """Return wildcards object for job from cluster_config."""
 
         cluster = self.cluster_config.get("__default__", dict()).copy()
-        cluster.update(self.cluster_config.get(job.rule.name, dict()))
+        cluster.update(self.cluster_config.get(job.name, dict()))
         # Format values with available parameters from the job.
         for key, value in list(cluster.items()):
             if isinstance(value, str):
@@ -525,8 +629,30 @@ GenericClusterJob = namedtuple("GenericClusterJob", "job jobid callback error_ca
 
 
 class GenericClusterExecutor(ClusterExecutor):
+    """
+    Submit jobs with a command like qsub or bsub that returns immediately.
+
+    A job touches a marker file when it has finished (or failed). The markers
+    of all running jobs are looked up with a single listing of their
+    directory, which is also watched with inotify (on Linux) in order to
+    notice jobs finishing on this host right away. Alternatively, a status
+    command (e.g. bjobs) is asked about all running jobs at once and only
+    the jobs it does not know about are looked up by their markers. Jobs are
+    checked every second after a job was submitted or has finished, and less
+    often (up to status_interval seconds) while nothing changes.
+    """
+
+    #: states (lower case) printed by the status command for finished jobs,
+    #: any other state means that the job is still queued or running
+    success_states = {"success", "done"}
+    failed_states = {"failed", "exit", "zombi"}
+    #: seconds between checks after a job was submitted or has finished
+    min_status_interval = 1
+
     def __init__(self, workflow, dag, cores,
                  submitcmd="qsub",
+                 statuscmd=None,
+                 status_interval=30,
                  cluster_config=None,
                  jobname="snakejob.{rulename}.{jobid}.sh",
                  printreason=False,
@@ -536,6 +662,10 @@ class GenericClusterExecutor(ClusterExecutor):
                  benchmark_repeats=1,
                  max_jobs_per_second=None,
                  restart_times=0):
+        # used by the thread started in ClusterExecutor.__init__
+        self.statuscmd = statuscmd
+        self.status_interval = max(status_interval, self.min_status_interval)
+        self.submitted = False
         super().__init__(workflow, dag, cores,
                          jobname=jobname,
                          printreason=printreason,
@@ -590,38 +720,395 @@ class GenericClusterExecutor(ClusterExecutor):
                     ex.returncode, ex.output.decode()))
             error_callback(job)
             return
-        if ext_jobid and ext_jobid[0]:
-            ext_jobid = ext_jobid[0]
+        ext_jobid = ext_jobid[0] if ext_jobid and ext_jobid[0] else None
+        if ext_jobid:
             self.external_jobid.update((f, ext_jobid) for f in job.output)
             logger.debug("Submitted job {} with external jobid {}.".format(
                 jobid, ext_jobid))
 
         submit_callback(job)
+        if self.workflow.immediate_submit:
+            # the cluster takes care of the dependencies, nothing to wait for
+            return
         with self.lock:
             self.active_jobs.append(GenericClusterJob(job, ext_jobid, callback, error_callback, jobscript, jobfinished, jobfailed))
+            self.submitted = True
 
     def _wait_for_jobs(self):
-        while True:
-            with self.lock:
-                if not self.wait:
-                    return
-                active_jobs = self.active_jobs
-                self.active_jobs = list()
-                for active_job in active_jobs:
-                    if os.path.exists(active_job.jobfinished):
-                        os.remove(active_job.jobfinished)
-                        os.remove(active_job.jobscript)
-                        active_job.callback(active_job.job)
-                    elif os.path.exists(active_job.jobfailed):
-                        os.remove(active_job.jobfailed)
-                        os.remove(active_job.jobscript)
-                        self.print_job_error(active_job.job)
-                        print_exception(ClusterJobException(active_job, self.dag.jobid(active_job.job)),
-                                        self.workflow.linemaps)
-                        active_job.error_callback(active_job.job)
-                    else:
-                        self.active_jobs.append(active_job)
-            time.sleep(1)
+        inotify = None
+        if not self.statuscmd:
+            try:
+                inotify = _Inotify()
+            except (OSError, AttributeError):
+                pass
+        interval = self.min_status_interval
+        next_check = time.time() + interval
+        try:
+            while True:
+                timeout = max(0, min(next_check - time.time(),
+                                     self.min_status_interval))
+                if inotify is not None:
+                    woken = inotify.wait(timeout)
+                else:
+                    time.sleep(timeout)
+                    woken = False
+                with self.lock:
+                    if not self.wait:
+                        return
+                    if self.submitted:
+                        self.submitted = False
+                        interval = self.min_status_interval
+                        next_check = min(next_check, time.time() + interval)
+                    if not woken and time.time() < next_check:
+                        continue
+                    active_jobs = self.active_jobs
+                    self.active_jobs = list()
+                if inotify is not None and active_jobs:
+                    inotify.watch(self.tmpdir)
+                running = self._check_jobs(active_jobs)
+                with self.lock:
+                    self.active_jobs.extend(running)
+                if len(running) < len(active_jobs):
+                    interval = self.min_status_interval
+                else:
+                    # nothing has changed, check less often
+                    interval = min(1.5 * interval, self.status_interval)
+                next_check = time.time() + interval
+        finally:
+            if inotify is not None:
+                inotify.close()
+
+    def _check_jobs(self, active_jobs):
+        """
+        Handle the finished jobs among the given ones and return the others.
+        """
+        if not active_jobs:
+            return active_jobs
+        status = self._job_status(active_jobs) if self.statuscmd else dict()
+        markers = None
+        running = list()
+        for active_job in active_jobs:
+            state = status.get(active_job.jobid)
+            if state is None:
+                if markers is None:
+                    markers = set(os.listdir(self.tmpdir))
+                if os.path.basename(active_job.jobfinished) in markers:
+                    state = "success"
+                elif os.path.basename(active_job.jobfailed) in markers:
+                    state = "failed"
+            if state == "success":
+                self._remove(active_job.jobfinished, active_job.jobscript)
+                active_job.callback(active_job.job)
+            elif state == "failed":
+                self._remove(active_job.jobfailed, active_job.jobscript)
+                self.print_job_error(active_job.job)
+                print_exception(ClusterJobException(active_job, self.dag.jobid(active_job.job)),
+                                self.workflow.linemaps)
+                active_job.error_callback(active_job.job)
+            else:
+                running.append(active_job)
+        return running
+
+    def _job_status(self, active_jobs):
+        """
+        Return a dict of the states (running, success or failed) of the given
+        jobs that are known to the status command.
+        """
+        jobids = sorted(set(active_job.jobid for active_job in active_jobs
+                            if active_job.jobid))
+        if not jobids:
+            return dict()
+        process = subprocess.run(
+            self.status_command(jobids),
+            shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        status = dict()
+        for line in process.stdout.decode().splitlines():
+            fields = self.parse_status(line)
+            if fields is None:
+                continue
+            jobid, state = fields[0], fields[1].lower()
+            if state in self.success_states:
+                status[jobid] = "success"
+            elif state in self.failed_states:
+                status[jobid] = "failed"
+            else:
+                status[jobid] = "running"
+        if process.returncode and not status:
+            # e.g. a temporary failure of the cluster, use the markers
+            logger.warning("Error checking the status of cluster jobs "
+                           "(exit code {}):\n{}".format(
+                               process.returncode, process.stderr.decode()))
+        return status
+
+    def status_command(self, jobids):
+        """Return the command that prints the states of the given jobs."""
+        return "{statuscmd} {jobids}".format(
+            statuscmd=self.statuscmd,
+            jobids=" ".join(map(shlex.quote, jobids)))
+
+    def parse_status(self, line):
+        """
+        Return the external jobid and the state of a job in a line printed
+        by the status command, or None if the line is about no job.
+        """
+        fields = line.split()
+        if len(fields) < 2:
+            return None
+        return fields[0], fields[1]
+
+    @staticmethod
+    def _remove(*paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # the status command may be faster than the shared filesystem
+                pass
+
+
+class LSFExecutor(GenericClusterExecutor):
+    """
+    Submit jobs to LSF with bsub and check their status with bjobs.
+
+    The threads of a job are requested with -n (on a single host), its
+    resources mem_mb (in MB) and runtime (in minutes) with -M and
+    rusage[mem] (per slot) and with -W. Further options, e.g. a queue, are
+    given with lsf_args, which are formatted like a --cluster command. Jobs
+    of the same rule that are started together with the same options are
+    submitted as one array job. With --immediate-submit, all jobs are
+    submitted at once and every job waits for the jobs that create its input
+    (-w "done(...)"). In dry-run mode, the bsub commands are printed instead
+    of executed, assuming that the jobs of one submission finish before the
+    next jobs are started.
+    """
+
+    #: bsub prints "Job <123> is submitted to queue <normal>."
+    submitted_regex = re.compile(r"Job <(\d+)>")
+
+    def __init__(self, workflow, dag, cores,
+                 lsf_args="",
+                 dryrun=False,
+                 status_interval=30,
+                 cluster_config=None,
+                 jobname="snakejob.{rulename}.{jobid}.sh",
+                 printreason=False,
+                 quiet=False,
+                 printshellcmds=False,
+                 latency_wait=3,
+                 benchmark_repeats=1,
+                 max_jobs_per_second=None,
+                 restart_times=0):
+        super().__init__(workflow, dag, cores,
+                         submitcmd="bsub",
+                         statuscmd="bjobs",
+                         status_interval=status_interval,
+                         cluster_config=cluster_config,
+                         jobname=jobname,
+                         printreason=printreason,
+                         quiet=quiet,
+                         printshellcmds=printshellcmds,
+                         latency_wait=latency_wait,
+                         benchmark_repeats=benchmark_repeats,
+                         max_jobs_per_second=max_jobs_per_second,
+                         restart_times=restart_times)
+        self.lsf_args = lsf_args or ""
+        self.dryrun = dryrun
+        self.log_dir = os.path.abspath(os.path.join(".snakemake", "lsf_logs"))
+        self._arrays = count(1)
+        self._dryrun_jobids = count(1)
+
+    def run(self, job,
+            callback=None,
+            submit_callback=None,
+            error_callback=None):
+        self.run_jobs([job],
+                      callback=callback,
+                      submit_callback=submit_callback,
+                      error_callback=error_callback)
+
+    def run_jobs(self, jobs,
+                 callback=None,
+                 submit_callback=None,
+                 error_callback=None):
+        callback, submit_callback, error_callback = map(
+            self._for_each, (callback, submit_callback, error_callback))
+        # jobs with the same rule (or groups with the same name), options and
+        # dependencies form an array
+        batches = OrderedDict()
+        for job in self.submissions(jobs):
+            if self.dryrun:
+                for job_ in job if job.is_group() else (job, ):
+                    AbstractExecutor._run(self, job_)
+                    logger.shellcmd(job_.shellcmd)
+                if not job.is_group() and (self.dag.dynamic(job) or
+                                           self.workflow.is_local(job.rule)):
+                    callback(job)
+                    continue
+            else:
+                super()._run(job)
+            jobid = self.dag.jobid(job)
+            jobscript = self.get_jobscript(job)
+            jobfinished = os.path.join(self.tmpdir, "{}.jobfinished".format(jobid))
+            jobfailed = os.path.join(self.tmpdir, "{}.jobfailed".format(jobid))
+            if not self.dryrun:
+                self.spawn_jobscript(job, jobscript,
+                                     jobfinished=jobfinished,
+                                     jobfailed=jobfailed)
+            try:
+                args = self.bsub_args(job)
+            except AttributeError as e:
+                raise WorkflowError(str(e), rule=job.rule)
+            key = (job.name, args, self.dependencies(job))
+            batches.setdefault(key, list()).append(
+                (job, jobscript, jobfinished, jobfailed))
+
+        for (rulename, args, dependencies), batch in batches.items():
+            jobs_ = [job for job, _, _, _ in batch]
+            if len(batch) == 1:
+                jobscript = batch[0][1]
+                name = os.path.splitext(os.path.basename(jobscript))[0]
+                log = "{}.%J.log".format(name)
+            else:
+                name = "snakejob.{}.array{}".format(rulename, next(self._arrays))
+                jobscript = os.path.join(self.tmpdir, name + ".sh")
+                log = "{}.%J.%I.log".format(name)
+                if not self.dryrun:
+                    self.spawn_array(jobscript, [b[1] for b in batch])
+                name += "[1-{}]".format(len(batch))
+            cmd = " ".join(filter(None, (
+                "bsub", args, dependencies,
+                "-J", shlex.quote(name),
+                "-o", shlex.quote(os.path.join(self.log_dir, log)),
+                shlex.quote(jobscript))))
+
+            if self.dryrun:
+                ext_jobid = "dryrun{}".format(next(self._dryrun_jobids))
+                group = jobs_[0].is_group()
+                # the elements of an array of groups are separated by ";"
+                jobids = ("; " if group else ", ").join(
+                    ", ".join(str(self.dag.jobid(job_))
+                              for job_ in (job if group else (job, )))
+                    for job in jobs_)
+                logger.info("{}\n# LSF job {} runs job{} {}{}".format(
+                    cmd, ext_jobid, "s" if len(batch) > 1 or group else "",
+                    jobids, " (group {})".format(rulename) if group else ""))
+            else:
+                ext_jobid = self.submit(cmd)
+                if ext_jobid is None:
+                    for job in jobs_:
+                        error_callback(job)
+                    continue
+
+            for i, (job, jobscript, jobfinished, jobfailed) in enumerate(batch, 1):
+                jobid = ext_jobid if len(batch) == 1 else "{}[{}]".format(ext_jobid, i)
+                self.external_jobid.update((f, jobid) for f in job.output)
+                if self.dryrun:
+                    callback(job)
+                    continue
+                logger.debug("Submitted job {} with external jobid {}.".format(
+                    self.dag.jobid(job), jobid))
+                submit_callback(job)
+                if self.workflow.immediate_submit:
+                    continue
+                with self.lock:
+                    self.active_jobs.append(GenericClusterJob(
+                        job, jobid, callback, error_callback, jobscript,
+                        jobfinished, jobfailed))
+                    self.submitted = True
+
+    def bsub_args(self, job):
+        """Return the bsub options for the threads and resources of a job."""
+        args = list()
+        requirements = list()
+        if job.threads > 1:
+            args.append("-n {}".format(job.threads))
+            requirements.append("span[hosts=1]")
+        mem_mb = job.resources.get("mem_mb")
+        if mem_mb:
+            args.append("-M {}MB".format(mem_mb))
+            requirements.append("rusage[mem={}MB]".format(
+                math.ceil(mem_mb / job.threads)))
+        if requirements:
+            args.append("-R {}".format(shlex.quote(" ".join(requirements))))
+        runtime = job.resources.get("runtime")
+        if runtime:
+            args.append("-W {}".format(runtime))
+        if self.lsf_args:
+            args.append(job.format_wildcards(
+                self.lsf_args, cluster=self.cluster_wildcards(job)).strip())
+        return " ".join(args)
+
+    def dependencies(self, job):
+        """
+        Return the -w option for the submitted jobs that create the input of
+        a job, with --immediate-submit (otherwise they have finished).
+        """
+        if not self.workflow.immediate_submit:
+            return ""
+        deps = sorted(set(self.external_jobid[f] for f in job.input
+                          if f in self.external_jobid))
+        if not deps:
+            return ""
+        return "-w {}".format(shlex.quote(" && ".join(
+            "done({})".format(dep) for dep in deps)))
+
+    def spawn_array(self, path, jobscripts):
+        """Write a script that runs the job script of the array element."""
+        with open(path, "w") as f:
+            print("#!/bin/sh", file=f)
+            print('case "$LSB_JOBINDEX" in', file=f)
+            for i, jobscript in enumerate(jobscripts, 1):
+                print("{}) exec {} ;;".format(i, shlex.quote(jobscript)),
+                      file=f)
+            print("esac", file=f)
+            print('echo "No job script for element $LSB_JOBINDEX" >&2', file=f)
+            print("exit 1", file=f)
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR)
+
+    def submit(self, cmd):
+        """Run a bsub command and return the jobid, None if it failed."""
+        makedirs(self.log_dir)
+        try:
+            out = subprocess.check_output(cmd, shell=True,
+                                          stderr=subprocess.STDOUT).decode()
+        except subprocess.CalledProcessError as ex:
+            logger.error("Error submitting jobscript (exit code {}):\n{}".format(
+                ex.returncode, ex.output.decode()))
+            return None
+        match = self.submitted_regex.search(out)
+        if match is None:
+            logger.error("Unexpected output of bsub:\n{}".format(out))
+            return None
+        return match.group(1)
+
+    def status_command(self, jobids):
+        # the elements of array jobs are listed with the array
+        jobids = sorted(set(jobid.split("[")[0] for jobid in jobids))
+        return 'bjobs -noheader -o "jobid jobindex stat" {}'.format(
+            " ".join(jobids))
+
+    def parse_status(self, line):
+        fields = line.split()
+        if len(fields) < 3 or not fields[0].isdigit():
+            return None
+        jobid, index, state = fields[:3]
+        if index != "0":
+            jobid = "{}[{}]".format(jobid, index)
+        return jobid, state
+
+    def shutdown(self):
+        super().shutdown()
+        if self.dryrun and self.workflow.immediate_submit:
+            # nothing has been submitted
+            shutil.rmtree(self.tmpdir)
+
+    def handle_job_success(self, job):
+        if not self.dryrun:
+            super().handle_job_success(job)
+
+    def handle_temp(self, job):
+        if not self.dryrun:
+            super().handle_temp(job)
 
 
 SynchronousClusterJob = namedtuple("SynchronousClusterJob", "job jobid callback error_callback jobscript process")
@@ -868,7 +1355,8 @@ def change_working_directory(directory=None):
 
 def run_wrapper(job_rule, input, output, params, wildcards, threads, resources, log,
                 benchmark, benchmark_repeats, conda_env, linemaps, debug=False,
-                shadow_dir=None):
+                shadow_dir=None, benchmark_extended=False,
+                benchmark_timeseries=False):
     """
     Wrapper around the run method that handles exceptions and benchmarking.
 
@@ -880,6 +1368,8 @@ def run_wrapper(job_rule, input, output, params, wildcards, threads, resources,
     threads    -- usable threads
     log        -- list of log files
     shadow_dir -- optional shadow directory root
+    benchmark_extended -- whether to also measure USS and PSS
+    benchmark_timeseries -- whether to write every measurement to a time series
     """
     # get shortcuts to job_rule members
     run = job_rule.run_func
@@ -890,12 +1380,24 @@ def run_wrapper(job_rule, input, output, params, wildcards, threads, resources,
         sys.stdin = open('/dev/stdin')
 
     if benchmark is not None:
-        from snakemake.benchmark import BenchmarkRecord, benchmarked, write_benchmark_records
+        from snakemake.benchmark import (BenchmarkRecord, BenchmarkTimeSeries,
+                                         benchmarked, write_benchmark_records)
+
+        def new_bench_record(repeat):
+            timeseries = None
+            if benchmark_timeseries:
+                timeseries = BenchmarkTimeSeries(
+                    BenchmarkTimeSeries.path_for(benchmark), repeat)
+            return BenchmarkRecord(extended=benchmark_extended,
+                                   timeseries=timeseries)
 
     try:
         with change_working_directory(shadow_dir):
             if benchmark:
                 bench_records = []
+                if benchmark_timeseries:
+                    BenchmarkTimeSeries(
+                        BenchmarkTimeSeries.path_for(benchmark)).write_header()
                 for i in range(benchmark_repeats):
                     # Determine whether to benchmark this process or do not
                     # benchmarking at all.  We benchmark this process unless the
@@ -906,14 +1408,15 @@ def run_wrapper(job_rule, input, output, params, wildcards, threads, resources,
                         # The benchmarking through ``benchmarked()`` is started
                         # in the execution of the shell fragment, script, wrapper
                         # etc, as the child PID is available there.
-                        bench_record = BenchmarkRecord()
+                        bench_record = new_bench_record(i + 1)
                         run(input, output, params, wildcards, threads, resources,
                             log, version, rule, conda_env, bench_record)
                     else:
                         # The benchmarking is started here as we have a run section
                         # and the generated Python function is executed in this
                         # process' thread.
-                        with benchmarked() as bench_record:
+                        with benchmarked(benchmark_record=new_bench_record(
+                                i + 1)) as bench_record:
                             run(input, output, params, wildcards, threads, resources,
                                 log, version, rule, conda_env, bench_record)
                     # Store benchmark record for this iteration
@@ -8,12 +8,16 @@ import os
 import shutil
 import re
 import stat
+import struct
+import select
 import time
 import datetime
 import json
 import copy
 import functools
+import hashlib
 import subprocess as sp
+from concurrent.futures import ThreadPoolExecutor
 from itertools import product, chain
 from collections import Iterable, namedtuple
 from snakemake.exceptions import MissingOutputException, WorkflowError, WildcardError, RemoteFileException
@@ -62,6 +66,171 @@ def lchmod(f, mode):
              follow_symlinks=os.chmod not in os.supports_follow_symlinks)
 
 
+class StatCache:
+    """
+    Cache for the existence, modification time and size checks of local files.
+
+    While enabled, the entries of a directory are read with a single
+    os.scandir() when a file in it is looked up for the first time. Files
+    that are not listed do not exist without any further system call, and
+    the stat result of a listed file is only taken once. Files that are
+    created, touched or removed have to be invalidated; this is done by
+    remove(), _IOFile.touch() and _IOFile.prepare() and, for the output of
+    jobs, by the DAG when a job has finished. Invalidated files are looked
+    up again on their own, so the directory is not read again.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        # directory -> {name: is_symlink, or None if invalidated},
+        # or None if the directory cannot be listed
+        self._listings = dict()
+        # directory -> {(name, follow_symlinks): stat result}
+        self._stats = dict()
+        # path -> (directory, name)
+        self._splits = dict()
+        # system calls needed without the cache and actually performed
+        self.requested = 0
+        self.performed = 0
+
+    def enable(self):
+        """Start with an empty cache, e.g. for building a new DAG."""
+        self._listings.clear()
+        self._stats.clear()
+        self._splits.clear()
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        self._listings.clear()
+        self._stats.clear()
+        self._splits.clear()
+
+    @property
+    def saved(self):
+        return self.requested - self.performed
+
+    def _split(self, path):
+        try:
+            return self._splits[path]
+        except KeyError:
+            pass
+        dirname, name = os.path.split(os.path.normpath(path))
+        split = self._splits[path] = (dirname or ".", name)
+        return split
+
+    def _listing(self, dirname):
+        try:
+            return self._listings[dirname]
+        except KeyError:
+            pass
+        self.performed += 1
+        try:
+            # is_symlink() does not need an extra system call on most platforms
+            listing = {entry.name: entry.is_symlink()
+                       for entry in os.scandir(dirname)}
+        except (FileNotFoundError, NotADirectoryError):
+            listing = dict()
+        except OSError:
+            listing = None
+        self._listings[dirname] = listing
+        return listing
+
+    def _os_stat(self, path, follow_symlinks):
+        self.performed += 1
+        try:
+            return os.stat(path, follow_symlinks=follow_symlinks)
+        except OSError:
+            # like os.path.exists(), e.g. for a directory that cannot be read;
+            # _stat() repeats the system call to raise the error
+            return None
+
+    def stat(self, path, follow_symlinks=True):
+        """
+        Return the result of os.stat(path, follow_symlinks=follow_symlinks)
+        or None if the file does not exist or cannot be accessed.
+        """
+        self.requested += 1
+        dirname, name = self._split(path)
+        listing = self._listing(dirname) if name not in (".", "..") else None
+        if listing is None:
+            return self._os_stat(path, follow_symlinks)
+        if name not in listing:
+            return None
+        stats = self._stats.setdefault(dirname, dict())
+        is_symlink = listing[name]
+        if is_symlink is None:
+            # invalidated, look it up again
+            result = self._os_stat(path, False)
+            if result is None:
+                del listing[name]
+                return None
+            is_symlink = listing[name] = stat.S_ISLNK(result.st_mode)
+            stats[(name, False)] = result
+        if not is_symlink:
+            # following it does not make a difference
+            follow_symlinks = False
+        key = (name, follow_symlinks)
+        if key not in stats:
+            stats[key] = self._os_stat(path, follow_symlinks)
+        return stats[key]
+
+    def lstat(self, path):
+        """Like stat(), but with the symlink behaviour of lstat()."""
+        return self.stat(path,
+                         follow_symlinks=os.stat not in os.supports_follow_symlinks)
+
+    def invalidate(self, *paths, parents=False):
+        """
+        Forget what is known about the given paths (and, if they are
+        directories, about their content). With parents=True, also forget
+        the parent directories, e.g. after os.makedirs() or os.removedirs().
+        """
+        for path in paths:
+            path = os.path.normpath(path)
+            # the path may be a directory
+            for d in [d for d in self._listings
+                      if d == path or d.startswith(path + os.sep)]:
+                del self._listings[d]
+                self._stats.pop(d, None)
+            while path not in ("", ".", os.sep):
+                dirname, name = self._split(path)
+                listing = self._listings.get(dirname)
+                if listing is not None:
+                    # created, changed or removed: look it up again
+                    listing[name] = None
+                    stats = self._stats.get(dirname)
+                    if stats is not None:
+                        stats.pop((name, False), None)
+                        stats.pop((name, True), None)
+                if not parents:
+                    break
+                path = dirname
+
+    def report(self):
+        return ("Stat cache: {} file system lookups with {} system calls "
+                "({} system calls saved).".format(
+                    self.requested, self.performed, self.saved))
+
+
+stat_cache = StatCache()
+
+
+def _stat(f, follow_symlinks=True):
+    """os.stat(), using the stat cache if it is enabled."""
+    if stat_cache.enabled:
+        result = stat_cache.stat(f, follow_symlinks=follow_symlinks)
+        if result is not None:
+            return result
+    # raises the appropriate error for missing files
+    return os.stat(f, follow_symlinks=follow_symlinks)
+
+
+def _lstat(f):
+    """lstat(), using the stat cache if it is enabled."""
+    return _stat(f, follow_symlinks=os.stat not in os.supports_follow_symlinks)
+
+
 def IOFile(file, rule=None):
     f = _IOFile(file)
     f.rule = rule
@@ -161,6 +330,8 @@ class _IOFile(str):
 
     @property
     def exists_local(self):
+        if stat_cache.enabled:
+            return stat_cache.stat(self.file) is not None
         return os.path.exists(self.file)
 
     @property
@@ -179,7 +350,7 @@ class _IOFile(str):
     @property
     def mtime_local(self):
         # do not follow symlinks for modification time
-        return lstat(self.file).st_mtime
+        return _lstat(self.file).st_mtime
 
     @property
     def flags(self):
@@ -194,11 +365,11 @@ class _IOFile(str):
     def size_local(self):
         # follow symlinks but throw error if invalid
         self.check_broken_symlink()
-        return os.path.getsize(self.file)
+        return _stat(self.file).st_size
 
     def check_broken_symlink(self):
         """ Raise WorkflowError if file is a broken symlink. """
-        if not self.exists_local and lstat(self.file):
+        if not self.exists_local and _lstat(self.file):
             raise WorkflowError("File {} seems to be a broken symlink.".format(
                 self.file))
 
@@ -213,13 +384,15 @@ class _IOFile(str):
             #is the best we can do.
             return self.mtime > time
         else:
-            return os.stat(self, follow_symlinks=True).st_mtime > time or self.mtime > time
+            return _stat(self, follow_symlinks=True).st_mtime > time or self.mtime > time
 
     def download_from_remote(self):
         if self.is_remote and self.remote_object.exists():
             if not self.should_stay_on_remote:
                 logger.info("Downloading from remote: {}".format(self.file))
                 self.remote_object.download()
+                # the download may also have created parent directories
+                stat_cache.invalidate(self.file, parents=True)
         else:
             raise RemoteFileException(
                 "The file to be downloaded does not seem to exist remotely.")
@@ -239,6 +412,7 @@ class _IOFile(str):
                 # ignore Errno 17 "File exists" (reason: multiprocessing)
                 if e.errno != 17:
                     raise e
+            stat_cache.invalidate(dir, parents=True)
 
     def protect(self):
         mode = (lstat(self.file).st_mode & ~stat.S_IWUSR & ~stat.S_IWGRP
@@ -257,6 +431,7 @@ class _IOFile(str):
 
     def touch(self, times=None):
         """ times must be 2-tuple: (atime, mtime) """
+        stat_cache.invalidate(self.file)
         try:
             lutime(self.file, times)
         except OSError as e:
@@ -276,6 +451,7 @@ class _IOFile(str):
             # create empty file
             with open(self.file, "w") as f:
                 pass
+            stat_cache.invalidate(self.file)
 
     def apply_wildcards(self,
                         wildcards,
@@ -362,23 +538,166 @@ _wildcard_regex = re.compile(
     """, re.VERBOSE)
 
 
+class _Inotify:
+    """
+    Wake up when files are created in (or moved to) watched directories.
+
+    This uses inotify through ctypes and therefore only works on Linux.
+    Changes made by other hosts on network filesystems (e.g. NFS) are not
+    reported, hence the waiting for them has to time out regularly.
+    """
+
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    _EVENT = struct.Struct("iIII")
+
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6",
+                           use_errno=True)
+        # raises AttributeError if the C library does not support inotify
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                    ctypes.c_uint32]
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self._watched = set()
+
+    def watch(self, dirname):
+        """Watch the given directory, return False if this is not possible."""
+        if dirname in self._watched:
+            return True
+        if self._add_watch(self.fd, os.fsencode(dirname),
+                           self.IN_CREATE | self.IN_MOVED_TO) < 0:
+            return False
+        self._watched.add(dirname)
+        return True
+
+    def wait(self, timeout):
+        """
+        Wait at most timeout seconds for an event in a watched directory
+        and return whether there was one.
+        """
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return False
+        # discard the events, the files are checked anyway
+        try:
+            while os.read(self.fd, 64 * self._EVENT.size):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+
 def wait_for_files(files, latency_wait=3):
-    """Wait for given files to be present in filesystem."""
-    files = list(files)
-    get_missing = lambda: [
-        f for f in files if not
-        (f.exists_remote if (isinstance(f, _IOFile) and f.is_remote and f.should_stay_on_remote) else os.path.exists(f))
-    ]
-    missing = get_missing()
-    if missing:
-        logger.info("Waiting at most {} seconds for missing files.".format(
-            latency_wait))
-        for _ in range(latency_wait):
-            if not get_missing():
-                return
-            time.sleep(1)
-        raise IOError("Missing files after {} seconds:\n{}".format(
-            latency_wait, "\n".join(get_missing())))
+    """
+    Wait for given files to be present in filesystem and return the number
+    of seconds that were spent waiting.
+
+    Missing files are checked again with an increasing interval (at most one
+    second). On Linux, they are also checked as soon as a file is created in
+    their directory.
+    """
+    def is_missing(f):
+        if isinstance(f, _IOFile) and f.is_remote and f.should_stay_on_remote:
+            return not f.exists_remote
+        return not os.path.exists(f)
+
+    missing = [f for f in files if is_missing(f)]
+    if not missing:
+        return 0
+    logger.info("Waiting at most {} seconds for missing files.".format(
+        latency_wait))
+    start = time.time()
+    deadline = start + latency_wait
+    try:
+        inotify = _Inotify()
+    except (OSError, AttributeError):
+        inotify = None
+    try:
+        if inotify is not None:
+            for f in missing:
+                inotify.watch(os.path.dirname(os.path.abspath(f)))
+        interval = 0.01
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            timeout = min(interval, remaining)
+            if inotify is not None:
+                woken = inotify.wait(timeout)
+            else:
+                time.sleep(timeout)
+                woken = False
+            if not woken:
+                # nothing was created locally, check less often
+                interval = min(2 * interval, 1)
+            missing = [f for f in missing if is_missing(f)]
+            if not missing:
+                return time.time() - start
+    finally:
+        if inotify is not None:
+            inotify.close()
+    missing = [f for f in missing if is_missing(f)]
+    if not missing:
+        return time.time() - start
+    raise IOError("Missing files after {} seconds:\n{}".format(
+        latency_wait, "\n".join(missing)))
+
+
+#: Size of the chunks of a file that are hashed independently (and in
+#: parallel) by checksum_files()
+CHECKSUM_CHUNK_SIZE = 64 * 1024 * 1024
+
+
+def _chunk_digest(path, offset, length):
+    digest = hashlib.blake2b(digest_size=32)
+    with open(path, "rb") as f:
+        f.seek(offset)
+        while length > 0:
+            block = f.read(min(length, 1024 * 1024))
+            if not block:
+                break
+            digest.update(block)
+            length -= len(block)
+    return digest.digest()
+
+
+def checksum_files(files, threads=None, chunk_size=CHECKSUM_CHUNK_SIZE):
+    """
+    Return a dict with a checksum of the content of each of the given files.
+
+    Files are split into chunks of chunk_size bytes, and the chunks of all
+    files are hashed (with BLAKE2b) by a pool of threads, as hashlib
+    releases the GIL while hashing. The checksum of a file is the hash of its
+    size and the digests of its chunks.
+    """
+    if threads is None:
+        threads = min(8, os.cpu_count() or 1)
+    sizes = {f: os.path.getsize(f) for f in files}
+    chunks = [(f, offset, chunk_size)
+              for f, size in sizes.items()
+              for offset in range(0, max(size, 1), chunk_size)]
+    if threads > 1 and len(chunks) > 1:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            digests = list(pool.map(lambda chunk: _chunk_digest(*chunk), chunks))
+    else:
+        digests = [_chunk_digest(*chunk) for chunk in chunks]
+    checksums = dict()
+    for (f, offset, _), digest in zip(chunks, digests):
+        if offset == 0:
+            checksums[f] = hashlib.blake2b(str(sizes[f]).encode(),
+                                           digest_size=32)
+        checksums[f].update(digest)
+    return {f: "blake2b:" + checksum.hexdigest()
+            for f, checksum in checksums.items()}
 
 
 def get_wildcard_names(pattern):
@@ -395,6 +714,14 @@ def contains_wildcard_constraints(pattern):
 
 
 def remove(file, remove_non_empty_dir=False):
+    try:
+        _remove(file, remove_non_empty_dir=remove_non_empty_dir)
+    finally:
+        # os.removedirs() may also have removed empty parent directories
+        stat_cache.invalidate(file, parents=True)
+
+
+def _remove(file, remove_non_empty_dir=False):
     if file.is_remote and file.should_stay_on_remote:
         if file.exists_remote:
             file.remote_object.remove()
@@ -546,6 +873,35 @@ def protected(value):
     return flag(value, "protected")
 
 
+def pipe(value):
+    """
+    A flag for an output file that is a named pipe (FIFO) instead of a
+    regular file. The job writing it runs at the same time as the single job
+    reading it, and the pipe is removed afterwards.
+    """
+    if is_flagged(value, "protected"):
+        raise SyntaxError("Pipes may not be protected.")
+    if is_flagged(value, "remote"):
+        raise SyntaxError("Remote and pipe flags are mutually exclusive.")
+    if is_flagged(value, "dynamic"):
+        raise SyntaxError("Dynamic and pipe flags are mutually exclusive.")
+    return flag(value, "pipe")
+
+
+def release_pipe(path):
+    """
+    Let the processes that are blocked in opening the named pipe at path
+    proceed. Readers will see the end of the file and writers will get a
+    broken pipe, unless the other side is still open.
+    """
+    try:
+        # opening both ends never blocks and wakes up blocked processes
+        fd = os.open(path, os.O_RDWR | os.O_NONBLOCK)
+    except OSError:
+        return
+    os.close(fd)
+
+
 def dynamic(value):
     """
     A flag for a file that shall be dynamic, i.e. the multiplicity
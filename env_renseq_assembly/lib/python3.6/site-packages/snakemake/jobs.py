@@ -10,14 +10,14 @@ import base64
 import tempfile
 import subprocess
 
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from itertools import chain
 from functools import partial
 from operator import attrgetter
 from urllib.request import urlopen
 from urllib.parse import urlparse
 
-from snakemake.io import IOFile, Wildcards, Resources, _IOFile, is_flagged, contains_wildcard, lstat
+from snakemake.io import IOFile, Wildcards, Resources, _IOFile, is_flagged, contains_wildcard, lstat, stat_cache
 from snakemake.utils import format, listfiles
 from snakemake.exceptions import RuleException, ProtectedOutputException, WorkflowError
 from snakemake.exceptions import UnexpectedOutputException, CreateCondaEnvironmentException
@@ -38,7 +38,7 @@ class Job:
                  "_params", "_log", "_benchmark", "_resources",
                  "_conda_env_file", "_conda_env", "shadow_dir", "_inputsize",
                  "restart_times", "dynamic_output", "dynamic_input",
-                 "temp_output", "protected_output", "touch_output",
+                 "temp_output", "protected_output", "touch_output", "pipe_output",
                  "subworkflow_input", "_hash"]
 
     def __init__(self, rule, dag, wildcards_dict=None, format_wildcards=None):
@@ -68,6 +68,7 @@ class Job:
         self.dynamic_output, self.dynamic_input = set(), set()
         self.temp_output, self.protected_output = set(), set()
         self.touch_output = set()
+        self.pipe_output = set()
         self.subworkflow_input = dict()
         for f in self.output:
             f_ = output_mapping[f]
@@ -79,6 +80,8 @@ class Job:
                 self.protected_output.add(f)
             if f_ in self.rule.touch_output:
                 self.touch_output.add(f)
+            if f_ in self.rule.pipe_output:
+                self.pipe_output.add(f)
         for f in self.input:
             f_ = input_mapping[f]
             if f_ in self.rule.dynamic_input:
@@ -175,6 +178,13 @@ class Job:
     def is_shadow(self):
         return self.rule.shadow_depth is not None
 
+    @property
+    def name(self):
+        return self.rule.name
+
+    def is_group(self):
+        return False
+
     @property
     def priority(self):
         return self.dag.priority(self)
@@ -188,10 +198,16 @@ class Job:
     def inputsize(self):
         """
         Return the size of the input files.
-        Input files need to be present.
+        Input files need to be present, except for pipes and the output of
+        the other jobs of its group.
         """
         if self._inputsize is None:
-            self._inputsize = sum(f.size for f in self.input)
+            group = self.dag.job_group(self) or ()
+            missing = set(chain.from_iterable(
+                job.output if job in group else job.pipe_output
+                for job in self.dag.dependencies[self]))
+            self._inputsize = sum(f.size for f in self.input
+                                  if f not in missing)
         return self._inputsize
 
     @property
@@ -348,7 +364,8 @@ class Job:
                 if f in self.dynamic_output:
                     if not self.expand_dynamic(f_):
                         files.add("{} (dynamic)".format(f_))
-                elif not f.exists:
+                elif f in self.pipe_output or not f.exists:
+                    # a pipe has to be created again for each run
                     files.add(f)
         return files
 
@@ -444,6 +461,7 @@ class Job:
             for f, _ in chain(*map(self.expand_dynamic,
                                    self.rule.dynamic_output)):
                 os.remove(f)
+                stat_cache.invalidate(f)
 
         for f, f_ in zip(self.output, self.rule.output):
             try:
@@ -478,6 +496,9 @@ class Job:
 
         for f, f_ in zip(self.output, self.rule.output):
             f.prepare()
+        for f in self.pipe_output:
+            os.mkfifo(f)
+            stat_cache.invalidate(f)
 
         self.download_remote_input()
 
@@ -629,6 +650,131 @@ class Job:
                               omit_value=DYNAMIC_FILL))
 
 
+class GroupJob:
+    """
+    Jobs of rules with the same group that depend on each other, submitted
+    to the cluster together (see DAG.update_job_groups). They run in one
+    snakemake process, in steps: the jobs of a step start after those of the
+    previous steps and run at the same time (jobs connected by a pipe are in
+    the same step). For the submission, the group provides what cluster
+    executors need of a job: the input that is not created in the group, the
+    output that is not a pipe, the threads and resources (e.g. mem_mb) of
+    the step that needs the most and the runtime of all steps.
+    """
+
+    def __init__(self, name, steps, dag):
+        self.name = name
+        self.steps = steps
+        self.jobs = tuple(chain(*steps))
+        self.dag = dag
+        output = set(jobfiles(self.jobs, "output"))
+        self.input = list(OrderedDict.fromkeys(
+            f for f in jobfiles(self.jobs, "input") if f not in output))
+        self.output = [f for job in self.jobs for f in job.output
+                       if f not in job.pipe_output]
+        # the wildcards that all jobs have in common
+        self.wildcards = Wildcards(fromdict={
+            name: value for name, value in self.jobs[0].wildcards_dict.items()
+            if all(job.wildcards_dict.get(name) == value
+                   for job in self.jobs)})
+        self._resources = None
+
+    def is_group(self):
+        return True
+
+    @property
+    def threads(self):
+        return self.resources._cores
+
+    @property
+    def resources(self):
+        if self._resources is None:
+            resources = dict()
+            for name in set(chain(*(job.resources.keys() for job in self.jobs))):
+                usage = [[job.resources.get(name, 0) for job in step]
+                         for step in self.steps]
+                if name == "runtime":
+                    resources[name] = sum(map(max, usage))
+                else:
+                    resources[name] = max(map(sum, usage))
+            resources["_nodes"] = 1
+            self._resources = Resources(fromdict=resources)
+        return self._resources
+
+    @property
+    def local_input(self):
+        for f in self.input:
+            if not f.is_remote:
+                yield f
+
+    @property
+    def remote_input(self):
+        for f in self.input:
+            if f.is_remote:
+                yield f
+
+    def format_wildcards(self, string, **variables):
+        """ Format a string with variables from the group. """
+        _variables = dict()
+        _variables.update(self.dag.workflow.globals)
+        _variables.update(dict(input=self.input,
+                               output=self.output,
+                               wildcards=self.wildcards,
+                               threads=self.threads,
+                               resources=self.resources,
+                               rule=self.name, ))
+        _variables.update(variables)
+        try:
+            return format(string, **_variables)
+        except (AttributeError, NameError, IndexError) as ex:
+            raise WorkflowError("{} in group {}: {}".format(
+                type(ex).__name__, self.name, ex))
+
+    def properties(self,
+                   omit_resources="_cores _nodes".split(),
+                   **aux_properties):
+        resources = {
+            name: res
+            for name, res in self.resources.items()
+            if name not in omit_resources
+        }
+        properties = {
+            "rule": self.name,
+            "group": self.name,
+            "local": False,
+            "input": self.input,
+            "output": self.output,
+            "wildcards": self.wildcards,
+            "threads": self.threads,
+            "resources": resources,
+            "jobid": self.dag.jobid(self),
+            "jobs": [job.properties() for job in self.jobs]
+        }
+        properties.update(aux_properties)
+        return properties
+
+    def __iter__(self):
+        return iter(self.jobs)
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def __getitem__(self, index):
+        return self.jobs[index]
+
+    def __contains__(self, job):
+        return job in self.jobs
+
+    def __repr__(self):
+        return self.name
+
+    def __eq__(self, other):
+        return isinstance(other, GroupJob) and self.jobs == other.jobs
+
+    def __hash__(self):
+        return hash(self.jobs)
+
+
 class Reason:
 
     __slots__ = ["_updated_input", "_updated_input_run", "_missing_output",
@@ -382,6 +382,10 @@ class Priority(RuleKeywordState):
     pass
 
 
+class Group(RuleKeywordState):
+    pass
+
+
 class Version(RuleKeywordState):
     pass
 
@@ -540,6 +544,7 @@ class Rule(GlobalKeywordState):
                        threads=Threads,
                        resources=Resources,
                        priority=Priority,
+                       group=Group,
                        version=Version,
                        log=Log,
                        message=Message,
@@ -5,20 +5,286 @@ __license__ = "MIT"
 
 import os
 import shutil
+import contextlib
 import signal
+import stat
 import marshal
 import pickle
-from base64 import urlsafe_b64encode
+import sqlite3
+import threading
+from base64 import urlsafe_b64encode, urlsafe_b64decode
 from functools import lru_cache, partial
 from itertools import filterfalse, count
 
 from snakemake.logging import logger
 from snakemake.jobs import jobfiles
+from snakemake.io import checksum_files
 from snakemake.utils import listfiles
 
 
+# Kinds of metadata records kept for each output file. For the "files"
+# backend, these are the names of the directories below .snakemake.
+INCOMPLETE = "incomplete_files"
+VERSION = "version_tracking"
+CODE = "code_tracking"
+RULE = "rule_tracking"
+INPUT = "input_tracking"
+LOG = "log_tracking"
+PARAMS = "params_tracking"
+SHELLCMD = "shellcmd_tracking"
+# checksums of the input files of a job when its output files were created
+INPUT_CHECKSUM = "input_checksum_tracking"
+# cache of the checksum of any file, along with its size and mtime
+CHECKSUM = "checksum_tracking"
+SUBJECTS = (INCOMPLETE, VERSION, CODE, RULE, INPUT, LOG, PARAMS, SHELLCMD,
+            INPUT_CHECKSUM, CHECKSUM)
+
+
+class FileRecords:
+    """Store each metadata record in its own file below .snakemake (the default)."""
+
+    def __init__(self, path, create=True):
+        self.path = path
+        if create:
+            for subject in SUBJECTS:
+                d = self._subject_path(subject)
+                if not os.path.exists(d):
+                    os.mkdir(d)
+
+    @classmethod
+    def existing(cls, path):
+        """Return the records below path if there are any, otherwise None."""
+        if any(os.path.exists(os.path.join(path, subject)) for subject in SUBJECTS):
+            return cls(path, create=False)
+        return None
+
+    def _subject_path(self, subject):
+        return os.path.join(self.path, subject)
+
+    def update(self, records):
+        """Write the given (subject, id, value, bin) records.
+
+        A value of None deletes the record.
+        """
+        for subject, id, value, bin in records:
+            if value is None:
+                self._delete(subject, id)
+            else:
+                recpath = self._record_path(subject, id)
+                os.makedirs(os.path.dirname(recpath), exist_ok=True)
+                with open(recpath, "wb" if bin else "w") as f:
+                    f.write(value)
+
+    def _delete(self, subject, id):
+        try:
+            recpath = self._record_path(subject, id)
+            os.remove(recpath)
+            recdirs = os.path.relpath(os.path.dirname(recpath),
+                                      start=self._subject_path(subject))
+            if recdirs != ".":
+                os.removedirs(recdirs)
+        except OSError as e:
+            if e.errno != 2:  # not missing
+                raise e
+
+    def read(self, subject, ids, bin=False):
+        """Return a dict with the values of the existing records among ids."""
+        values = dict()
+        for id in ids:
+            try:
+                with open(self._record_path(subject, id), "rb" if bin else "r") as f:
+                    values[str(id)] = f.read()
+            except FileNotFoundError:
+                pass
+        return values
+
+    def contains(self, subject, ids):
+        """Return the set of ids for which a record exists."""
+        return set(str(id) for id in ids
+                   if os.path.exists(self._record_path(subject, id)))
+
+    def records(self, subject):
+        """Iterate over all (id, value) pairs of subject, values as bytes."""
+        subject_path = self._subject_path(subject)
+        for dirpath, dirnames, filenames in os.walk(subject_path):
+            reldirs = os.path.relpath(dirpath, start=subject_path)
+            prefix = "" if reldirs == "." else "".join(
+                d[1:] for d in reldirs.split(os.sep))
+            for filename in filenames:
+                id = urlsafe_b64decode(prefix + filename).decode()
+                with open(os.path.join(dirpath, filename), "rb") as f:
+                    yield id, f.read()
+
+    def _record_path(self, subject, id):
+        subject = self._subject_path(subject)
+        max_len = os.pathconf(
+            subject,
+            "PC_NAME_MAX") if os.name == "posix" else 255  # maximum NTFS and FAT32 filename length
+        b64id = urlsafe_b64encode(str(id).encode()).decode()
+        # split into chunks of proper length
+        b64id = [b64id[i:i + max_len - 1]
+                 for i in range(0, len(b64id), max_len - 1)]
+        # prepend dirs with @ (does not occur in b64) to avoid conflict with b64-named files in the same dir
+        b64id = ["@" + s for s in b64id[:-1]] + [b64id[-1]]
+        path = os.path.join(subject, *b64id)
+        return path
+
+
+class SqliteRecords:
+    """Store all metadata records in a single SQLite database.
+
+    All records of one call to update() are written in one transaction and
+    lookups of many ids are done with a few queries instead of one file access
+    per id. SQLite locking is not reliable on network file systems, hence the
+    database (db_path, by default metadata.sqlite below path) should be on a
+    local disk of the host that runs snakemake, and only that snakemake
+    process writes to it (jobs spawned by it use NoRecords).
+    """
+
+    # stay below SQLITE_MAX_VARIABLE_NUMBER (999 in older versions)
+    batch_size = 500
+
+    def __init__(self, path, db_path=None):
+        self.path = path
+        self.db_path = db_path or os.path.join(path, "metadata.sqlite")
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        # jobs finish in executor threads, hence the connection is shared
+        # between threads and protected by a lock. Transactions are started
+        # explicitly (see _transaction).
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.db_path, timeout=60,
+                                   check_same_thread=False,
+                                   isolation_level=None)
+        with self._lock, self._transaction():
+            created = not self._db.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'records'").fetchone()
+            self._db.execute("CREATE TABLE IF NOT EXISTS records ("
+                             "subject TEXT NOT NULL, "
+                             "id TEXT NOT NULL, "
+                             "value BLOB NOT NULL, "
+                             "PRIMARY KEY (subject, id)) WITHOUT ROWID")
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta ("
+                             "key TEXT PRIMARY KEY, value TEXT)")
+            imported = self._db.execute(
+                "SELECT 1 FROM meta WHERE key = 'imported'").fetchone()
+            n = 0
+            if created and not imported:
+                # a new database, the first process to get here imports the
+                # records of the .snakemake tree, the others see the marker
+                n = self._import(FileRecords.existing(path))
+            if not imported:
+                self._db.execute(
+                    "INSERT INTO meta VALUES ('imported', ?)", (str(n), ))
+        if n:
+            logger.info("Imported {} metadata records from {} into {}.".format(
+                n, path, self.db_path))
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """Run the statements of the block in one transaction, which takes
+        the write lock of the database right away."""
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+    def import_records(self, records):
+        """Import all records of another backend (e.g. a FileRecords
+        .snakemake tree). Return the number of imported records."""
+        with self._lock, self._transaction():
+            return self._import(records)
+
+    def _import(self, records):
+        if records is None:
+            return 0
+        n = 0
+        for subject in SUBJECTS:
+            for id, value in records.records(subject):
+                self._db.execute(
+                    "INSERT OR REPLACE INTO records VALUES (?, ?, ?)",
+                    (subject, id, value))
+                n += 1
+        return n
+
+    def update(self, records):
+        """Write the given (subject, id, value, bin) records in one transaction.
+
+        A value of None deletes the record.
+        """
+        with self._lock, self._transaction():
+            for subject, id, value, bin in records:
+                if value is None:
+                    self._db.execute(
+                        "DELETE FROM records WHERE subject = ? AND id = ?",
+                        (subject, str(id)))
+                else:
+                    if not bin:
+                        value = value.encode()
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO records VALUES (?, ?, ?)",
+                        (subject, str(id), value))
+
+    def _select(self, columns, subject, ids):
+        ids = list(set(map(str, ids)))
+        rows = []
+        with self._lock:
+            for i in range(0, len(ids), self.batch_size):
+                batch = ids[i:i + self.batch_size]
+                rows.extend(self._db.execute(
+                    "SELECT {} FROM records WHERE subject = ? AND id IN ({})".format(
+                        columns, ",".join("?" * len(batch))),
+                    [subject] + batch))
+        return rows
+
+    def read(self, subject, ids, bin=False):
+        """Return a dict with the values of the existing records among ids."""
+        return {id: (bytes(value) if bin else bytes(value).decode())
+                for id, value in self._select("id, value", subject, ids)}
+
+    def contains(self, subject, ids):
+        """Return the set of ids for which a record exists."""
+        return set(id for id, in self._select("id", subject, ids))
+
+    def records(self, subject):
+        """Iterate over all (id, value) pairs of subject, values as bytes."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, value FROM records WHERE subject = ?",
+                (subject, )).fetchall()
+        for id, value in rows:
+            yield id, bytes(value)
+
+
+class NoRecords:
+    """Keep no metadata records, for jobs that snakemake runs in a separate
+    process (e.g. on a cluster node). The snakemake process that spawned
+    them records their metadata itself."""
+
+    def __init__(self, path, db_path=None):
+        self.path = path
+
+    def update(self, records):
+        pass
+
+    def read(self, subject, ids, bin=False):
+        return dict()
+
+    def contains(self, subject, ids):
+        return set()
+
+    def records(self, subject):
+        return iter(())
+
+
+BACKENDS = {"files": FileRecords, "sqlite": SqliteRecords, "none": NoRecords}
+
+
 class Persistence:
-    def __init__(self, nolock=False, dag=None, conda_prefix=None, warn_only=False):
+    def __init__(self, nolock=False, dag=None, conda_prefix=None, warn_only=False,
+                 backend="files", db_path=None, checksums=False):
         self.path = os.path.abspath(".snakemake")
         if not os.path.exists(self.path):
             os.mkdir(self.path)
@@ -29,23 +295,22 @@ class Persistence:
         self.dag = dag
         self._lockfile = dict()
 
-        self._incomplete_path = os.path.join(self.path, "incomplete_files")
-        self._version_path = os.path.join(self.path, "version_tracking")
-        self._code_path = os.path.join(self.path, "code_tracking")
-        self._rule_path = os.path.join(self.path, "rule_tracking")
-        self._input_path = os.path.join(self.path, "input_tracking")
-        self._log_path = os.path.join(self.path, "log_tracking")
-        self._params_path = os.path.join(self.path, "params_tracking")
-        self._shellcmd_path = os.path.join(self.path, "shellcmd_tracking")
         self.shadow_path = os.path.join(self.path, "shadow")
         self.conda_env_archive_path = os.path.join(self.path, "conda-archive")
 
-        for d in (self._incomplete_path, self._version_path, self._code_path,
-                  self._rule_path, self._input_path, self._log_path, self._params_path,
-                  self._shellcmd_path, self.shadow_path, self.conda_env_archive_path):
+        for d in (self.shadow_path, self.conda_env_archive_path):
             if not os.path.exists(d):
                 os.mkdir(d)
 
+        if backend == "files":
+            self._records = FileRecords(self.path)
+        else:
+            self._records = BACKENDS[backend](self.path, db_path=db_path)
+        # whether to decide on reruns by the content of input files
+        self.checksums = checksums
+        # input checksums of finished jobs, computed by prepare_finished
+        self._input_checksums_of = dict()
+
         if conda_prefix is None:
             self.conda_env_path = os.path.join(self.path, "conda")
         else:
@@ -114,14 +379,7 @@ class Persistence:
         shutil.rmtree(self._lockdir)
 
     def cleanup_metadata(self, path):
-        self._delete_record(self._incomplete_path, path)
-        self._delete_record(self._version_path, path)
-        self._delete_record(self._code_path, path)
-        self._delete_record(self._rule_path, path)
-        self._delete_record(self._input_path, path)
-        self._delete_record(self._log_path, path)
-        self._delete_record(self._params_path, path)
-        self._delete_record(self._shellcmd_path, path)
+        self._records.update((subject, path, None, False) for subject in SUBJECTS)
 
     def cleanup_shadow(self):
         if os.path.exists(self.shadow_path):
@@ -129,8 +387,16 @@ class Persistence:
             os.mkdir(self.shadow_path)
 
     def started(self, job):
-        for f in job.output:
-            self._record(self._incomplete_path, "", f)
+        self._records.update((INCOMPLETE, f, "", False) for f in job.output)
+
+    def prepare_finished(self, job):
+        """Compute the checksums of the input files of a finished job.
+
+        Hashing large input files for the first time may take minutes, hence
+        this is done before the scheduler takes its lock to call finished().
+        """
+        if self.checksums:
+            self._input_checksums_of[job] = self._input_checksums(job)
 
     def finished(self, job):
         version = str(
@@ -140,55 +406,60 @@ class Persistence:
         log = self._log(job)
         params = self._params(job)
         shellcmd = self._shellcmd(job)
+        # without checksums, drop old ones, which no longer match the output
+        input_checksums = None
+        if self.checksums:
+            input_checksums = self._input_checksums_of.pop(job, None)
+            if input_checksums is None:
+                input_checksums = self._input_checksums(job)
+        records = []
         for f in job.expanded_output:
-            self._delete_record(self._incomplete_path, f)
-            self._record(self._version_path, version, f)
-            self._record(self._code_path, code, f, bin=True)
-            self._record(self._rule_path, job.rule.name, f)
-            self._record(self._input_path, input, f)
-            self._record(self._log_path, log, f)
-            self._record(self._params_path, params, f)
-            self._record(self._shellcmd_path, shellcmd, f)
+            records.extend((
+                (INCOMPLETE, f, None, False),
+                (VERSION, f, version, False),
+                (CODE, f, code, True),
+                (RULE, f, job.rule.name, False),
+                (INPUT, f, input, False),
+                (LOG, f, log, False),
+                (PARAMS, f, params, False),
+                (SHELLCMD, f, shellcmd, False),
+                (INPUT_CHECKSUM, f, input_checksums, False)))
+        # one batch (i.e. one transaction for the sqlite backend) per job
+        self._records.update(records)
 
     def cleanup(self, job):
-        for f in job.expanded_output:
-            self._delete_record(self._incomplete_path, f)
-            self._delete_record(self._version_path, f)
-            self._delete_record(self._code_path, f)
-            self._delete_record(self._rule_path, f)
-            self._delete_record(self._input_path, f)
-            self._delete_record(self._log_path, f)
-            self._delete_record(self._params_path, f)
-            self._delete_record(self._shellcmd_path, f)
+        self._records.update((subject, f, None, False)
+                             for f in job.expanded_output
+                             for subject in SUBJECTS)
 
     def incomplete(self, job):
-        marked_incomplete = partial(self._exists_record, self._incomplete_path)
-        return any(
-            map(lambda f: f.exists and marked_incomplete(f), job.output))
+        existing = [f for f in job.output if f.exists]
+        return bool(existing) and bool(
+            self._records.contains(INCOMPLETE, existing))
 
     def version(self, path):
-        return self._read_record(self._version_path, path)
+        return self._read_record(VERSION, path)
 
     def rule(self, path):
-        return self._read_record(self._rule_path, path)
+        return self._read_record(RULE, path)
 
     def input(self, path):
-        files = self._read_record(self._input_path, path)
+        files = self._read_record(INPUT, path)
         if files is not None:
             return files.split("\n")
         return None
 
     def log(self, path):
-        files = self._read_record(self._log_path, path)
+        files = self._read_record(LOG, path)
         if files is not None:
             return files.split("\n")
         return None
 
     def shellcmd(self, path):
-        return self._read_record(self._shellcmd_path, path)
+        return self._read_record(SHELLCMD, path)
 
     def version_changed(self, job, file=None):
-        cr = partial(self._changed_records, self._version_path,
+        cr = partial(self._changed_records, VERSION,
                      job.rule.version)
         if file is None:
             return cr(*job.output)
@@ -196,7 +467,7 @@ class Persistence:
             return bool(list(cr(file)))
 
     def code_changed(self, job, file=None):
-        cr = partial(self._changed_records, self._code_path,
+        cr = partial(self._changed_records, CODE,
                      self._code(job.rule),
                      bin=True)
         if file is None:
@@ -205,26 +476,66 @@ class Persistence:
             return bool(list(cr(file)))
 
     def input_changed(self, job, file=None):
-        cr = partial(self._changed_records, self._input_path, self._input(job))
+        cr = partial(self._changed_records, INPUT, self._input(job))
         if file is None:
             return cr(*job.output)
         else:
             return bool(list(cr(file)))
 
     def params_changed(self, job, file=None):
-        cr = partial(self._changed_records, self._params_path,
+        cr = partial(self._changed_records, PARAMS,
                      self._params(job))
         if file is None:
             return cr(*job.output)
         else:
             return bool(list(cr(file)))
 
+    def checksums_changed(self, job, files):
+        """Return those of the given input files of job whose content differs
+        from the one they had when the output of job was created, or for which
+        this is unknown."""
+        recorded = self._records.read(INPUT_CHECKSUM, job.output)
+        if len(recorded) < len(set(job.output)):
+            return list(files)
+        recorded = [dict(reversed(line.split("\t", 1))
+                         for line in value.split("\n") if line)
+                    for value in recorded.values()]
+        current = self.checksums_of(files)
+        return [f for f in files
+                if f not in current or
+                any(checksums.get(f) != current[f] for checksums in recorded)]
+
+    def checksums_of(self, files):
+        """Return a dict with the checksums of those of the given files that
+        are local regular files. Checksums are only computed for files whose
+        size or mtime changed since their checksum was last computed."""
+        keys = dict()
+        for f in files:
+            if getattr(f, "is_remote", False):
+                continue
+            try:
+                st = os.stat(f)
+            except OSError:
+                continue
+            if stat.S_ISREG(st.st_mode):
+                keys[f] = "{} {}".format(st.st_size, st.st_mtime_ns)
+        cached = self._records.read(CHECKSUM, keys)
+        checksums = dict()
+        for f, key in keys.items():
+            value = cached.get(str(f))
+            if value is not None and value.startswith(key + " "):
+                checksums[f] = value[len(key) + 1:]
+        missing = [f for f in keys if f not in checksums]
+        if missing:
+            computed = checksum_files(missing)
+            checksums.update(computed)
+            self._records.update((CHECKSUM, f, keys[f] + " " + checksum, False)
+                                 for f, checksum in computed.items())
+        return checksums
+
     def noop(self, *args):
         pass
 
-    def _b64id(self, s):
-        return urlsafe_b64encode(str(s).encode()).decode()
-
     @lru_cache()
     def _code(self, rule):
         code = rule.run_func.__code__
@@ -250,45 +561,21 @@ class Persistence:
     def _shellcmd(self, job):
         return job.shellcmd
 
-    def _record(self, subject, value, id, bin=False):
-        recpath = self._record_path(subject, id)
-        if value is not None:
-            os.makedirs(os.path.dirname(recpath), exist_ok=True)
-            with open(recpath, "wb" if bin else "w") as f:
-                f.write(value)
-        else:
-            if os.path.exists(recpath):
-                os.remove(recpath)
-
-    def _delete_record(self, subject, id):
-        try:
-            recpath = self._record_path(subject, id)
-            os.remove(recpath)
-            recdirs = os.path.relpath(os.path.dirname(recpath), start=subject)
-            if recdirs != ".":
-                os.removedirs(recdirs)
-        except OSError as e:
-            if e.errno != 2:  # not missing
-                raise e
+    def _input_checksums(self, job):
+        checksums = self.checksums_of(job.input)
+        return "\n".join(sorted("{}\t{}".format(checksum, f)
+                                for f, checksum in checksums.items()))
 
     def _read_record(self, subject, id, bin=False):
-        if not self._exists_record(subject, id):
-            return None
-        with open(self._record_path(subject, id), "rb" if bin else "r") as f:
-            return f.read()
+        return self._records.read(subject, [id], bin=bin).get(str(id))
 
     def _changed_records(self, subject, value, *ids, bin=False):
-        equals = partial(self._equals_record, subject, value, bin=bin)
+        # look up all ids at once
+        recorded = self._records.read(subject, ids, bin=bin)
         return filter(
-            lambda id: self._exists_record(subject, id) and not equals(id),
+            lambda id: str(id) in recorded and recorded[str(id)] != value,
             ids)
 
-    def _equals_record(self, subject, value, id, bin=False):
-        return self._read_record(subject, id, bin=bin) == value
-
-    def _exists_record(self, subject, id):
-        return os.path.exists(self._record_path(subject, id))
-
     def _locks(self, type):
         return (f for f, _ in listfiles(
             os.path.join(self._lockdir, "{{n,[0-9]+}}.{}.lock".format(type)))
@@ -304,19 +591,6 @@ class Persistence:
                     print(*files, sep="\n", file=lock)
                 return
 
-    def _record_path(self, subject, id):
-        max_len = os.pathconf(
-            subject,
-            "PC_NAME_MAX") if os.name == "posix" else 255  # maximum NTFS and FAT32 filename length
-        b64id = self._b64id(id)
-        # split into chunks of proper length
-        b64id = [b64id[i:i + max_len - 1]
-                 for i in range(0, len(b64id), max_len - 1)]
-        # prepend dirs with @ (does not occur in b64) to avoid conflict with b64-named files in the same dir
-        b64id = ["@" + s for s in b64id[:-1]] + [b64id[-1]]
-        path = os.path.join(subject, *b64id)
-        return path
-
     def all_outputfiles(self):
         # we only look at output files that will be updated
         return jobfiles(self.dag.needrun_jobs, "output")
@@ -4,6 +4,13 @@ __email__ = "tomkinsc@broadinstitute.org"
 __license__ = "MIT"
 
 import os
+import stat
+import time
+import atexit
+import posixpath
+import threading
+import concurrent.futures
+from collections import defaultdict
 from contextlib import contextmanager
 
 # module-specific
@@ -18,13 +25,102 @@ except ImportError as e:
         "must be installed to use SFTP remote() file functionality. %s" % e.msg)
 
 
+class ConnectionPool:
+    """ Idle SFTP connections, per host and connection arguments, that are
+        reused by all remote objects.
+    """
+
+    def __init__(self, max_idle=8):
+        self.max_idle = max_idle
+        self._idle = defaultdict(list)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _is_active(conn):
+        try:
+            return conn.sftp_client.get_channel().get_transport().is_active()
+        except Exception:
+            return False
+
+    @contextmanager
+    def connection(self, key, connect):
+        """ Yield an idle connection for key, or a new one made by connect().
+            It is returned to the pool afterwards, unless an error occurred.
+        """
+        conn = None
+        with self._lock:
+            idle = self._idle[key]
+            while idle and conn is None:
+                conn = idle.pop()
+                if not self._is_active(conn):
+                    conn.close()
+                    conn = None
+        if conn is None:
+            conn = connect()
+        try:
+            yield conn
+        except:
+            # the state of the connection is unknown
+            conn.close()
+            raise
+        with self._lock:
+            if len(self._idle[key]) < self.max_idle:
+                self._idle[key].append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            conns = [conn for idle in self._idle.values() for conn in idle]
+            self._idle.clear()
+        for conn in conns:
+            conn.close()
+
+
+class ListingCache:
+    """ Attributes of the files in remote directories, per connection key and
+        directory, as returned by one listing of the directory.
+    """
+
+    def __init__(self):
+        self._listings = dict()
+        self._lock = threading.Lock()
+
+    def get(self, key, ttl):
+        with self._lock:
+            listing = self._listings.get(key)
+        if listing is not None and time.time() - listing[0] < ttl:
+            return listing[1]
+        return None
+
+    def put(self, key, entries):
+        with self._lock:
+            self._listings[key] = (time.time(), entries)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._listings.pop(key, None)
+
+
+# shared by all remote objects, as a RemoteProvider is created for every call
+# of remote()
+connection_pool = ConnectionPool()
+atexit.register(connection_pool.close)
+listing_cache = ListingCache()
+
+
 class RemoteProvider(AbstractRemoteProvider):
 
     supports_default = True
 
-    def __init__(self, *args, stay_on_remote=False, **kwargs):
+    def __init__(self, *args, stay_on_remote=False, streams=4,
+                 chunk_size=32 * 1024 * 1024, stat_cache_ttl=60, **kwargs):
         super(RemoteProvider, self).__init__(*args, stay_on_remote=stay_on_remote, **kwargs)
 
+        self.streams = streams
+        self.chunk_size = chunk_size
+        self.stat_cache_ttl = stat_cache_ttl
+
     @property
     def default_protocol(self):
         """The protocol that is prepended to the path when no protocol is specified."""
@@ -35,18 +131,34 @@ class RemoteProvider(AbstractRemoteProvider):
         """List of valid protocols for this remote provider."""
         return ['ssh://', 'sftp://']
 
+    def remote(self, value, *args, streams=None, chunk_size=None, stat_cache_ttl=None, **kwargs):
+        return super(RemoteProvider, self).remote(
+            value, *args,
+            streams=streams if streams else self.streams,
+            chunk_size=chunk_size if chunk_size else self.chunk_size,
+            stat_cache_ttl=self.stat_cache_ttl if stat_cache_ttl is None else stat_cache_ttl,
+            **kwargs)
+
 
 class RemoteObject(DomainObject):
     """ This is a class to interact with an SFTP server.
     """
 
-    def __init__(self, *args, keep_local=False, provider=None, **kwargs):
+    def __init__(self, *args, keep_local=False, provider=None, streams=4,
+                 chunk_size=32 * 1024 * 1024, stat_cache_ttl=60, **kwargs):
         super(RemoteObject, self).__init__(*args, keep_local=keep_local, provider=provider, **kwargs)
 
+        # downloads are split into parts of chunk_size bytes that are fetched
+        # by up to streams connections at the same time; the attributes of
+        # all files in a remote directory are fetched at once and kept for
+        # stat_cache_ttl seconds
+        self.streams = streams
+        self.chunk_size = chunk_size
+        self.stat_cache_ttl = stat_cache_ttl
+
     # === Implementations of abstract class members ===
 
-    @contextmanager #makes this a context manager. after 'yield' is __exit__()
-    def sftpc(self):
+    def _connection_args(self):
         # if args have been provided to remote(), use them over those given to RemoteProvider()
         args_to_use = self.provider.args
         if len(self.args):
@@ -62,60 +174,171 @@ class RemoteObject(DomainObject):
             kwargs_to_use[k] = v
         for k,v in self.kwargs.items():
             kwargs_to_use[k] = v
+        return args_to_use, kwargs_to_use
 
-        conn = pysftp.Connection(*args_to_use, **kwargs_to_use)
-        yield conn
-        conn.close()
+    @property
+    def _connection_key(self):
+        args, kwargs = self._connection_args()
+        return (tuple(map(repr, args)),
+                tuple(sorted((k, repr(v)) for k, v in kwargs.items())))
+
+    @contextmanager #makes this a context manager. after 'yield' is __exit__()
+    def sftpc(self):
+        args, kwargs = self._connection_args()
+        with connection_pool.connection(
+                self._connection_key,
+                lambda: pysftp.Connection(*args, **kwargs)) as conn:
+            yield conn
+
+    def _lstat(self):
+        """ Return the attributes of the remote path (not following symlinks)
+            or None if it does not exist. The attributes of all files in its
+            directory are fetched with one listing and cached.
+        """
+        dirname, name = posixpath.split(self.remote_path)
+        key = (self._connection_key, dirname)
+        entries = listing_cache.get(key, self.stat_cache_ttl)
+        if entries is None:
+            with self.sftpc() as sftpc:
+                try:
+                    entries = {attr.filename: attr
+                               for attr in sftpc.listdir_attr(dirname or ".")}
+                except FileNotFoundError:
+                    entries = {}
+                except IOError:
+                    # the directory cannot be listed, look at the file alone
+                    try:
+                        return sftpc.lstat(self.remote_path)
+                    except FileNotFoundError:
+                        return None
+            listing_cache.put(key, entries)
+        return entries.get(name)
+
+    def _stat(self):
+        """ Return the attributes of the remote path (following symlinks) or
+            None if it does not exist.
+        """
+        attr = self._lstat()
+        if attr is not None and stat.S_ISLNK(attr.st_mode):
+            with self.sftpc() as sftpc:
+                try:
+                    return sftpc.stat(self.remote_path)
+                except FileNotFoundError:
+                    return None
+        return attr
 
     def exists(self):
         if self._matched_address:
-            with self.sftpc() as sftpc:
-                return sftpc.exists(self.remote_path)
-                if sftpc.exists(self.remote_path):
-                    return sftpc.isfile(self.remote_path)
-            return False
+            return self._stat() is not None
         else:
             raise SFTPFileException("The file cannot be parsed as an SFTP path in form 'host:port/path/to/file': %s" % self.local_file())
 
     def mtime(self):
         if self.exists():
-            with self.sftpc() as sftpc:
-                #As per local operation, don't follow symlinks when reporting mtime
-                attr = sftpc.lstat(self.remote_path)
-                return int(attr.st_mtime)
+            #As per local operation, don't follow symlinks when reporting mtime
+            return int(self._lstat().st_mtime)
         else:
             raise SFTPFileException("The file does not seem to exist remotely: %s" % self.local_file())
 
     def is_newer(self, time):
         """ Returns true of the file is newer than time, or if it is
             a symlink that points to a file newer than time. """
-        with self.sftpc() as sftpc:
-            return ( sftpc.stat( self.remote_path).st_mtime > time or
-                     sftpc.lstat(self.remote_path).st_mtime > time )
+        return ( self._stat().st_mtime > time or
+                 self._lstat().st_mtime > time )
 
     def size(self):
-        if self.exists():
-            with self.sftpc() as sftpc:
-                attr = sftpc.stat(self.remote_path)
-                return int(attr.st_size)
+        attr = self._stat()
+        if attr is not None:
+            return int(attr.st_size)
         else:
             return self._iofile.size_local
 
-    def download(self, make_dest_dirs=True):
+    def download(self, make_dest_dirs=True, local_path=None):
+        """ Download the file in parts with several connections at the same
+            time. The file is written to local_path + ".part" and the finished
+            parts are recorded in local_path + ".part.state", so that an
+            interrupted download is resumed if the remote file did not change.
+            local_path defaults to the local path of the remote file.
+        """
+        local_path = local_path or self.local_path
         with self.sftpc() as sftpc:
-            if self.exists():
-                # if the destination path does not exist
-                if make_dest_dirs:
-                    os.makedirs(os.path.dirname(self.local_path), exist_ok=True)
-
-                sftpc.get(remotepath=self.remote_path, localpath=self.local_path, preserve_mtime=True)
-                os.sync() # ensure flush to disk
-            else:
+            try:
+                attr = sftpc.stat(self.remote_path)
+            except FileNotFoundError:
                 raise SFTPFileException("The file does not seem to exist remotely: %s" % self.local_file())
 
+        # if the destination path does not exist
+        if make_dest_dirs:
+            os.makedirs(os.path.dirname(local_path) or ".", exist_ok=True)
+
+        size, chunk_size = attr.st_size, self.chunk_size
+        part_path = local_path + ".part"
+        state_path = part_path + ".state"
+        header = "{} {} {}\n".format(size, int(attr.st_mtime), chunk_size)
+        finished = set()
+        if os.path.exists(part_path) and os.path.exists(state_path):
+            with open(state_path) as state:
+                if state.readline() == header:
+                    # a part is only recorded once it is complete
+                    finished.update(int(line) for line in state
+                                    if line.endswith("\n"))
+        if not finished:
+            with open(state_path, "w") as state:
+                state.write(header)
+        parts = [i for i in range(-(-size // chunk_size)) if i not in finished]
+
+        fd = os.open(part_path, os.O_WRONLY | os.O_CREAT, 0o666)
+        try:
+            if not finished:
+                os.ftruncate(fd, 0)
+            os.ftruncate(fd, size)
+            self._download_parts(fd, parts, size, state_path)
+        finally:
+            os.close(fd)
+
+        os.utime(part_path, (attr.st_atime, attr.st_mtime))
+        os.rename(part_path, local_path)
+        os.remove(state_path)
+        os.sync() # ensure flush to disk
+
+    def _download_parts(self, fd, parts, size, state_path):
+        chunk_size = self.chunk_size
+        block_size = 1024 * 1024
+        state_lock = threading.Lock()
+
+        def download_part(i):
+            start = i * chunk_size
+            end = min(start + chunk_size, size)
+            blocks = [(offset, min(block_size, end - offset))
+                      for offset in range(start, end, block_size)]
+            with self.sftpc() as sftpc:
+                with sftpc.open(self.remote_path, "rb") as f:
+                    for (offset, length), data in zip(blocks, f.readv(blocks)):
+                        if len(data) != length:
+                            raise SFTPFileException("The file changed during download: %s" % self.local_file())
+                        os.pwrite(fd, data, offset)
+            os.fsync(fd)
+            with state_lock, open(state_path, "a") as state:
+                state.write("{}\n".format(i))
+
+        if not parts:
+            return
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=min(self.streams, len(parts))) as executor:
+            futures = [executor.submit(download_part, i) for i in parts]
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    future.result()
+            except:
+                for future in futures:
+                    future.cancel()
+                raise
+
     def upload(self):
         with self.sftpc() as sftpc:
             sftpc.put(localpath=self.local_path, remotepath=self.remote_path, confirm=True, preserve_mtime=True)
+        listing_cache.invalidate(
+            (self._connection_key, posixpath.dirname(self.remote_path)))
 
     @property
     def list(self):
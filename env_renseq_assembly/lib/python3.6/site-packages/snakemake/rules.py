@@ -13,7 +13,7 @@ from urllib.parse import urljoin
 
 from snakemake.io import IOFile, _IOFile, protected, temp, dynamic, Namedlist, AnnotatedString, contains_wildcard_constraints, update_wildcard_constraints
 from snakemake.io import expand, InputFiles, OutputFiles, Wildcards, Params, Log, Resources
-from snakemake.io import apply_wildcards, is_flagged, not_iterable, is_callable
+from snakemake.io import apply_wildcards, is_flagged, not_iterable, is_callable, _wildcard_regex
 from snakemake.exceptions import RuleException, IOFileException, WildcardError, InputFunctionException, WorkflowError
 from snakemake.logging import logger
 from snakemake.common import Mode
@@ -44,10 +44,12 @@ class Rule:
             self.temp_output = set()
             self.protected_output = set()
             self.touch_output = set()
+            self.pipe_output = set()
             self.subworkflow_input = dict()
             self.shadow_depth = None
             self.resources = dict(_cores=1, _nodes=1)
             self.priority = 0
+            self.group = None
             self._version = None
             self._log = Log()
             self._benchmark = None
@@ -78,10 +80,12 @@ class Rule:
             self.temp_output = set(other.temp_output)
             self.protected_output = set(other.protected_output)
             self.touch_output = set(other.touch_output)
+            self.pipe_output = set(other.pipe_output)
             self.subworkflow_input = dict(other.subworkflow_input)
             self.shadow_depth = other.shadow_depth
             self.resources = other.resources
             self.priority = other.priority
+            self.group = other.group
             self.version = other.version
             self._log = other._log
             self._benchmark = other._benchmark
@@ -108,8 +112,13 @@ class Rule:
             This is done by replacing all wildcard delimiters by `{{` or `}}`
             that are not in `wildcards.keys()`.
             """
-            # perform the partial expansion from f's string representation
-            s = str(f).replace('{', '{{').replace('}', '}}')
+            # perform the partial expansion from f's string representation,
+            # without the constraints of the wildcards to expand
+            s = _wildcard_regex.sub(
+                lambda match: "{{{}}}".format(match.group("name"))
+                if match.group("name") in wildcards else match.group(0),
+                str(f))
+            s = s.replace('{', '{{').replace('}', '}}')
             for key in wildcards.keys():
                 s = s.replace('{{{{{}}}}}'.format(key), '{{{}}}'.format(key))
             # build result
@@ -335,6 +344,11 @@ class Rule:
             if is_flagged(item, "touch"):
                 if output:
                     self.touch_output.add(_item)
+            if is_flagged(item, "pipe"):
+                if output:
+                    # removed like a temporary file once it has been read
+                    self.pipe_output.add(_item)
+                    self.temp_output.add(_item)
             if is_flagged(item, "dynamic"):
                 if output:
                     self.dynamic_output.add(_item)
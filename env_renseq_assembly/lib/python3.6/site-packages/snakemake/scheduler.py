@@ -6,13 +6,19 @@ __license__ = "MIT"
 import os, signal
 import threading
 import operator
+import heapq
+import time
 from functools import partial
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from itertools import chain, accumulate
 
 from snakemake.executors import DryrunExecutor, TouchExecutor, CPUExecutor
 from snakemake.executors import GenericClusterExecutor, SynchronousClusterExecutor, DRMAAExecutor
+from snakemake.executors import LSFExecutor
 
+from snakemake.exceptions import WorkflowError
+from snakemake.jobs import GroupJob
+from snakemake.io import release_pipe
 from snakemake.logging import logger
 
 
@@ -32,8 +38,11 @@ class JobScheduler:
                  cluster=None,
                  cluster_config=None,
                  cluster_sync=None,
+                 cluster_status=None,
+                 cluster_status_interval=30,
                  drmaa=None,
                  drmaa_log_dir=None,
+                 lsf=None,
                  jobname=None,
                  quiet=False,
                  printreason=False,
@@ -61,7 +70,7 @@ class JobScheduler:
 
         self.resources = dict(self.workflow.global_resources)
 
-        use_threads = force_use_threads or (os.name != "posix") or cluster or cluster_sync or drmaa
+        use_threads = force_use_threads or (os.name != "posix") or cluster or cluster_sync or drmaa or lsf is not None
         self._open_jobs = threading.Event()
         self._lock = threading.Lock()
 
@@ -75,7 +84,21 @@ class JobScheduler:
             print_progress=not self.quiet and not self.dryrun)
 
         self._local_executor = None
-        if dryrun:
+        if dryrun and lsf is not None:
+            # print the bsub commands
+            self._check_pipe_groups()
+            self._executor = LSFExecutor(
+                workflow, dag, None,
+                lsf_args=lsf,
+                dryrun=True,
+                cluster_config=cluster_config,
+                jobname=jobname,
+                printreason=printreason,
+                quiet=quiet,
+                printshellcmds=printshellcmds,
+                latency_wait=latency_wait)
+            self.job_reward = self.dryrun_job_reward
+        elif dryrun:
             self._executor = DryrunExecutor(workflow, dag,
                                             printreason=printreason,
                                             quiet=quiet,
@@ -88,8 +111,11 @@ class JobScheduler:
                                            quiet=quiet,
                                            printshellcmds=printshellcmds,
                                            latency_wait=latency_wait)
-        elif cluster or cluster_sync or (drmaa is not None):
+        elif cluster or cluster_sync or (drmaa is not None) or (lsf is not None):
+            self._check_pipe_groups()
             workers = min(max(1, sum(1 for _ in dag.local_needrun_jobs)), local_cores)
+            # the jobs of a pipe group need a worker each at the same time
+            workers = max([workers] + list(map(len, dag.pipe_groups)))
             self._local_executor = CPUExecutor(
                 workflow, dag, workers,
                 printreason=printreason,
@@ -99,12 +125,37 @@ class JobScheduler:
                 latency_wait=latency_wait,
                 benchmark_repeats=benchmark_repeats,
                 cores=local_cores)
-            if cluster or cluster_sync:
-                constructor = SynchronousClusterExecutor if cluster_sync \
-                              else GenericClusterExecutor
-                self._executor = constructor(
+            if cluster_sync:
+                self._executor = SynchronousClusterExecutor(
+                    workflow, dag, None,
+                    submitcmd=cluster_sync,
+                    cluster_config=cluster_config,
+                    jobname=jobname,
+                    printreason=printreason,
+                    quiet=quiet,
+                    printshellcmds=printshellcmds,
+                    latency_wait=latency_wait,
+                    benchmark_repeats=benchmark_repeats,
+                    max_jobs_per_second=max_jobs_per_second)
+            elif cluster:
+                self._executor = GenericClusterExecutor(
+                    workflow, dag, None,
+                    submitcmd=cluster,
+                    statuscmd=cluster_status,
+                    status_interval=cluster_status_interval,
+                    cluster_config=cluster_config,
+                    jobname=jobname,
+                    printreason=printreason,
+                    quiet=quiet,
+                    printshellcmds=printshellcmds,
+                    latency_wait=latency_wait,
+                    benchmark_repeats=benchmark_repeats,
+                    max_jobs_per_second=max_jobs_per_second)
+            elif lsf is not None:
+                self._executor = LSFExecutor(
                     workflow, dag, None,
-                    submitcmd=(cluster or cluster_sync),
+                    lsf_args=lsf,
+                    status_interval=cluster_status_interval,
                     cluster_config=cluster_config,
                     jobname=jobname,
                     printreason=printreason,
@@ -113,12 +164,6 @@ class JobScheduler:
                     latency_wait=latency_wait,
                     benchmark_repeats=benchmark_repeats,
                     max_jobs_per_second=max_jobs_per_second)
-                if workflow.immediate_submit:
-                    self.job_reward = self.dryrun_job_reward
-                    self._submit_callback = partial(self._proceed,
-                                                    update_dynamic=False,
-                                                    print_progress=False,
-                                                    update_resources=False, )
             else:
                 self._executor = DRMAAExecutor(
                     workflow, dag, None,
@@ -132,12 +177,28 @@ class JobScheduler:
                     benchmark_repeats=benchmark_repeats,
                     cluster_config=cluster_config,
                     max_jobs_per_second=max_jobs_per_second)
+            if cluster_sync and workflow.immediate_submit:
+                self.job_reward = self.dryrun_job_reward
+                self._submit_callback = partial(self._proceed,
+                                                update_dynamic=False,
+                                                print_progress=False,
+                                                update_resources=False, )
+            elif (cluster or lsf is not None) and workflow.immediate_submit:
+                # a job is finished once it has been submitted, the cluster
+                # takes care of the dependencies
+                self.job_reward = self.dryrun_job_reward
+                self._submit_callback = partial(self._proceed,
+                                                update_dynamic=False,
+                                                print_progress=False,
+                                                handle_job_success=False)
         else:
             # local execution or execution of cluster job
             # calculate how many parallel workers the executor shall spawn
             # each job has at least one thread, hence we need to have
             # the minimum of given cores and number of jobs
             workers = min(cores, max(1, len(dag)))
+            # the jobs of a pipe group need a worker each at the same time
+            workers = max([workers] + list(map(len, dag.pipe_groups)))
             self._executor = CPUExecutor(workflow, dag, workers,
                                          printreason=printreason,
                                          quiet=quiet,
@@ -146,6 +207,16 @@ class JobScheduler:
                                          latency_wait=latency_wait,
                                          benchmark_repeats=benchmark_repeats,
                                          cores=cores)
+
+        # open jobs (ready candidates) in the order they became ready,
+        # maintained by DAG events instead of filtering the ready jobs
+        self._candidates = OrderedDict.fromkeys(
+            filter(self.candidate, dag.ready_jobs))
+        dag.add_ready_listener(self._ready_changed)
+        # resource usage and reward of open jobs, see job_selector
+        self._selection_cache = dict()
+        # completed jobs of running pipe groups and whether they succeeded
+        self._group_results = dict()
         self._open_jobs.set()
 
     @property
@@ -161,10 +232,19 @@ class JobScheduler:
                 (self.dryrun or
                  (not job.dynamic_input and not self.dag.dynamic(job))))
 
+    def _ready_changed(self, job, ready):
+        """ Update the open jobs when a job becomes (or is no longer) ready. """
+        if not ready:
+            self._candidates.pop(job, None)
+            self._selection_cache.pop(job, None)
+            self._selection_cache.pop(self._group(job), None)
+        elif self.candidate(job):
+            self._candidates[job] = None
+
     @property
     def open_jobs(self):
         """ Return open jobs. """
-        return filter(self.candidate, list(self.dag.ready_jobs))
+        return list(self._candidates)
 
     def schedule(self):
         """ Schedule jobs that are ready, maximizing cpu usage. """
@@ -176,7 +256,7 @@ class JobScheduler:
 
                 # obtain needrun and running jobs in a thread-safe way
                 with self._lock:
-                    needrun = list(self.open_jobs)
+                    needrun = self.open_jobs
                     running = list(self.running)
                 # free the event
                 self._open_jobs.clear()
@@ -206,18 +286,24 @@ class JobScheduler:
                 logger.debug("Ready jobs ({}):\n\t".format(len(needrun)) +
                              "\n\t".join(map(str, needrun)))
 
-                # select jobs by solving knapsack problem
-                run = self.job_selector(needrun)
+                # select jobs by solving knapsack problem, groups as a whole
+                with self._lock:
+                    needrun = self._groups_of(needrun)
+                run = list(chain.from_iterable(
+                    job if isinstance(job, (tuple, GroupJob)) else (job, )
+                    for job in self.job_selector(needrun)))
                 logger.debug("Selected jobs ({}):\n\t".format(len(run)) +
                              "\n\t".join(map(str, run)))
                 # update running jobs
                 with self._lock:
                     self.running.update(run)
+                    for job in run:
+                        self._candidates.pop(job, None)
+                        self._selection_cache.pop(job, None)
                 logger.debug(
                     "Resources after job selection: {}".format(self.resources))
                 # actually run jobs
-                for job in run:
-                    self.run(job)
+                self.run(run)
         except (KeyboardInterrupt, SystemExit):
             logger.info("Terminating processes on user request.")
             self._executor.cancel()
@@ -234,44 +320,138 @@ class JobScheduler:
             return self._local_executor if self.workflow.is_local(
                 job.rule) else self._executor
 
-    def run(self, job):
-        self.get_executor(job).run(job,
-            callback=self._finish_callback,
-            submit_callback=self._submit_callback,
-            error_callback=self._error)
+    def _group(self, job):
+        """ Return the jobs that are selected and completed together with a
+        job: the GroupJob that it is submitted with or its pipe group (a tuple
+        of jobs), None if there are none. """
+        return self.dag.job_group(job) or self.dag.pipe_group(job)
+
+    def _groups_of(self, jobs):
+        """ Replace the jobs of each group (see _group) by the group if all of
+        them are open, otherwise leave them out. """
+        result = []
+        for job in jobs:
+            group = self._group(job)
+            if group is None:
+                result.append(job)
+            elif job is group[0] and all(job_ in self._candidates
+                                         for job_ in group):
+                result.append(group)
+        return result
+
+    def run(self, jobs):
+        # pass the jobs of each executor at once, e.g. for array jobs
+        executors = OrderedDict()
+        for job in jobs:
+            executors.setdefault(self.get_executor(job), list()).append(job)
+        for executor, jobs_ in executors.items():
+            executor.run_jobs(jobs_,
+                              callback=self._finish_callback,
+                              submit_callback=self._submit_callback,
+                              error_callback=self._error)
+
+    def _check_pipe_groups(self):
+        for group in self.dag.pipe_groups:
+            if self.dag.job_group(group[0]) is not None:
+                # submitted together
+                continue
+            if not all(self.workflow.is_local(job.rule) for job in group):
+                raise WorkflowError(
+                    "Jobs connected by pipe() output files have to run "
+                    "on the same machine. Declare the rules {} as "
+                    "localrules or give them the same group to use them "
+                    "with cluster execution.".format(", ".join(
+                        sorted(set(job.rule.name for job in group)))))
 
     def _noop(self, job):
         pass
 
     def _free_resources(self, job):
-        for name, value in job.resources.items():
-            if name in self.resources:
-                value = self.calc_resource(name, value)
-                self.resources[name] += value
-                logger.debug("Releasing {} {} (now {}).".format(
-                    value, name, self.resources[name]))
+        for name, value in zip(self.workflow.global_resources,
+                               self.job_weight(job)):
+            self.resources[name] += value
+            logger.debug("Releasing {} {} (now {}).".format(
+                value, name, self.resources[name]))
+
+    def _group_completed(self, job, success):
+        """ Record that a job of a group (see _group) has completed. Return
+        None if other jobs of its group are still running, otherwise whether
+        all jobs of the group succeeded. """
+        group = self._group(job)
+        results = self._group_results.setdefault(group, dict())
+        if not success and all(results.values()) and isinstance(group, tuple):
+            # the first failure of a pipe group running here, don't leave the
+            # other jobs waiting
+            threading.Thread(target=self._release_pipes, args=(group, ),
+                             daemon=True).start()
+        results[job] = success
+        if len(results) < len(group):
+            return None
+        del self._group_results[group]
+        return all(results.values())
+
+    def _release_pipes(self, group):
+        """ Unblock the jobs of a failed pipe group that wait for the other
+        end of a pipe, until all of them have completed. """
+        while any(job in self.running for job in group):
+            for job in group:
+                for f in job.pipe_output:
+                    release_pipe(f)
+            time.sleep(0.5)
 
     def _proceed(self, job,
                  update_dynamic=True,
                  print_progress=False,
-                 update_resources=True):
+                 update_resources=True,
+                 handle_job_success=True):
         """ Do stuff after job is finished. """
+        if handle_job_success:
+            # outside of the lock, e.g. hashing input files may take long
+            self.get_executor(job).prepare_job_success(job)
         with self._lock:
+            group = self._group(job)
+            if group is not None:
+                success = self._group_completed(job, True)
+                if success is None:
+                    # wait for the other jobs of the pipe group
+                    return
+                if not success:
+                    self._handle_errors(group)
+                    return
+            jobs = group or (job, )
             # by calling this behind the lock, we avoid race conditions
-            self.get_executor(job).handle_job_success(job)
-            self.dag.finish(job, update_dynamic=update_dynamic)
-
+            try:
+                for job_ in jobs:
+                    if handle_job_success:
+                        self.get_executor(job_).handle_job_success(job_)
+            except BaseException:
+                if group is not None:
+                    # the group fails as a whole, see _error
+                    self._group_results[group] = {
+                        job_: False for job_ in group if job_ is not job}
+                raise
+            for job_ in jobs:
+                self.dag.finish(job_, update_dynamic=update_dynamic)
+                if update_dynamic and job_.dynamic_output:
+                    # the DAG has been postprocessed, rewards may have changed
+                    self._selection_cache.clear()
+
+                if update_resources:
+                    self.finished_jobs += 1
+                    self.running.remove(job_)
+
+                if print_progress:
+                    logger.job_finished(jobid=self.dag.jobid(job_))
+                    self.progress()
+            if handle_job_success and group is not None:
+                # only now the other jobs of the group do not need the temp
+                # files anymore
+                for job_ in jobs:
+                    self.get_executor(job_).handle_temp(job_)
             if update_resources:
-                self.finished_jobs += 1
-                self.running.remove(job)
-                self._free_resources(job)
-
-
-            if print_progress:
-                logger.job_finished(jobid=self.dag.jobid(job))
-                self.progress()
+                self._free_resources(jobs)
 
-            if any(self.open_jobs) or not self.running:
+            if self._candidates or not self.running:
                 # go on scheduling if open jobs are ready or no job is running
                 self._open_jobs.set()
 
@@ -281,12 +461,30 @@ class JobScheduler:
         If Snakemake is configured to restart jobs then the job might have
         "restart_times" left and we just decrement and let the scheduler
         try to run the job again.
+
+        The jobs of a group (see _group) fail together, once all of them
+        have completed, and are only restarted together.
         """
         with self._lock:
+            group = self._group(job)
+            if group is not None:
+                if self._group_completed(job, False) is None:
+                    # wait for the other jobs of the group
+                    return
+                self._handle_errors(group)
+            else:
+                self._handle_errors((job, ))
+
+    def _handle_errors(self, jobs):
+        if min(job.restart_times for job in jobs) == 0:
+            for job in jobs:
+                job.restart_times = 0
+        for job in jobs:
             self.get_executor(job).handle_job_error(job)
             self.running.remove(job)
-            self._free_resources(job)
-            self._open_jobs.set()
+        self._free_resources(jobs)
+        self._open_jobs.set()
+        for job in jobs:
             if job.restart_times > 0:
                 msg = (
                     ("Trying to restart job for rule {} with "
@@ -295,6 +493,8 @@ class JobScheduler:
                 logger.info(msg
                     )
                 job.restart_times -= 1
+                if self.dag.ready(job):
+                    self._candidates[job] = None
             else:
                 self._errors = True
                 self.failed.add(job)
@@ -307,50 +507,52 @@ class JobScheduler:
         "A Greedy Algorithm for the General Multidimensional Knapsack
 Problem", Akcay, Li, Xu, Annals of Operations Research, 2012
 
+        Each job is an item with one copy (0-1 MDKP), hence its effective
+        capacity is 1 if it fits into the remaining resources and 0
+        otherwise, and the heuristic repeatedly selects the job with the
+        highest reward among those that fit. Since the capacities only
+        decrease, a job that does not fit will never fit later on. Therefore
+        the jobs are taken from a heap ordered by reward (ties broken by
+        their position in jobs) and selected if they fit, until no job can
+        fit anymore. The resource usage and rewards of open jobs are cached
+        between calls.
+
+        A pipe group (a tuple of jobs) is an item that needs the combined
+        resources of its jobs, a GroupJob one that needs the resources of
+        the group.
+
         Args:
-            jobs (list):    list of jobs
+            jobs (list):    list of jobs, pipe groups and GroupJobs
         """
         with self._lock:
-            # each job is an item with one copy (0-1 MDKP)
-            n = len(jobs)
-            x = [0] * n  # selected jobs
-            E = set(range(n))  # jobs still free to select
-            u = [1] * n
-            a = list(map(self.job_weight, jobs))  # resource usage of jobs
-            c = list(map(self.job_reward, jobs))  # job rewards
-
-            def calc_reward():
-                return [c_j * y_j for c_j, y_j in zip(c, y)]
-
+            cache = self._selection_cache
+            for job in jobs:
+                if job not in cache:
+                    # negated reward, for a max-heap
+                    cache[job] = (self.job_weight(job),
+                                  tuple(-c_k for c_k in self._reward(job)))
+            a = [cache[job][0] for job in jobs]  # resource usage of jobs
             b = [self.resources[name]
                  for name in self.workflow.global_resources
                  ]  # resource capacities
+            # no job fits anymore once a capacity is below this usage
+            a_min = [min(a_i) for a_i in zip(*a)]
 
-            while True:
-                # Step 2: compute effective capacities
-                y = [(min((min(u[j], b_i // a_j_i) if a_j_i > 0 else u[j])
-                          for b_i, a_j_i in zip(b, a[j]) if a_j_i) if j in E
-                      else 0) for j in range(n)]
-                if not any(y):
-                    break
-                y = [(max(1, int(self.greediness * y_j)) if y_j > 0 else 0)
-                     for y_j in y]
-
-                # Step 3: compute rewards on cumulative sums
-                reward = calc_reward()
-                j_sel = max(E, key=reward.__getitem__)  # argmax
-
-                # Step 4: batch increment
-                y_sel = y[j_sel]
-
-                # Step 5: update information
-                x[j_sel] += y_sel
-                b = [b_i - (a_j_i * y_sel) for b_i, a_j_i in zip(b, a[j_sel])]
-                u[j_sel] -= y_sel
-                if not u[j_sel] or self.greediness == 1:
-                    E.remove(j_sel)
-                if not E:
-                    break
+            # max-heap of the job rewards
+            heap = [(cache[job][1], j) for j, job in enumerate(jobs)]
+            heapq.heapify(heap)
+
+            def exhausted():
+                return any(b_i < a_min_i for b_i, a_min_i in zip(b, a_min)
+                           if a_min_i)
+
+            x = [0] * len(jobs)  # selected jobs
+            while heap and not exhausted():
+                _, j = heapq.heappop(heap)
+                a_j = a[j]
+                if all(a_j_i <= b_i for b_i, a_j_i in zip(b, a_j) if a_j_i):
+                    x[j] = 1
+                    b = [b_i - a_j_i for b_i, a_j_i in zip(b, a_j)]
 
             solution = [job for job, sel in zip(jobs, x) if sel]
             # update resources
@@ -367,6 +569,11 @@ Problem", Akcay, Li, Xu, Annals of Operations Research, 2012
                 for name in self.workflow.global_resources]
 
     def job_weight(self, job):
+        if isinstance(job, tuple):
+            # a pipe group, its jobs run at the same time
+            return [self.calc_resource(name, sum(values))
+                    for name, values in zip(self.workflow.global_resources,
+                                            zip(*map(self.job_weight, job)))]
         res = job.resources
         return [self.calc_resource(name, res.get(name, 0))
                 for name in self.workflow.global_resources]
@@ -378,6 +585,12 @@ Problem", Akcay, Li, Xu, Annals of Operations Research, 2012
     def dryrun_job_reward(self, job):
         return (self.dag.priority(job), self.dag.temp_input_count(job), self.dag.downstream_size(job))
 
+    def _reward(self, job):
+        if isinstance(job, (tuple, GroupJob)):
+            # a group, as rewarding as its most rewarding job
+            return tuple(map(max, zip(*map(self.job_reward, job))))
+        return self.job_reward(job)
+
     def progress(self):
         """ Display the progress. """
         logger.progress(done=self.finished_jobs, total=len(self.dag))
@@ -78,10 +78,13 @@ class shell:
         elif async:
             return proc
         if bench_record is not None:
-            from snakemake.benchmark import benchmarked
+            from snakemake.benchmark import benchmarked, wait_for_process
             # Note: benchmarking does not work in case of async=True
             with benchmarked(proc.pid, bench_record):
-                retcode = proc.wait()
+                retcode, rusage = wait_for_process(proc)
+            if rusage is not None:
+                # exact totals, including anything missed between samples
+                bench_record.update_from_rusage(rusage)
         else:
             retcode = proc.wait()
         if retcode:
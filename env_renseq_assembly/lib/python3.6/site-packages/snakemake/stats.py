@@ -17,6 +17,7 @@ class Stats:
     def __init__(self):
         self.starttime = dict()
         self.endtime = dict()
+        self.output_wait = dict()
 
     def report_job_start(self, job):
         self.starttime[job] = time.time()
@@ -24,6 +25,10 @@ class Stats:
     def report_job_end(self, job):
         self.endtime[job] = time.time()
 
+    def report_output_wait(self, job, seconds):
+        """Report how long the output files of a finished job were missing."""
+        self.output_wait[job] = seconds
+
     @property
     def rule_stats(self):
         runtimes = defaultdict(list)
@@ -33,6 +38,31 @@ class Stats:
             yield (rule, sum(runtimes) / len(runtimes), min(runtimes),
                    max(runtimes))
 
+    @property
+    def rule_wait_stats(self):
+        """For each rule, yield the number of jobs, the number of jobs whose
+        output had to be waited for and the mean and maximum waiting time."""
+        waits = defaultdict(list)
+        for job, t in self.output_wait.items():
+            waits[job.rule].append(t)
+        for rule, waits in waits.items():
+            yield (rule, len(waits), sum(1 for t in waits if t > 0),
+                   sum(waits) / len(waits), max(waits))
+
+    def wait_report(self):
+        """Return a summary of the waiting for output files per rule, e.g. to
+        choose --latency-wait, or None if no output had to be waited for."""
+        lines = ["Waiting for output files (filesystem latency):",
+                 "rule\tjobs\twaited\tmean (s)\tmax (s)"]
+        for rule, n, n_waited, mean_wait, max_wait in sorted(
+                self.rule_wait_stats, key=lambda item: item[0].name):
+            if n_waited:
+                lines.append("{}\t{}\t{}\t{:.2f}\t{:.2f}".format(
+                    rule.name, n, n_waited, mean_wait, max_wait))
+        if len(lines) == 2:
+            return None
+        return "\n".join(lines)
+
     @property
     def file_stats(self):
         for job, t in self.starttime.items():
@@ -56,6 +86,12 @@ class Stats:
             }
             for rule, mean_runtime, min_runtime, max_runtime in self.rule_stats
         }
+        for rule, n, n_waited, mean_wait, max_wait in self.rule_wait_stats:
+            rule_stats.setdefault(rule.name, dict()).update({
+                "waited-for-output": n_waited,
+                "mean-output-wait": mean_wait,
+                "max-output-wait": max_wait
+            })
         file_stats = {
             f: {
                 "start-time": start,
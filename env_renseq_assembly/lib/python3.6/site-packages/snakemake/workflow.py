@@ -24,7 +24,8 @@ from snakemake.dag import DAG
 from snakemake.scheduler import JobScheduler
 from snakemake.parser import parse
 import snakemake.io
-from snakemake.io import protected, temp, temporary, ancient, expand, dynamic, glob_wildcards, flag, not_iterable, touch, unpack
+from snakemake.io import protected, temp, temporary, ancient, expand, dynamic, glob_wildcards, flag, not_iterable, touch, unpack, pipe
+from snakemake.io import stat_cache
 from snakemake.persistence import Persistence
 from snakemake.utils import update_config
 from snakemake.script import script
@@ -46,6 +47,11 @@ class Workflow:
                  debug=False,
                  use_conda=False,
                  conda_prefix=None,
+                 persistence_backend="files",
+                 persistence_db=None,
+                 rerun_checksums=False,
+                 benchmark_extended=False,
+                 benchmark_timeseries=False,
                  mode=Mode.default,
                  wrapper_prefix=None,
                  printshellcmds=False,
@@ -87,6 +93,11 @@ class Workflow:
         self._rulecount = 0
         self.use_conda = use_conda
         self.conda_prefix = conda_prefix
+        self.persistence_backend = persistence_backend
+        self.persistence_db = persistence_db
+        self.rerun_checksums = rerun_checksums
+        self.benchmark_extended = benchmark_extended
+        self.benchmark_timeseries = benchmark_timeseries
         self.mode = mode
         self.wrapper_prefix = wrapper_prefix
         self.printshellcmds = printshellcmds
@@ -201,6 +212,8 @@ class Workflow:
                 printdag=False,
                 cluster=None,
                 cluster_sync=None,
+                cluster_status=None,
+                cluster_status_interval=30,
                 jobname=None,
                 immediate_submit=False,
                 ignore_ambiguity=False,
@@ -208,6 +221,7 @@ class Workflow:
                 printd3dag=False,
                 drmaa=None,
                 drmaa_log_dir=None,
+                lsf=None,
                 stats=None,
                 force_incomplete=False,
                 ignore_incomplete=False,
@@ -315,12 +329,17 @@ class Workflow:
             force_incomplete=force_incomplete,
             ignore_incomplete=ignore_incomplete or printdag or printrulegraph,
             notemp=notemp,
-            keep_remote_local=keep_remote_local)
+            keep_remote_local=keep_remote_local,
+            group_jobs=bool(cluster or cluster_sync or drmaa is not None or
+                            lsf is not None))
 
         self.persistence = Persistence(
             nolock=nolock,
             dag=dag,
             conda_prefix=self.conda_prefix,
+            backend=self.persistence_backend,
+            db_path=self.persistence_db,
+            checksums=self.rerun_checksums,
             warn_only=dryrun or printrulegraph or printdag or summary or archive or
             list_version_changes or list_code_changes or list_input_changes or
             list_params_changes)
@@ -381,6 +400,9 @@ class Workflow:
                 logger.info("Executing main workflow.")
             # rescue globals
             self.globals.update(globals_backup)
+            # the subworkflows have changed files and used their own
+            # working directories
+            stat_cache.enable()
 
         dag.check_incomplete()
         dag.postprocess()
@@ -456,12 +478,15 @@ class Workflow:
                                  cluster=cluster,
                                  cluster_config=cluster_config,
                                  cluster_sync=cluster_sync,
+                                 cluster_status=cluster_status,
+                                 cluster_status_interval=cluster_status_interval,
                                  jobname=jobname,
                                  max_jobs_per_second=max_jobs_per_second,
                                  quiet=quiet,
                                  keepgoing=keepgoing,
                                  drmaa=drmaa,
                                  drmaa_log_dir=drmaa_log_dir,
+                                 lsf=lsf,
                                  printreason=printreason,
                                  printshellcmds=printshellcmds,
                                  latency_wait=latency_wait,
@@ -471,7 +496,7 @@ class Workflow:
 
         if not dryrun:
             if len(dag):
-                if cluster or cluster_sync or drmaa:
+                if cluster or cluster_sync or drmaa or lsf is not None:
                     logger.resources_info(
                         "Provided cluster nodes: {}".format(nodes))
                 else:
@@ -498,6 +523,11 @@ class Workflow:
             self._onstart(logger.get_logfile())
 
         success = scheduler.schedule()
+        logger.debug(stat_cache.report())
+        if not dryrun:
+            wait_report = scheduler.stats.wait_report()
+            if wait_report:
+                logger.info(wait_report)
 
         if success:
             if dryrun:
@@ -653,6 +683,11 @@ class Workflow:
                     raise RuleException("Priority values have to be numeric.",
                                         rule=rule)
                 rule.priority = ruleinfo.priority
+            if ruleinfo.group:
+                if not isinstance(ruleinfo.group, str):
+                    raise RuleException("Group names have to be strings.",
+                                        rule=rule)
+                rule.group = ruleinfo.group
             if ruleinfo.version:
                 rule.version = ruleinfo.version
             if ruleinfo.log:
@@ -770,6 +805,13 @@ class Workflow:
 
         return decorate
 
+    def group(self, group):
+        def decorate(ruleinfo):
+            ruleinfo.group = group
+            return ruleinfo
+
+        return decorate
+
     def version(self, version):
         def decorate(ruleinfo):
             ruleinfo.version = version
@@ -836,6 +878,7 @@ class RuleInfo:
         self.shadow_depth = None
         self.resources = None
         self.priority = None
+        self.group = None
         self.version = None
         self.log = None
         self.docstring = None
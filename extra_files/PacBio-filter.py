@@ -1,28 +1,257 @@
 #!/usr/bin/env python
-#python-2.7.9
-#biopython-1.66
+#python-3.6
+#biopython-1.78 (only needed for --engine biopython)
 
+"""
+Remove reads that BLASR still found adapter hits in from a FASTA file.
+
+The default engine scans the FASTA file as raw bytes in large chunks that
+end on record boundaries, decides keep/drop from the header ID alone and
+copies kept records to the output unchanged. No SeqRecord is ever built
+and memory use is bounded by the chunk size plus the exclusion set.
+
+The original Biopython implementation is kept as --engine biopython so
+that both paths can be benchmarked against each other:
+
+    python extra_files/PacBio-filter.py --engine native IN.fasta IN.m4 OUT.fasta
+    python extra_files/PacBio-filter.py --engine biopython IN.fasta IN.m4 OUT.fasta
+
+Both print the number of records processed and the records/s reached.
+
+With --threads N (native engine only) the input is split into
+record-aligned byte ranges that N worker processes filter independently
+against the exclusion set inherited from the parent; kept records are
+written back in input order.
+
+The exclusion set is a compact m4index.ReadIdIndex. It is built from the
+m4 file, or loaded directly if exclude_file is an index saved by
+"m4index.py build".
+"""
+
+import argparse
+import multiprocessing
+import os
 import sys
-from Bio import SeqIO
+import time
+
+from m4index import load_exclusion_index
+
+BUFFER_SIZE = 4 * 1024**2
+RANGE_SIZE = 16 * 1024**2
+
+# Set in the parent before the worker pool is forked so that the workers
+# share the (read-only) exclusion set instead of receiving a pickled copy.
+_worker_fasta_file = None
+_worker_wanted = None
+
+
+def find_fasta_record_end(buf, end):
+    """
+    Return the offset just past the last complete FASTA record in buf[:end].
+    """
+    pos = buf.rfind(b'\n>', 0, end)
+    if pos != -1:
+        return pos + 1
+    if buf[0:1] == b'>':
+        return 0
+    raise ValueError('FASTA does not start with ">"')
+
+
+def read_chunks(f, buffer_size=BUFFER_SIZE):
+    """
+    Yield chunks of complete FASTA records read from binary file f.
+
+    Each chunk is at most buffer_size bytes unless a single record is
+    larger, in which case the buffer is grown to hold it.
+    """
+    buf = bytearray(buffer_size)
+    start = 0
+    while True:
+        if start == len(buf):
+            # A single record does not fit; CCS reads can be long.
+            buf.extend(bytearray(len(buf)))
+        bufend = f.readinto(memoryview(buf)[start:]) + start
+        if start == bufend:
+            break
+        end = find_fasta_record_end(buf, bufend)
+        if end > 0:
+            yield bytes(buf[0:end])
+        start = bufend - end
+        buf[0:start] = buf[end:bufend]
+    if start > 0:
+        yield bytes(buf[0:start])
+
+
+def filter_chunk(chunk, wanted):
+    """
+    Filter the FASTA records in chunk against the exclusion set wanted.
+
+    Return a tuple (kept, dropped, n) where kept is the list of byte slices
+    to write, dropped the list of excluded IDs and n the number of records.
+    """
+    kept = []
+    dropped = []
+    n = 0
+    pos = 0
+    end = len(chunk)
+    keep_from = 0
+    while pos < end:
+        nxt = chunk.find(b'\n>', pos)
+        nxt = end if nxt == -1 else nxt + 1
+        if chunk[pos:pos+1] != b'>':
+            # Leading blank lines or comments: copy through unchanged
+            pos = nxt
+            continue
+        n += 1
+        header_end = chunk.find(b'\n', pos, nxt)
+        if header_end == -1:
+            header_end = nxt
+        fields = chunk[pos+1:header_end].split(None, 1)
+        name = fields[0] if fields else b''
+        if name in wanted:
+            if keep_from < pos:
+                kept.append(chunk[keep_from:pos])
+            dropped.append(name)
+            keep_from = nxt
+        pos = nxt
+    if keep_from < end:
+        kept.append(chunk[keep_from:end])
+    return kept, dropped, n
+
+
+def filter_native(fasta_file, wanted, result_file, out=sys.stdout.buffer):
+    """Stream fasta_file to result_file, skipping records in wanted."""
+    total = 0
+    n_kept = 0
+    with open(fasta_file, 'rb') as f, open(result_file, 'wb') as g:
+        for chunk in read_chunks(f):
+            kept, dropped, n = filter_chunk(chunk, wanted)
+            g.writelines(kept)
+            if dropped:
+                out.write(b'\n'.join(dropped) + b'\n')
+            total += n
+            n_kept += n - len(dropped)
+    return total, n_kept
+
+
+def next_record_start(f, pos, size, block_size=64 * 1024):
+    """
+    Return the offset of the first FASTA record that starts at or after pos,
+    or size if there is none.
+    """
+    if pos <= 0:
+        return 0
+    # Start one byte early so that a '\n>' straddling pos is found
+    offset = pos - 1
+    while offset < size:
+        f.seek(offset)
+        block = f.read(block_size + 1)
+        i = block.find(b'\n>')
+        if i != -1:
+            return offset + i + 1
+        offset += block_size
+    return size
+
+
+def record_aligned_ranges(fasta_file, range_size=RANGE_SIZE):
+    """Split fasta_file into (start, end) byte ranges of complete records."""
+    size = os.path.getsize(fasta_file)
+    bounds = [0]
+    with open(fasta_file, 'rb') as f:
+        while bounds[-1] < size:
+            end = next_record_start(f, bounds[-1] + range_size, size)
+            if end <= bounds[-1]:
+                end = size
+            bounds.append(end)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _filter_range(byte_range):
+    start, end = byte_range
+    with open(_worker_fasta_file, 'rb') as f:
+        f.seek(start)
+        chunk = f.read(end - start)
+    kept, dropped, n = filter_chunk(chunk, _worker_wanted)
+    return b''.join(kept), dropped, n
+
+
+def filter_parallel(fasta_file, wanted, result_file, threads, out=sys.stdout.buffer):
+    """Like filter_native, but filter byte ranges in a pool of processes."""
+    global _worker_fasta_file, _worker_wanted
+    _worker_fasta_file = fasta_file
+    _worker_wanted = wanted
+    total = 0
+    n_kept = 0
+    ranges = record_aligned_ranges(fasta_file)
+    pool = multiprocessing.Pool(threads)
+    try:
+        with open(result_file, 'wb') as g:
+            # imap returns the results in input order
+            for kept, dropped, n in pool.imap(_filter_range, ranges):
+                g.write(kept)
+                if dropped:
+                    out.write(b'\n'.join(dropped) + b'\n')
+                total += n
+                n_kept += n - len(dropped)
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+    return total, n_kept
+
+
+def filter_biopython(fasta_file, wanted, result_file, out=sys.stdout.buffer):
+    """The original SeqIO based implementation, used as a baseline."""
+    from Bio import SeqIO
+
+    wanted = set(name.decode('ascii') for name in wanted)
+    total = 0
+    n_kept = 0
+    with open(fasta_file) as fasta, open(result_file, "w") as f:
+        for seq in SeqIO.parse(fasta, 'fasta'):
+            total += 1
+            if seq.id in wanted:
+                out.write(seq.id.encode('ascii') + b'\n')
+            else:
+                SeqIO.write([seq], f, "fasta")
+                n_kept += 1
+    return total, n_kept
+
+
+ENGINES = {
+    'native': filter_native,
+    'biopython': filter_biopython,
+}
 
-fasta_file=(sys.argv[1]) # 65bp trimmed cutadapt FASTA output file
-exclude_file=(sys.argv[2]) # BLASR m4 file highlighting reads still containing adapters
-result_file=(sys.argv[3]) # Output FASTA file
 
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('fasta_file', help='65bp trimmed cutadapt FASTA output file')
+    parser.add_argument('exclude_file', help='BLASR m4 file (or m4 index) highlighting reads still containing adapters')
+    parser.add_argument('result_file', help='Output FASTA file')
+    parser.add_argument('--engine', choices=sorted(ENGINES), default='native',
+        help='Filter implementation to use (default: %(default)s)')
+    parser.add_argument('-j', '--threads', type=int, default=1,
+        help='Number of worker processes for the native engine (default: %(default)s)')
+    args = parser.parse_args()
+    if args.threads < 1:
+        parser.error('--threads must be at least 1')
+    if args.threads > 1 and args.engine != 'native':
+        parser.error('--threads is only supported by the native engine')
 
-wanted = set()
+    start_time = time.time()
+    wanted = load_exclusion_index(args.exclude_file)
+    if args.threads > 1:
+        total, n_kept = filter_parallel(args.fasta_file, wanted, args.result_file, args.threads)
+    else:
+        total, n_kept = ENGINES[args.engine](args.fasta_file, wanted, args.result_file)
+    elapsed = max(time.time() - start_time, 1e-9)
 
-with open(exclude_file) as f:
-    for i in f:
-        i=i.split()
-        wanted.add(str(i[0]))
+    sys.stdout.flush()
+    print("Finished: {} records, {} kept, {} removed in {:.2f} s ({:.0f} records/s, engine {}, {} threads)".format(
+        total, n_kept, total - n_kept, elapsed, total / elapsed, args.engine, args.threads))
 
-fasta_sequences = SeqIO.parse(open(fasta_file),'fasta')
-with open(result_file, "w") as f:
-    for seq in fasta_sequences:
-        if seq.id in wanted:
-            print(seq.id)
-        else:
-            SeqIO.write([seq], f, "fasta")
 
-print("Finished")
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+#python-3.6
+
+"""
+Summarise benchmark time series (snakemake --benchmark-timeseries).
+
+Every row of a time series holds the RSS, CPU seconds and I/O of the whole
+job so far and the name of its process with the largest RSS. The interval
+since the previous row, and the CPU seconds and I/O of that interval, are
+attributed to that process. Per process name, the table shows when it was
+first and last the largest process, its time, CPU seconds, mean load and
+I/O, its own peak RSS and the peak RSS of the whole job while it was the
+largest process, so that the peaks of e.g. the phases of canu (meryl,
+overlapInCore, bogart, utgcns) can be told apart. Memory and I/O are in
+MB, times are relative to the first row of the file:
+
+    python extra_files/benchmark_summary.py benchmarks/canu/*.timeseries.tsv
+    python extra_files/benchmark_summary.py --max-memory 32 benchmarks/canu/A.timeseries.tsv
+
+With --max-memory (in GB, as canu's maxMemory), processes during which the
+job exceeded it are marked with "*".
+"""
+
+import argparse
+import csv
+import datetime
+import sys
+from collections import OrderedDict
+
+
+class Phase(object):
+    def __init__(self, name, start):
+        self.name = name
+        self.first = start
+        self.last = start
+        self.seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.io_in = 0.0
+        self.io_out = 0.0
+        self.max_rss = 0.0
+        self.max_top_rss = 0.0
+
+
+def read_timeseries(path):
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f, delimiter='\t'):
+            yield row
+
+
+def summarise(rows):
+    """Return the phases per process name (in order of appearance), the peak
+    RSS of the job and the time of the peak."""
+    phases = OrderedDict()
+    start = previous = None
+    peak_rss, peak_time = 0.0, 0.0
+    for row in rows:
+        timestamp = float(row['timestamp'])
+        if start is None:
+            start = timestamp
+        if previous is not None and previous['repeat'] != row['repeat']:
+            previous = None
+        elapsed = timestamp - start
+        name = row['top_process']
+        phase = phases.get(name)
+        if phase is None:
+            phase = phases[name] = Phase(name, elapsed)
+        phase.last = elapsed
+        rss = float(row['rss'])
+        phase.max_rss = max(phase.max_rss, rss)
+        phase.max_top_rss = max(phase.max_top_rss, float(row['top_rss']))
+        if previous is not None:
+            phase.seconds += timestamp - float(previous['timestamp'])
+            # the counters of terminated processes may be missing until their
+            # parent has waited for them
+            for key in ('cpu_seconds', 'io_in', 'io_out'):
+                delta = float(row[key]) - float(previous[key])
+                setattr(phase, key, getattr(phase, key) + max(0.0, delta))
+        if rss > peak_rss:
+            peak_rss, peak_time = rss, elapsed
+        previous = row
+    return list(phases.values()), peak_rss, peak_time
+
+
+def hms(seconds):
+    return str(datetime.timedelta(seconds=int(seconds)))
+
+
+def print_summary(path, max_memory=None):
+    phases, peak_rss, peak_time = summarise(read_timeseries(path))
+    print(path)
+    if not phases:
+        print('  no measurements')
+        return
+    limit = None if max_memory is None else max_memory * 1024
+    print('  {:<16} {:>9} {:>9} {:>9} {:>10} {:>6} {:>10} {:>10} {:>10} {:>10}'.format(
+        'process', 'first', 'last', 'time', 'cpu (s)', 'load', 'io_in',
+        'io_out', 'own rss', 'job rss'))
+    for phase in phases:
+        load = 100 * phase.cpu_seconds / phase.seconds if phase.seconds else 0
+        mark = '*' if limit is not None and phase.max_rss > limit else ''
+        print('  {:<16} {:>9} {:>9} {:>9} {:>10.0f} {:>6.0f} {:>10.0f} {:>10.0f} {:>10.0f} {:>10.0f}{}'.format(
+            phase.name, hms(phase.first), hms(phase.last), hms(phase.seconds),
+            phase.cpu_seconds, load, phase.io_in, phase.io_out,
+            phase.max_top_rss, phase.max_rss, mark))
+    peak = max(phases, key=lambda phase: phase.max_rss)
+    print('  peak rss {:.0f} MB at {} during {}'.format(peak_rss,
+        hms(peak_time), peak.name))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('timeseries', nargs='+',
+        help='Time series files (*.timeseries.tsv)')
+    parser.add_argument('--max-memory', type=float, metavar='GB',
+        help='Mark processes during which the job RSS exceeded this')
+    args = parser.parse_args()
+    for path in args.timeseries:
+        print_summary(path, args.max_memory)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+#python-3.6
+
+"""
+Check how snakemake --cluster follows its jobs, with stand-ins for the
+submission and status commands of a cluster (extra_files/fake_cluster).
+
+fake_cluster/submit.sh runs a jobscript in the background on this host and
+prints a job id, fake_cluster/status.sh prints the states of the given jobs
+like bjobs -noheader -o "jobid stat". A small workflow of four jobs, one of
+which can be made to fail, is run in a temporary directory to check that
+
+    success  -- all jobs finish, with status calls about several jobs
+    failed   -- a failed job is reported and the others still finish
+    markers  -- the marker files of the jobs are used when the status
+                command fails, knows no job or is not given
+    group    -- the temp files that the jobs of a group pass to each other
+                are removed once the group is finished
+
+The snakemake package that is importable (e.g. via PYTHONPATH) is used.
+The exit status is 1 if a check fails:
+
+    python extra_files/cluster_check.py
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+FAKE_CLUSTER = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "fake_cluster")
+
+WORKFLOW = """
+rule all:
+    input: expand("out/{i}.txt", i=range(4))
+
+rule a:
+    output: "out/{i}.txt"
+    shell: "sleep {wildcards.i}; test {wildcards.i} != \\"${{FAIL:-}}\\"; echo {wildcards.i} > {output}"
+"""
+
+GROUP_WORKFLOW = """
+rule all:
+    input: expand("out/{i}.{x}", i=range(2), x=["b", "c"])
+
+rule a:
+    output: temp("tmp/{i}.txt")
+    group: "g"
+    shell: "echo {wildcards.i} > {output}"
+
+rule b:
+    input: "tmp/{i}.txt"
+    output: "out/{i}.b"
+    group: "g"
+    shell: "cat {input} > {output}"
+
+rule c:
+    input: "tmp/{i}.txt"
+    output: "out/{i}.c"
+    group: "g"
+    shell: "cat {input} > {output}"
+"""
+
+
+def run(tmp, name, *args, workflow=WORKFLOW, **env):
+    """Run the workflow in a new directory below tmp with the fake cluster.
+    Return the exit status, the output of snakemake and the calls of the
+    fake cluster commands."""
+    workdir = os.path.join(tmp, name)
+    os.makedirs(workdir)
+    with open(os.path.join(workdir, "Snakefile"), "w") as f:
+        f.write(workflow)
+    env = dict(os.environ, FAKE_CLUSTER=os.path.join(workdir, "cluster"), **env)
+    os.makedirs(env["FAKE_CLUSTER"])
+    process = subprocess.run(
+        [sys.executable, "-m", "snakemake", "-j4", "--cluster",
+         os.path.join(FAKE_CLUSTER, "submit.sh")] + list(args),
+        cwd=workdir, env=env, stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT, timeout=300)
+    with open(os.path.join(env["FAKE_CLUSTER"], "calls")) as f:
+        calls = [line.split() for line in f]
+    out = os.path.join(workdir, "out")
+    outputs = sorted(os.listdir(out)) if os.path.isdir(out) else []
+    return process.returncode, process.stdout.decode(), calls, outputs
+
+
+def status_calls(calls):
+    return [call[1:] for call in calls if call[0] == "status"]
+
+
+def check_success(tmp, status):
+    returncode, output, calls, outputs = run(
+        tmp, "success", "--cluster-status", status)
+    checked = status_calls(calls)
+    yield ("success", returncode == 0 and len(outputs) == 4 and
+           max(map(len, checked), default=0) > 1,
+           "{} outputs, {} status calls about up to {} jobs".format(
+               len(outputs), len(checked), max(map(len, checked), default=0)))
+
+
+def check_failed(tmp, status):
+    returncode, output, calls, outputs = run(
+        tmp, "failed", "--cluster-status", status, FAIL="2")
+    yield ("failed", returncode != 0 and
+           "Error executing rule a on cluster" in output and
+           outputs == ["0.txt", "1.txt", "3.txt"],
+           "exit status {}, outputs {}".format(returncode, ", ".join(outputs)))
+
+
+def check_markers(tmp, status):
+    for name, args, env in [
+            ("fail", ["--cluster-status", status], {"FAKE_CLUSTER_STATUS": "fail"}),
+            ("unknown", ["--cluster-status", status], {"FAKE_CLUSTER_STATUS": "unknown"}),
+            ("none", [], {})]:
+        returncode, output, calls, outputs = run(
+            tmp, "markers-" + name, *args, **env)
+        ok = returncode == 0 and len(outputs) == 4
+        if name == "fail":
+            ok = ok and "Error checking the status of cluster jobs" in output
+        yield ("markers", ok, "status command {}: exit status {}, {} outputs, "
+               "{} status calls".format(name, returncode, len(outputs),
+                                        len(status_calls(calls))))
+
+
+def check_group(tmp, status):
+    returncode, output, calls, outputs = run(
+        tmp, "group", "--cluster-status", status, workflow=GROUP_WORKFLOW)
+    temp = os.path.join(tmp, "group", "tmp")
+    left = sorted(os.listdir(temp)) if os.path.isdir(temp) else []
+    submitted = sum(call[0] == "submit" for call in calls)
+    yield ("group", returncode == 0 and len(outputs) == 4 and not left and
+           submitted == 2,
+           "exit status {}, {} outputs of {} submissions, temp files left: "
+           "{}".format(returncode, len(outputs), submitted,
+                       ", ".join(left) or "none"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.parse_args()
+    status = os.path.join(FAKE_CLUSTER, "status.sh")
+    failed = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        for check in (check_success, check_failed, check_markers,
+                      check_group):
+            for name, ok, detail in check(tmp, status):
+                print("{:4} {:8} {}".format("ok" if ok else "FAIL", name, detail))
+                failed += not ok
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+#python-3.6
+
+"""
+Time snakemake's DAG construction on a synthetic copy of this pipeline.
+
+The generated workflow has the same shape as the Snakefile: a rule "all"
+and a chain of seven rules per sample (extract_ccs, bam2fasta, cutadapt,
+blasr, m4_index, filter_m4_output, canu). It is built in a temporary
+directory twice:
+
+    fresh -- no files exist yet, every job has to run
+    built -- all files exist and only the last quarter of the samples
+             has an updated input, so most jobs are up to date
+
+For each state the time spent in DAG construction (DAG.init, which
+includes the needrun computation) and the time of the whole dry run
+(parsing, DAG construction and scheduling) are reported:
+
+    python extra_files/dag_benchmark.py --samples 36
+    python extra_files/dag_benchmark.py --jobs 10000
+
+The snakemake package that is importable (e.g. via PYTHONPATH) is used.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+STEPS = ['extract_ccs', 'bam2fasta', 'cutadapt', 'blasr', 'm4_index',
+    'filter_m4_output', 'canu']
+
+
+def write_workflow(path, n_samples):
+    """Write Snakefile and sample input files into path, return all file names."""
+    samples = ['S{}'.format(i) for i in range(n_samples)]
+    with open(os.path.join(path, 'Snakefile'), 'w') as f:
+        f.write('SAMPLES = {!r}\n\n'.format(samples))
+        f.write('rule all:\n    input: expand("{}/{{sample}}.out", sample=SAMPLES)\n\n'.format(STEPS[-1]))
+        previous = 'bam/{sample}.bam'
+        for step in STEPS:
+            output = '{}/{{sample}}.out'.format(step)
+            f.write('rule {}:\n    input: "{}"\n    output: "{}"\n    shell: "touch {{output}}"\n\n'.format(
+                step, previous, output))
+            previous = output
+    files = []
+    for directory in ['bam'] + STEPS:
+        os.mkdir(os.path.join(path, directory))
+    for sample in samples:
+        open(os.path.join(path, 'bam', sample + '.bam'), 'w').close()
+        files.extend(os.path.join(path, step, sample + '.out') for step in STEPS)
+    return samples, files
+
+
+def dry_run(path):
+    """Return the time spent in DAG.init and the total time of a dry run."""
+    from snakemake import snakemake
+    from snakemake.dag import DAG
+
+    init = DAG.init
+    dag_time = []
+
+    def timed_init(self, *args, **kwargs):
+        start_time = time.time()
+        result = init(self, *args, **kwargs)
+        dag_time.append(time.time() - start_time)
+        return result
+
+    DAG.init = timed_init
+    try:
+        start_time = time.time()
+        success = snakemake(os.path.join(path, 'Snakefile'), workdir=path,
+            dryrun=True, quiet=True)
+        elapsed = time.time() - start_time
+    finally:
+        DAG.init = init
+    if not success:
+        raise RuntimeError('dry run failed')
+    return sum(dag_time), elapsed
+
+
+def best(runs):
+    return tuple(min(times) for times in zip(*runs))
+
+
+def bench(n_samples, repeats):
+    with tempfile.TemporaryDirectory() as path:
+        samples, files = write_workflow(path, n_samples)
+        n_jobs = len(files) + 1
+        fresh = best(dry_run(path) for _ in range(repeats))
+        now = time.time()
+        for f in files:
+            open(f, 'w').close()
+            os.utime(f, (now, now))
+        # the blasr input of the last quarter of the samples is newer
+        for sample in samples[n_samples - n_samples // 4:]:
+            f = os.path.join(path, 'cutadapt', sample + '.out')
+            os.utime(f, (now + 10, now + 10))
+        built = best(dry_run(path) for _ in range(repeats))
+    print('{} samples, {} jobs'.format(n_samples, n_jobs))
+    print('{:<8} {:>10} {:>14}'.format('', 'DAG (s)', 'dry run (s)'))
+    for name, (dag_time, elapsed) in (('fresh', fresh), ('built', built)):
+        print('{:<8} {:>10.2f} {:>14.2f}'.format(name, dag_time, elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--samples', type=int, default=36,
+        help='Number of samples (default: %(default)s)')
+    group.add_argument('--jobs', type=int,
+        help='Approximate number of jobs, overrides --samples')
+    parser.add_argument('--repeats', type=int, default=3,
+        help='Report the best of this many dry runs (default: %(default)s)')
+    args = parser.parse_args()
+    n_samples = args.samples if args.jobs is None else max(1, args.jobs // len(STEPS))
+    bench(n_samples, args.repeats)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
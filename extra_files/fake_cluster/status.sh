@@ -0,0 +1,17 @@
+#!/bin/bash
+# Stand-in for bjobs -noheader -o "jobid stat", see extra_files/cluster_check.py:
+# prints the state of the given jobs, one "<id> <state>" per line. With
+# FAKE_CLUSTER_STATUS=fail it fails like an unreachable cluster, with
+# FAKE_CLUSTER_STATUS=unknown it does not know any job.
+echo "status $*" >> "$FAKE_CLUSTER/calls"
+if [ "$FAKE_CLUSTER_STATUS" = fail ]; then
+    echo "Cannot connect to the cluster" >&2
+    exit 1
+fi
+for id in "$@"; do
+    if [ "$FAKE_CLUSTER_STATUS" != unknown ] && [ -f "$FAKE_CLUSTER/state/$id" ]; then
+        echo "$id $(cat "$FAKE_CLUSTER/state/$id")"
+    else
+        echo "Job <$id> is not found" >&2
+    fi
+done
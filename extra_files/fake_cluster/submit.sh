@@ -0,0 +1,19 @@
+#!/bin/bash
+# Stand-in for qsub or bsub, see extra_files/cluster_check.py: runs the
+# jobscript $1 in the background and prints the id of the job. The state of
+# a job (PEND, RUN, DONE or EXIT) is kept in $FAKE_CLUSTER/state/<id> and
+# every call is logged to $FAKE_CLUSTER/calls.
+state=$FAKE_CLUSTER/state
+mkdir -p "$state"
+id=$(( $(ls "$state" | wc -l) + 1000 ))
+echo PEND > "$state/$id"
+(
+    echo RUN > "$state/$id"
+    if bash "$1" > "$FAKE_CLUSTER/$id.log" 2>&1; then
+        echo DONE > "$state/$id"
+    else
+        echo EXIT > "$state/$id"
+    fi
+) > /dev/null 2>&1 &
+echo "submit $id" >> "$FAKE_CLUSTER/calls"
+echo "$id"
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+#python-3.6
+#snakemake-3.13.3, pysftp-0.2.9 (only needed for sftp:// sources)
+
+"""
+Fetch the raw BAM file of a sample listed in manifest.tsv.
+
+The manifest has one row per sample with the columns sample, source and,
+optionally, size and md5. The source is either a local path or an SFTP URL
+(sftp://user@host[:port]/path). The Snakefile runs one fetch per sample:
+
+    python extra_files/ingest.py fetch --size 123 --md5 0123abcd... \
+        sftp://user@host/path/demultiplex.1_cucum_i501--1_cucum_i701.bam bam/C1.bam
+
+SFTP sources are downloaded like snakemake's SFTP remote files, in parts
+by several connections into DEST.part. The finished parts are recorded in
+DEST.part.state together with the size and mtime of the remote file, so
+the next attempt resumes an interrupted download if the remote file did
+not change and starts over otherwise. Local sources are copied to
+DEST.part, and a complete DEST.part is not copied again. DEST is only kept
+if its size (and MD5 checksum, if given) matches. SFTP connections use
+~/.ssh/known_hosts and the default SSH keys unless --known-hosts or
+--private-key are given.
+
+The manifest can be created from a text file with one scp command
+("scp user@host:/path/file.bam C1.bam") per line, e.g. commands.txt:
+
+    python extra_files/ingest.py manifest commands.txt > manifest.tsv
+"""
+
+import argparse
+import hashlib
+import os
+import re
+import shutil
+import sys
+from urllib.parse import urlparse
+
+BLOCK_SIZE = 1024 * 1024
+
+
+def md5sum(path):
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def matches(path, size=None, md5=None):
+    if not os.path.exists(path):
+        return False
+    if size is not None and os.path.getsize(path) != size:
+        return False
+    return md5 is None or md5sum(path) == md5.lower()
+
+
+def fetch_sftp(url, dest, size=None, known_hosts=None, private_key=None):
+    """Download url to dest with snakemake's SFTP remote files, resuming an
+    interrupted download from dest.part. Return the size of the remote file."""
+    import pysftp
+    from snakemake.io import IOFile
+    from snakemake.remote import SFTP
+
+    cnopts = pysftp.CnOpts(knownhosts=known_hosts)
+    if url.port and cnopts.hostkeys is not None:
+        # pysftp only looks up the host name, known_hosts has [host]:port
+        keys = cnopts.hostkeys.lookup('[{}]:{}'.format(url.hostname, url.port))
+        for key_type, key in (keys or {}).items():
+            cnopts.hostkeys.add(url.hostname, key_type, key)
+    provider = SFTP.RemoteProvider(username=url.username,
+                                   private_key=private_key, cnopts=cnopts)
+    remote = IOFile(provider.remote('{}:{}{}'.format(
+        url.hostname, url.port or 22, url.path))).remote_object
+    try:
+        if not remote.exists():
+            raise IOError('{} does not exist'.format(url.geturl()))
+        remote_size = remote.size()
+        if size is not None and remote_size != size:
+            raise ValueError('{} has {} bytes, the manifest says {}'.format(
+                url.geturl(), remote_size, size))
+        remote.download(local_path=dest)
+    finally:
+        SFTP.connection_pool.close()
+    return remote_size
+
+
+def fetch(source, dest, size=None, md5=None, known_hosts=None, private_key=None):
+    os.makedirs(os.path.dirname(dest) or '.', exist_ok=True)
+    url = urlparse(source)
+    if url.scheme == 'sftp':
+        # dest.part is only renamed to dest when it is complete
+        size = fetch_sftp(url, dest, size, known_hosts, private_key)
+        path = dest
+    elif url.scheme in ('', 'file'):
+        path = dest + '.part'
+        if size is not None and matches(path, size, md5):
+            print('{} is already complete'.format(path), file=sys.stderr)
+        else:
+            shutil.copyfile(url.path, path)
+            size = os.path.getsize(url.path) if size is None else size
+    else:
+        raise ValueError('Unsupported source: {}'.format(source))
+    if not matches(path, size, md5):
+        # start over next time
+        os.remove(path)
+        raise ValueError('{} does not match the size or checksum in the '
+                         'manifest'.format(source))
+    if path != dest:
+        os.rename(path, dest)
+
+
+def scp_manifest(lines):
+    """Yield (sample, source) for every "scp user@host:/path dest.bam" line."""
+    scp = re.compile(r'^#?\s*scp\s+(?:(\S+)@)?([^:\s]+):(\S+)\s+(\S+)\.bam\s*$')
+    for line in lines:
+        match = scp.match(line)
+        if match:
+            user, host, path, sample = match.groups()
+            source = 'sftp://{}{}{}'.format(user + '@' if user else '', host,
+                                            path if path.startswith('/') else '/' + path)
+            yield os.path.basename(sample), source
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command')
+    fetch_parser = subparsers.add_parser('fetch', help='Fetch and verify a file')
+    fetch_parser.add_argument('--size', type=int, help='Expected size in bytes')
+    fetch_parser.add_argument('--md5', help='Expected MD5 checksum')
+    fetch_parser.add_argument('--known-hosts', help='known_hosts file for SFTP')
+    fetch_parser.add_argument('--private-key', help='Private key for SFTP')
+    fetch_parser.add_argument('source', help='Local path or sftp:// URL')
+    fetch_parser.add_argument('dest', help='Destination file')
+    manifest_parser = subparsers.add_parser('manifest',
+        help='Create a manifest from scp commands')
+    manifest_parser.add_argument('scp_commands', help='File of scp commands')
+    args = parser.parse_args()
+
+    if args.command == 'fetch':
+        try:
+            fetch(args.source, args.dest, args.size, args.md5,
+                  args.known_hosts, args.private_key)
+        except (IOError, ValueError) as e:
+            print('Error: {}'.format(e), file=sys.stderr)
+            return 1
+    elif args.command == 'manifest':
+        with open(args.scp_commands) as f:
+            print('sample\tsource\tsize\tmd5')
+            for sample, source in scp_manifest(f):
+                print('{}\t{}\t\t'.format(sample, source))
+    else:
+        parser.print_help()
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+#python-3.6
+
+"""
+Compact index of the read IDs in a BLASR m4 file.
+
+PacBio read IDs have the form movie/zmw/suffix (for CCS reads the suffix
+is "ccs"). The (movie, suffix) pairs are interned in a small table and
+each read is stored as one 64-bit integer (pair index << 32 | zmw) in a
+sorted, de-duplicated array, so membership is a dict lookup plus a binary
+search. IDs that do not have this form, or whose zmw is not written as
+the plain number (e.g. with a leading zero), are kept in an ordinary set.
+
+The index is built once per sample and can be saved next to the m4 file
+so that later stages load it without parsing the m4 file again:
+
+    python extra_files/m4index.py build blasr/C1_blasr_out.m4 blasr/C1_blasr_out.m4idx
+    python extra_files/m4index.py bench blasr/C1_blasr_out.m4
+
+The bench command reports the memory used by a plain set of IDs and by
+the index.
+"""
+
+import argparse
+import bisect
+import sys
+import time
+import tracemalloc
+from array import array
+
+MAGIC = b'M4IDX'
+VERSION = 2
+ZMW_LIMIT = 1 << 32
+
+
+def _zmw(part):
+    """Return the zmw field of an ID as an int, or None if the int does not
+    give back exactly the same bytes (or does not fit into 32 bits)."""
+    if not part.isdigit() or (part[:1] == b'0' and len(part) > 1):
+        return None
+    zmw = int(part)
+    return zmw if zmw < ZMW_LIMIT else None
+
+
+class ReadIdIndex(object):
+    """
+    Set-like, read-only collection of read IDs (as bytes).
+    """
+    def __init__(self, prefixes, keys, others):
+        """
+        prefixes -- list of (movie, suffix) pairs, the interned name parts
+        keys -- sorted array('Q') of unique pair index << 32 | zmw values
+        others -- set of IDs that are not of the form movie/zmw/suffix
+        """
+        self.prefixes = prefixes
+        self._prefix_index = {p: i for i, p in enumerate(prefixes)}
+        self.keys = keys
+        self.others = others
+
+    @classmethod
+    def from_ids(cls, ids):
+        """Build an index from an iterable of IDs (bytes)."""
+        prefixes = []
+        prefix_index = {}
+        keys = array('Q')
+        others = set()
+        last = None
+        for name in ids:
+            if name == last:
+                # Consecutive duplicates are the norm in m4 files (--bestn)
+                continue
+            last = name
+            parts = name.split(b'/', 2)
+            zmw = _zmw(parts[1]) if len(parts) == 3 else None
+            if zmw is not None:
+                prefix = (parts[0], parts[2])
+                i = prefix_index.get(prefix)
+                if i is None:
+                    i = prefix_index[prefix] = len(prefixes)
+                    prefixes.append(prefix)
+                keys.append(i << 32 | zmw)
+            else:
+                others.add(name)
+        return cls(prefixes, _sorted_unique(keys), others)
+
+    @classmethod
+    def from_m4(cls, path):
+        """Build an index of the query IDs (first column) of an m4 file."""
+        with open(path, 'rb') as f:
+            return cls.from_ids(line.split(None, 1)[0] for line in f if line.strip())
+
+    @classmethod
+    def load(cls, path):
+        """Read an index written by save()."""
+        with open(path, 'rb') as f:
+            header = f.readline().split()
+            if len(header) != 5 or header[0] != MAGIC or int(header[1]) != VERSION:
+                raise ValueError('{} is not an m4 index file of version {}'.format(
+                    path, VERSION))
+            n_prefixes, n_others, n_keys = (int(x) for x in header[2:])
+            prefixes = []
+            for _ in range(n_prefixes):
+                movie, suffix = f.readline().rstrip(b'\n').split(b'/', 1)
+                prefixes.append((movie, suffix))
+            others = set(f.readline().rstrip(b'\n') for _ in range(n_others))
+            keys = array('Q')
+            keys.fromfile(f, n_keys)
+        return cls(prefixes, keys, others)
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(b' '.join([MAGIC] + [str(x).encode() for x in
+                (VERSION, len(self.prefixes), len(self.others), len(self.keys))]) + b'\n')
+            for movie, suffix in self.prefixes:
+                f.write(movie + b'/' + suffix + b'\n')
+            for name in self.others:
+                f.write(name + b'\n')
+            self.keys.tofile(f)
+
+    def __contains__(self, name):
+        parts = name.split(b'/', 2)
+        zmw = _zmw(parts[1]) if len(parts) == 3 else None
+        if zmw is None:
+            return name in self.others
+        i = self._prefix_index.get((parts[0], parts[2]))
+        if i is None:
+            return False
+        key = i << 32 | zmw
+        j = bisect.bisect_left(self.keys, key)
+        return j < len(self.keys) and self.keys[j] == key
+
+    def __len__(self):
+        return len(self.keys) + len(self.others)
+
+    def __iter__(self):
+        for key in self.keys:
+            movie, suffix = self.prefixes[key >> 32]
+            yield b'/'.join((movie, str(key & (ZMW_LIMIT - 1)).encode(), suffix))
+        for name in self.others:
+            yield name
+
+
+def _sorted_unique(keys):
+    result = array('Q')
+    last = None
+    for key in sorted(keys):
+        if key != last:
+            result.append(key)
+            last = key
+    return result
+
+
+def load_exclusion_index(path):
+    """
+    Return a ReadIdIndex for path, which is either a saved index or an m4 file.
+    """
+    with open(path, 'rb') as f:
+        is_index = f.read(len(MAGIC)) == MAGIC
+    if is_index:
+        return ReadIdIndex.load(path)
+    return ReadIdIndex.from_m4(path)
+
+
+def _measure(build):
+    tracemalloc.start()
+    start_time = time.time()
+    result = build()
+    elapsed = time.time() - start_time
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak, elapsed
+
+
+def bench(m4_file):
+    def build_set():
+        wanted = set()
+        with open(m4_file) as f:
+            for i in f:
+                i = i.split()
+                wanted.add(str(i[0]))
+        return wanted
+
+    wanted, set_size, set_peak, set_time = _measure(build_set)
+    index, index_size, index_peak, index_time = _measure(lambda: ReadIdIndex.from_m4(m4_file))
+    assert len(wanted) == len(index)
+    print('{} unique read IDs'.format(len(index)))
+    print('{:<8} {:>14} {:>14} {:>10}'.format('', 'size (MB)', 'peak (MB)', 'build (s)'))
+    for name, size, peak, elapsed in (
+            ('set', set_size, set_peak, set_time),
+            ('index', index_size, index_peak, index_time)):
+        print('{:<8} {:>14.1f} {:>14.1f} {:>10.2f}'.format(name, size / 1e6, peak / 1e6, elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command')
+    build_parser = subparsers.add_parser('build', help='Build an index from an m4 file')
+    build_parser.add_argument('m4_file')
+    build_parser.add_argument('index_file')
+    bench_parser = subparsers.add_parser('bench', help='Compare memory use of a set and the index')
+    bench_parser.add_argument('m4_file')
+    args = parser.parse_args()
+    if args.command == 'build':
+        index = ReadIdIndex.from_m4(args.m4_file)
+        index.save(args.index_file)
+        print('Indexed {} read IDs ({} movies/suffixes)'.format(len(index), len(index.prefixes)))
+    elif args.command == 'bench':
+        bench(args.m4_file)
+    else:
+        parser.error('a command is required')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
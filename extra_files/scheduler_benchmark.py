@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+#python-3.6
+
+"""
+Micro-benchmark of snakemake's job selection (JobScheduler.job_selector).
+
+Synthetic ready jobs with random threads, memory and rewards (priority,
+temporary input count, downstream size, input size) are handed to the
+job selector of the importable snakemake package and to a copy of the
+original selector, which recomputed the effective capacities and rewards
+of all jobs for every selected job. Both have to select the same jobs.
+The current selector is timed once more on the same open jobs, as after
+a wake-up of the scheduler, when the usage and rewards are cached:
+
+    python extra_files/scheduler_benchmark.py
+    python extra_files/scheduler_benchmark.py --jobs 1000 50000 --cores 64
+"""
+
+import argparse
+import random
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+from snakemake.scheduler import JobScheduler
+
+
+class BenchmarkJob(object):
+    def __init__(self, jobid, resources, reward):
+        self.jobid = jobid
+        self.resources = resources
+        self.reward = reward
+
+
+def make_scheduler(global_resources):
+    """Return a scheduler that has just what the job selector needs."""
+    scheduler = JobScheduler.__new__(JobScheduler)
+    scheduler.workflow = SimpleNamespace(global_resources=global_resources)
+    scheduler.resources = dict(global_resources)
+    scheduler.greediness = 1
+    scheduler._lock = threading.Lock()
+    scheduler._selection_cache = dict()
+    scheduler.job_reward = lambda job: job.reward
+    return scheduler
+
+
+def make_jobs(n, seed):
+    rng = random.Random(seed)
+    jobs = []
+    for i in range(n):
+        resources = {'_cores': rng.choice([1, 1, 2, 4, 8]), '_nodes': 1,
+            'mem_mb': rng.choice([0, 1000, 4000, 16000])}
+        # few distinct values, so that there are many ties
+        reward = (rng.choice([0, 0, 0, 10]), rng.randint(0, 2),
+            rng.randint(0, 6), rng.choice([0, 1, 2]) * 1000)
+        jobs.append(BenchmarkJob(i, resources, reward))
+    return jobs
+
+
+def reference_selector(self, jobs):
+    """The original job selector, kept as a baseline."""
+    with self._lock:
+        n = len(jobs)
+        x = [0] * n
+        E = set(range(n))
+        u = [1] * n
+        a = list(map(self.job_weight, jobs))
+        c = list(map(self.job_reward, jobs))
+
+        def calc_reward():
+            return [c_j * y_j for c_j, y_j in zip(c, y)]
+
+        b = [self.resources[name] for name in self.workflow.global_resources]
+
+        while True:
+            y = [(min((min(u[j], b_i // a_j_i) if a_j_i > 0 else u[j])
+                      for b_i, a_j_i in zip(b, a[j]) if a_j_i) if j in E
+                  else 0) for j in range(n)]
+            if not any(y):
+                break
+            y = [(max(1, int(self.greediness * y_j)) if y_j > 0 else 0)
+                 for y_j in y]
+            reward = calc_reward()
+            j_sel = max(E, key=reward.__getitem__)
+            y_sel = y[j_sel]
+            x[j_sel] += y_sel
+            b = [b_i - (a_j_i * y_sel) for b_i, a_j_i in zip(b, a[j_sel])]
+            u[j_sel] -= y_sel
+            if not u[j_sel] or self.greediness == 1:
+                E.remove(j_sel)
+            if not E:
+                break
+
+        solution = [job for job, sel in zip(jobs, x) if sel]
+        for name, b_i in zip(self.workflow.global_resources, b):
+            self.resources[name] = b_i
+        return solution
+
+
+def measure(selector, global_resources, jobs, scheduler=None):
+    if scheduler is None:
+        scheduler = make_scheduler(global_resources)
+    scheduler.resources = dict(global_resources)
+    start_time = time.time()
+    selected = selector(scheduler, jobs)
+    elapsed = time.time() - start_time
+    return [job.jobid for job in selected], scheduler.resources, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--jobs', type=int, nargs='+',
+        default=[1000, 5000, 10000, 50000],
+        help='Numbers of ready jobs (default: %(default)s)')
+    parser.add_argument('--cores', type=int, default=32,
+        help='Available cores (default: %(default)s)')
+    parser.add_argument('--mem-mb', type=int, default=64000,
+        help='Available memory (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    global_resources = {'_cores': args.cores, '_nodes': sys.maxsize,
+        'mem_mb': args.mem_mb}
+    print('{:>8} {:>9} {:>14} {:>14} {:>14}'.format('jobs', 'selected',
+        'original (s)', 'current (s)', 'cached (s)'))
+    for n in args.jobs:
+        jobs = make_jobs(n, args.seed)
+        expected, expected_resources, reference_time = measure(
+            reference_selector, global_resources, jobs)
+        scheduler = make_scheduler(global_resources)
+        for i in range(2):
+            selected, resources, elapsed = measure(
+                JobScheduler.job_selector, global_resources, jobs, scheduler)
+            if selected != expected or resources != expected_resources:
+                print('{} jobs: selection differs from the original'.format(n))
+                return 1
+            if i == 0:
+                first_time = elapsed
+        print('{:>8} {:>9} {:>14.4f} {:>14.4f} {:>14.4f}'.format(n,
+            len(selected), reference_time, first_time, elapsed))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,351 @@
+#!/usr/bin/env python
+#python-3.6
+#paramiko-2.8.1
+#pysftp-0.2.9
+
+"""
+Check snakemake's SFTP remote files against a local stand-in SFTP server.
+
+The stand-in (StandInServer) is a paramiko SFTP server on 127.0.0.1 that
+serves a temporary directory, counts the SSH connections and the SFTP
+requests it gets and can fail reads after a given number of bytes. It is
+used to check that
+
+    pool    -- connections are reused by all remote files of a host
+    listing -- existence, mtime and size of the files of a directory are
+               answered by a single listing of the directory
+    resume  -- an interrupted download continues with the missing parts,
+               and starts over if the remote file changed in between
+    ingest  -- the same holds for extra_files/ingest.py fetch
+
+The snakemake package that is importable (e.g. via PYTHONPATH) is used.
+The exit status is 1 if a check fails:
+
+    python extra_files/sftp_check.py
+"""
+
+import argparse
+import os
+import socket
+import sys
+import tempfile
+import threading
+from collections import Counter
+
+import paramiko
+import pysftp
+
+from snakemake.io import IOFile
+from snakemake.remote import SFTP
+
+
+class StandInServer:
+    """An SFTP server on 127.0.0.1 that serves the directory root to any
+    user, password and key. stats counts the connections, the SFTP requests by
+    name and the bytes read, reads lists the offsets of all reads."""
+
+    def __init__(self, root):
+        self.root = root
+        self.stats = Counter()
+        self.reads = []
+        # reads fail once this many bytes were read (None: never)
+        self.fail_after = None
+        self._lock = threading.Lock()
+        self._transports = []
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind(("127.0.0.1", 0))
+        self._socket.listen(16)
+        self.port = self._socket.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.stats[name] += n
+
+    def read_allowed(self, length):
+        with self._lock:
+            return (self.fail_after is None or
+                    self.stats["bytes"] + length <= self.fail_after)
+
+    def _accept(self):
+        while True:
+            try:
+                sock, _ = self._socket.accept()
+            except OSError:
+                # closed
+                return
+            self.count("connections")
+            transport = paramiko.Transport(sock)
+            transport.add_server_key(self.host_key)
+            transport.set_subsystem_handler(
+                "sftp", paramiko.SFTPServer, StandInSFTP, self)
+            transport.start_server(server=_Authorization())
+            self._transports.append(transport)
+
+    def known_hosts(self, path):
+        """Write a known_hosts file with the key of the server to path."""
+        with open(path, "w") as f:
+            f.write("127.0.0.1 {} {}\n".format(self.host_key.get_name(),
+                                                self.host_key.get_base64()))
+
+    def close(self):
+        self._socket.close()
+        for transport in self._transports:
+            transport.close()
+
+
+class _Authorization(paramiko.ServerInterface):
+    def get_allowed_auths(self, username):
+        return "password,publickey"
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_auth_publickey(self, username, key):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+
+class _Handle(paramiko.SFTPHandle):
+    def __init__(self, server, f):
+        super().__init__()
+        self.server = server
+        self.readfile = f
+
+    def read(self, offset, length):
+        if not self.server.read_allowed(length):
+            return paramiko.SFTP_FAILURE
+        data = super().read(offset, length)
+        if isinstance(data, bytes):
+            self.server.count("bytes", len(data))
+            self.server.reads.append(offset)
+        return data
+
+
+class StandInSFTP(paramiko.SFTPServerInterface):
+    def __init__(self, transport_server, server):
+        super().__init__(transport_server)
+        self.server = server
+
+    def _path(self, path):
+        return os.path.join(self.server.root,
+                            self.canonicalize(path).lstrip("/"))
+
+    def _attributes(self, st, filename=None):
+        attr = paramiko.SFTPAttributes.from_stat(st)
+        if filename is not None:
+            attr.filename = filename
+        return attr
+
+    def list_folder(self, path):
+        self.server.count("list_folder")
+        try:
+            path = self._path(path)
+            return [self._attributes(os.lstat(os.path.join(path, name)), name)
+                    for name in os.listdir(path)]
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def stat(self, path):
+        self.server.count("stat")
+        try:
+            return self._attributes(os.stat(self._path(path)))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def lstat(self, path):
+        self.server.count("lstat")
+        try:
+            return self._attributes(os.lstat(self._path(path)))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def open(self, path, flags, attr):
+        self.server.count("open")
+        if flags & (os.O_WRONLY | os.O_RDWR):
+            return paramiko.SFTP_OP_UNSUPPORTED
+        try:
+            f = open(self._path(path), "rb")
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return _Handle(self.server, f)
+
+
+def remote_file(provider, server, path, **kwargs):
+    return IOFile(provider.remote(
+        "127.0.0.1:{}/{}".format(server.port, path), **kwargs))
+
+
+def check_pool_and_listing(server, provider):
+    os.makedirs(os.path.join(server.root, "listing"))
+    for i in range(20):
+        with open(os.path.join(server.root, "listing", "{}.bam".format(i)), "wb") as f:
+            f.write(b"x" * i)
+    before = server.stats.copy()
+    sizes = []
+    for i in range(20):
+        f = remote_file(provider, server, "listing/{}.bam".format(i))
+        if f.exists_remote:
+            f.mtime
+            sizes.append(f.size)
+    missing = remote_file(provider, server, "listing/none.bam")
+    stats = server.stats - before
+    yield ("listing", sizes == list(range(20)) and not missing.exists_remote and
+           stats["list_folder"] == 1 and not stats["stat"] and not stats["lstat"],
+           "20 files: {} listings, {} stats".format(
+               stats["list_folder"], stats["stat"] + stats["lstat"]))
+    yield ("pool", stats["connections"] <= 1,
+           "{} new connections for 20 files".format(stats["connections"]))
+
+
+def downloaded(f, data):
+    """Return whether the local file f has the given content, remove it."""
+    with open(f, "rb") as local:
+        ok = local.read() == data
+    os.remove(f)
+    return ok
+
+
+def check_download(server, provider, data):
+    before = server.stats.copy()
+    for i in range(2):
+        f = remote_file(provider, server, "data/reads.bam")
+        f.download_from_remote()
+        ok = downloaded(f, data)
+        if i == 0:
+            first = server.stats - before
+    stats = server.stats - before
+    # paramiko (before 2.10) may read a block twice if the server answers
+    # faster than it sends the requests of readv()
+    yield ("download", ok,
+           "{} bytes read for 2 downloads of {} bytes".format(
+               stats["bytes"], len(data)))
+    yield ("pool", stats["connections"] == first["connections"],
+           "{} new connections for the first download, {} for the second".format(
+               first["connections"],
+               stats["connections"] - first["connections"]))
+
+
+def interrupted_download(server, provider, after):
+    """Download data/reads.bam, failing after the given number of bytes.
+    With one stream, the parts are downloaded in order."""
+    f = remote_file(provider, server, "data/reads.bam", streams=1)
+    server.fail_after = server.stats["bytes"] + after
+    try:
+        f.download_from_remote()
+    except Exception:
+        pass
+    else:
+        raise AssertionError("the download was not interrupted")
+    finally:
+        server.fail_after = None
+    return f
+
+
+def check_resume(server, provider, path, data, chunk_size):
+    f = interrupted_download(server, provider, int(3.5 * chunk_size))
+    with open(f + ".part.state") as state:
+        # the header, then the complete parts
+        complete = set(map(int, state.read().split("\n", 1)[1].split()))
+    before = len(server.reads)
+    f.download_from_remote()
+    parts = set(offset // chunk_size for offset in server.reads[before:])
+    ok = downloaded(f, data)
+    yield ("resume", ok and complete and parts and complete.isdisjoint(parts) and
+           len(complete | parts) == -(-len(data) // chunk_size),
+           "parts {} read after parts {} were complete".format(
+               ", ".join(map(str, sorted(parts))),
+               ", ".join(map(str, sorted(complete)))))
+
+    # the remote file changes between the two attempts
+    f = interrupted_download(server, provider, int(3.5 * chunk_size))
+    changed = bytes(reversed(data))
+    with open(path, "wb") as remote:
+        remote.write(changed)
+    st = os.stat(path)
+    os.utime(path, (st.st_atime, st.st_mtime + 10))
+    before = len(server.reads)
+    f.download_from_remote()
+    parts = sorted(set(offset // chunk_size for offset in server.reads[before:]))
+    ok = downloaded(f, changed)
+    yield ("resume", ok and parts[:1] == [0],
+           "parts {} read after the remote file changed".format(
+               ", ".join(map(str, parts))))
+
+
+def check_ingest(server, path, known_hosts, private_key):
+    import ingest
+
+    source = "sftp://user@127.0.0.1:{}/data/reads.bam".format(server.port)
+    with open(path, "rb") as remote:
+        data = remote.read()
+    server.fail_after = server.stats["bytes"] + len(data) // 2
+    try:
+        ingest.fetch(source, "bam/reads.bam", known_hosts=known_hosts,
+                     private_key=private_key)
+    except Exception:
+        pass
+    finally:
+        server.fail_after = None
+    partial = os.path.exists("bam/reads.bam.part.state")
+    changed = data[len(data) // 2:] + data[:len(data) // 2]
+    with open(path, "wb") as remote:
+        remote.write(changed)
+    st = os.stat(path)
+    os.utime(path, (st.st_atime, st.st_mtime + 10))
+    ingest.fetch(source, "bam/reads.bam", size=len(changed),
+                 known_hosts=known_hosts, private_key=private_key)
+    yield ("ingest", partial and downloaded("bam/reads.bam", changed),
+           "fetch after an interrupted download of a file that changed")
+
+
+def run_checks(chunk_size=256 * 1024, parts=8):
+    failed = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        root = os.path.join(tmp, "remote")
+        os.makedirs(os.path.join(root, "data"))
+        data = os.urandom(parts * chunk_size + 1000)
+        path = os.path.join(root, "data", "reads.bam")
+        with open(path, "wb") as f:
+            f.write(data)
+
+        server = StandInServer(root)
+        known_hosts = os.path.join(tmp, "known_hosts")
+        server.known_hosts(known_hosts)
+        private_key = os.path.join(tmp, "id_rsa")
+        paramiko.RSAKey.generate(2048).write_private_key_file(private_key)
+        provider = SFTP.RemoteProvider(
+            username="user", password="password",
+            cnopts=pysftp.CnOpts(knownhosts=known_hosts),
+            streams=2, chunk_size=chunk_size)
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            checks = [check_pool_and_listing(server, provider),
+                      check_download(server, provider, data),
+                      check_resume(server, provider, path, data, chunk_size),
+                      check_ingest(server, path, known_hosts, private_key)]
+            for check in checks:
+                for name, ok, detail in check:
+                    print("{:4} {:8} {}".format("ok" if ok else "FAIL", name, detail))
+                    failed += not ok
+        finally:
+            os.chdir(cwd)
+            SFTP.connection_pool.close()
+            server.close()
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.parse_args()
+    return 1 if run_checks() else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
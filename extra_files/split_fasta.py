@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+#python-3.6
+#cutadapt-1.18
+
+"""
+Split a FASTA or FASTQ file into at most N files of complete records.
+
+The input is read in blocks that end on record boundaries (cutadapt's
+read_chunks_from_file) and the blocks are written to the output files in
+turn, so the input can be a pipe and the sizes of the files differ by at
+most one block. The order of the records is not kept. A file is only
+created when it receives its first block, so a small input gives fewer
+than N files (and an empty input a single empty file). {chunk} in the
+output pattern is replaced by the number of the file:
+
+    python extra_files/split_fasta.py -n 4 fasta/C1.ccs.fasta "chunks/C1/{chunk}.fasta"
+"""
+
+import argparse
+import os
+import sys
+
+from cutadapt.seqio import read_chunks_from_file
+
+BLOCK_SIZE = 4 * 1024**2
+
+
+def split(path, pattern, n, block_size=BLOCK_SIZE):
+    """Split the file and return the paths of the files written."""
+    paths = [pattern.format(chunk='{:03d}'.format(i)) for i in range(n)]
+    outputs = []
+    try:
+        with open(path, 'rb') as f:
+            for i, block in enumerate(read_chunks_from_file(f, block_size)):
+                if i < n:
+                    os.makedirs(os.path.dirname(paths[i]) or '.', exist_ok=True)
+                    outputs.append(open(paths[i], 'wb'))
+                outputs[i % n].write(block)
+        if not outputs:
+            os.makedirs(os.path.dirname(paths[0]) or '.', exist_ok=True)
+            outputs.append(open(paths[0], 'wb'))
+    finally:
+        for output in outputs:
+            output.close()
+    return paths[:len(outputs)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--chunks', type=int, default=1,
+        help='Maximum number of files (default: %(default)s)')
+    parser.add_argument('--block-size', type=int, default=BLOCK_SIZE // 1024**2,
+        metavar='MB', help='Size of the blocks (default: %(default)s)')
+    parser.add_argument('input', help='FASTA or FASTQ file')
+    parser.add_argument('pattern', help='Output file pattern with {chunk}')
+    args = parser.parse_args()
+    if args.chunks < 1:
+        parser.error('the number of chunks must be at least 1')
+    if args.block_size < 1:
+        parser.error('the block size must be at least 1 MB')
+    if '{chunk}' not in args.pattern:
+        parser.error('the output pattern has to contain {chunk}')
+    paths = split(args.input, args.pattern, args.chunks,
+        args.block_size * 1024**2)
+    print('{} chunks written'.format(len(paths)), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,15 +1,17 @@
 #!/bin/csh
 
-##CCS, extract fasta/fastq
+##Run snakemake, which submits every job to LSF (--lsf) with the threads,
+##memory and run time of its rule. The bam2fasta/split_reads pipes and the
+##other localrules run in this job.
 
 #BSUB -o out.%J
 #BSUB -e err.%J
 #BSUB -W 96:00
-#BSUB -n 32
-#BSUB -x
+#BSUB -n 4
+#BSUB -R "span[hosts=1]"
 #BSUB -J snakemake1
 
-conda activate /usr/local/usrapps/lmquesad/chparada/env_snakemake
-
-snakemake --use-envmodules --cores 32
+##--lsf and the other cluster options need the snakemake of env_renseq_assembly
+conda activate /path/to/the/working/directory/env_renseq_assembly
 
+snakemake --lsf --jobs 36 --local-cores 4 --latency-wait 120 --resources transfers=4